@@ -1,38 +1,133 @@
 import json
-import requests
-import aiohttp
-import asyncio
 import os
+import sys
+import inspect
+import importlib
+import threading
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, List, Dict, Generator, Union, AsyncGenerator, Any, Callable
-from loguru import logger
-from dotenv import load_dotenv
+from typing import Optional, List, Dict, Generator, Union, Any, Iterable, TYPE_CHECKING
 from functools import wraps
 import time
+from . import metrics as _metrics
+from . import hooks as _hooks
+from . import usage as _usage
+from .result import ChatResult, ChatStream
+from .cancel import CancelToken, RequestCancelled
+from .stop import StopCondition
+from .limiter import AdaptiveLimiter, get_limiter
+from .scheduler import RequestScheduler, RequestShed, Lane, Ticket, get_scheduler
+from .timeouts import (Timeouts, Deadline, ChatTimeout, ConnectTimeout, FirstTokenTimeout, IdleTimeout,
+                       TotalTimeout, RETRYABLE_TIMEOUTS, watchdog as _watchdog)
 
-# 加载.env文件
-load_dotenv()
+if TYPE_CHECKING:
+    from .cassette import Cassette
+    from .ollama import OllamaPool
+    from .compaction import ContextCompactor
 
-# 设置默认日志级别为 WARNING
-logger.remove()
-logger.add(lambda msg: print(msg, end=''), level="WARNING")
+# requests、aiohttp、loguru、dotenv 都在首次使用时才导入，
+# 保证 import ai_palette 足够快（命令行/批处理任务和 serverless 冷启动）
+
+class _LazyLogger:
+    """首次使用时才导入 loguru 并设置默认日志级别（WARNING）"""
+    _logger = None
+    _handler_id: Optional[int] = None  # set_log_level 添加的处理器
+
+    def __getattr__(self, name: str):
+        if _LazyLogger._logger is None:
+            set_log_level("WARNING")
+        return getattr(_LazyLogger._logger, name)
+
+logger = _LazyLogger()
 
 def set_log_level(level: str) -> None:
     """设置日志级别
+
+    只替换本函数添加的处理器（首次调用时同时移除 loguru 自带的 stderr 处理器），
+    宿主程序自己添加的处理器不受影响。
+
     Args:
         level: 日志级别，可选值：TRACE, DEBUG, INFO, WARNING, ERROR, CRITICAL
     """
-    logger.remove()
-    logger.add(lambda msg: print(msg, end=''), level=level.upper())
+    from loguru import logger as _loguru_logger
+    # loguru 导入时自带的处理器 id 为 0
+    previous = _LazyLogger._handler_id if _LazyLogger._handler_id is not None else 0
+    try:
+        _loguru_logger.remove(previous)
+    except ValueError:
+        pass  # 已经被宿主程序移除
+    _LazyLogger._handler_id = _loguru_logger.add(lambda msg: print(msg, end=''), level=level.upper())
+    _LazyLogger._logger = _loguru_logger
+
+_env_loaded = False
+_env_lock = threading.Lock()
+
+def load_env(path: Optional[str] = None, override: bool = False) -> bool:
+    """加载 .env 文件
+
+    创建第一个 AIChat 实例时会自动调用一次（设置环境变量 AI_PALETTE_DOTENV=0 可关闭），
+    需要在此之前读取 .env 中的配置时可以显式调用。
+
+    Args:
+        path: .env 文件路径，为空时从当前目录向上查找
+        override: 是否覆盖已存在的环境变量
+
+    Returns:
+        bool: 是否找到并加载了 .env 文件
+    """
+    global _env_loaded
+    from dotenv import load_dotenv
+    with _env_lock:
+        _env_loaded = True
+        return load_dotenv(path, override=override)
+
+def _ensure_env_loaded() -> None:
+    if not _env_loaded and os.getenv("AI_PALETTE_DOTENV", "1") != "0":
+        load_env()
+
+def _default_retry_exceptions() -> tuple:
+    """默认可重试的异常
+
+    只在发生异常时才解析；aiohttp 尚未被导入时不可能抛出它的异常，因此不为此导入 aiohttp。
+    超时中只重试连接、首字和空闲超时，总耗时超时不重试。
+    """
+    import requests
+    exceptions = (requests.RequestException,) + RETRYABLE_TIMEOUTS
+    aiohttp = sys.modules.get("aiohttp")
+    if aiohttp is not None:
+        exceptions += (aiohttp.ClientError,)
+    return exceptions
+
+def _notify_retry(args: tuple, retries: int, error: Exception) -> None:
+    """通知被装饰方法所属的实例发生了重试"""
+    on_retry = getattr(args[0], "_on_retry", None) if args else None
+    if on_retry is not None:
+        on_retry(retries, error)
 
 def retry_with_exponential_backoff(
     max_retries: int = 3,
     base_delay: float = 1,
     max_delay: float = 10,
-    exceptions: tuple = (requests.RequestException, aiohttp.ClientError)
+    exceptions: Optional[tuple] = None
 ):
-    """指数退避重试装饰器"""
+    """指数退避重试装饰器
+
+    被装饰的是实例方法时，最大重试次数取实例的 retry_count 属性（没有时为 max_retries）。
+    被装饰的是生成器（流式请求）时，只重试产出第一个元素之前的失败：此时调用方还没有
+    收到任何内容，重新发送请求是安全的；之后的失败直接抛出。
+    """
+    def retry_delay(args: tuple, retries: int, error: Exception) -> Optional[float]:
+        """第 retries 次重试的退避时间，不能重试时返回 None"""
+        if not isinstance(error, exceptions or _default_retry_exceptions()):
+            return None
+        limit = getattr(args[0], "retry_count", max_retries) if args else max_retries
+        if retries > limit:
+            return None
+        delay = min(base_delay * (2 ** (retries - 1)), max_delay)
+        logger.warning(f"重试第 {retries} 次，等待 {delay} 秒。错误：{error}")
+        _notify_retry(args, retries, error)
+        return delay
+
     def decorator(func):
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
@@ -40,13 +135,34 @@ def retry_with_exponential_backoff(
             while True:
                 try:
                     return func(*args, **kwargs)
-                except exceptions as e:
+                except Exception as e:
                     retries += 1
-                    if retries > max_retries:
-                        raise e
-                    delay = min(base_delay * (2 ** (retries - 1)), max_delay)
-                    logger.warning(f"重试第 {retries} 次，等待 {delay} 秒。错误：{e}")
-                    time.sleep(delay)
+                    delay = retry_delay(args, retries, e)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            retries = 0
+            while True:
+                started = False
+                generator = func(*args, **kwargs)
+                try:
+                    for item in generator:
+                        started = True
+                        yield item
+                    return
+                except Exception as e:
+                    if started:
+                        raise
+                    retries += 1
+                    delay = retry_delay(args, retries, e)
+                    if delay is None:
+                        raise
+                finally:
+                    generator.close()
+                time.sleep(delay)
 
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
@@ -54,17 +170,36 @@ def retry_with_exponential_backoff(
             while True:
                 try:
                     return await func(*args, **kwargs)
-                except exceptions as e:
+                except Exception as e:
                     retries += 1
-                    if retries > max_retries:
-                        raise e
-                    delay = min(base_delay * (2 ** (retries - 1)), max_delay)
-                    logger.warning(f"重试第 {retries} 次，等待 {delay} 秒。错误：{e}")
-                    await asyncio.sleep(delay)
+                    delay = retry_delay(args, retries, e)
+                    if delay is None:
+                        raise
+                import asyncio
+                await asyncio.sleep(delay)
 
-        return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
+        if inspect.iscoroutinefunction(func):
+            return async_wrapper
+        if inspect.isgeneratorfunction(func):
+            return generator_wrapper
+        return sync_wrapper
     return decorator
 
+# ERNIE access token 缓存：{(token_url, api_key, api_secret): (token, 过期时间)}
+_ernie_tokens: Dict[tuple, tuple] = {}
+_ernie_tokens_lock = threading.Lock()
+
+# token 在过期前多少秒就重新获取
+ERNIE_TOKEN_REFRESH_MARGIN = 300
+
+def _http_session(http2: bool):
+    """获取共享的 HTTP 会话（HTTP/2 或 requests 连接池）"""
+    if http2:
+        from .transport import get_http2_session
+        return get_http2_session()
+    from .transport import get_session
+    return get_session()
+
 class APIProvider(Enum):
     """API供应商枚举类"""
     OPENAI = "openai"
@@ -90,6 +225,13 @@ class APIProvider(Enum):
         }
         return urls[self]
 
+class APIError(ValueError):
+    """API 返回了错误状态码"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
 @dataclass
 class Message:
     """消息数据类"""
@@ -100,6 +242,68 @@ class Message:
         """转换为字典格式"""
         return {"role": self.role, "content": self.content}
 
+class Conversation:
+    """一次对话的状态：系统提示词和上下文消息
+
+    AIChat 只保存客户端配置，同一个 AIChat 可以被多个线程共享；每个对话使用自己的
+    Conversation，通过 ask(..., conversation=...) 传入。
+
+    summary 为压缩后的早期对话摘要（见 ContextCompactor），发送时附加在系统提示词之后。
+    """
+
+    def __init__(self, system_prompt: Optional[str] = None, messages: Optional[Iterable[Message]] = None):
+        self.system_prompt: Optional[Message] = None
+        self.messages: List[Message] = []
+        self.summary: Optional[str] = None
+        self.lock = threading.Lock()  # 后台压缩替换消息时与 add/to_dicts 互斥
+        if system_prompt:
+            self.add(system_prompt, role="system")
+        for msg in messages or []:
+            self.add(msg.content, role=msg.role)
+
+    def add(self, content: str, role: str = "system") -> None:
+        """添加消息
+
+        Args:
+            content: 消息内容
+            role: 消息角色，可以是 "system"、"user" 或 "assistant"
+
+        Raises:
+            ValueError: 当尝试添加多个系统提示词时抛出
+        """
+        if role == "system":
+            if self.system_prompt is not None:
+                raise ValueError("只能设置一个系统提示词（system prompt）")
+            self.system_prompt = Message(role="system", content=content)
+        else:
+            if role not in ["user", "assistant"]:
+                raise ValueError("角色必须是 'system'、'user' 或 'assistant'")
+            with self.lock:
+                self.messages.append(Message(role=role, content=content))
+
+    def clear(self, include_system_prompt: bool = False) -> None:
+        """清除上下文（包括摘要）
+
+        Args:
+            include_system_prompt: 是否同时清除系统提示词
+        """
+        with self.lock:
+            self.messages.clear()
+            self.summary = None
+        if include_system_prompt:
+            self.system_prompt = None
+
+    def to_dicts(self) -> List[Dict[str, str]]:
+        """系统提示词、摘要和上下文消息的字典列表"""
+        with self.lock:
+            messages = [msg.to_dict() for msg in self.messages]
+            summary = self.summary
+        system = self.system_prompt.content if self.system_prompt else None
+        if summary:
+            summary = f"以下是之前对话的摘要：\n{summary}"
+            system = f"{system}\n\n{summary}" if system else summary
+        return ([{"role": "system", "content": system}] if system else []) + messages
+
 class AIChat:
     def __init__(
         self,
@@ -111,9 +315,22 @@ class AIChat:
         enable_streaming: bool = False,
         temperature: float = 1.0,
         max_tokens: Optional[int] = None,
-        timeout: int = 30,
-        retry_count: int = 3
+        timeout: Union[int, float, Timeouts] = 30,
+        retry_count: int = 3,
+        token_url: Optional[str] = None,
+        cassette: Optional[Union["Cassette", str]] = None,
+        stream_usage: bool = True,
+        usage_tracker: Optional[_usage.UsageTracker] = None,
+        http2: Optional[bool] = None,
+        compactor: Optional["ContextCompactor"] = None,
+        limiter: Optional[Union[AdaptiveLimiter, bool]] = None,
+        scheduler: Optional[Union[RequestScheduler, bool]] = None,
+        lane: str = "interactive",
+        keep_alive: Optional[Union[str, int, float]] = None,
+        pool: Optional[Union["OllamaPool", bool]] = None
     ):
+        _ensure_env_loaded()
+        
         # 如果传入的是字符串，转换为枚举
         if isinstance(provider, str):
             provider = APIProvider(provider.lower())
@@ -126,15 +343,75 @@ class AIChat:
         self.api_key = api_key or os.getenv(f"{env_prefix}API_KEY")
         self.api_secret = api_secret or os.getenv(f"{env_prefix}API_SECRET")
         self.api_url = api_url or os.getenv(f"{env_prefix}API_URL")
+        self.token_url = token_url or os.getenv(f"{env_prefix}TOKEN_URL")  # 目前仅 ERNIE 使用
         
         self.enable_streaming = enable_streaming
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.timeout = timeout
+        self.timeouts = Timeouts.from_value(timeout)  # 整数 timeout 同时作为连接和读取超时
         self.retry_count = retry_count
-        self._system_prompt = None
-        self._context = []
-        self._last_reasoning_content = ""
+        self._conversation = Conversation()  # add_context() 使用的默认对话
+        self._local = threading.local()       # 各线程最近一次的推理内容
+        self._hooks: List[_hooks.HookCallback] = []
+        self.stream_usage = stream_usage  # 流式请求时要求 OPENAI/DASHSCOPE 在最后返回 usage
+        self.usage_tracker = usage_tracker  # 除进程内默认汇总外，额外写入的用量汇总
+        self.compactor = compactor          # 对话过长时在后台压缩较早的消息
+        
+        # 录制/回放：未指定时读取 AI_PALETTE_CASSETTE 环境变量
+        if isinstance(cassette, str):
+            from .cassette import get_cassette
+            cassette = get_cassette(cassette)
+        elif cassette is None and os.getenv("AI_PALETTE_CASSETTE"):
+            from .cassette import cassette_from_env
+            cassette = cassette_from_env()
+        self.cassette: Optional["Cassette"] = cassette
+        
+        # HTTP/2：未指定时读取 AI_PALETTE_HTTP2 环境变量，未安装 httpx[http2] 时回退到 requests
+        if http2 is None:
+            http2 = os.getenv("AI_PALETTE_HTTP2", "").lower() in ("1", "true", "yes")
+        if http2:
+            from .transport import http2_available
+            if not http2_available():
+                logger.warning("未安装 httpx[http2]，回退到 HTTP/1.1：pip install 'ai-palette[http2]'")
+                http2 = False
+        self.http2 = http2
+        
+        # 自适应并发限制：True 表示使用按供应商/模型共享的限制器，未指定时读取 AI_PALETTE_ADAPTIVE_CONCURRENCY
+        if limiter is None:
+            limiter = os.getenv("AI_PALETTE_ADAPTIVE_CONCURRENCY", "").lower() in ("1", "true", "yes")
+        if limiter is True:
+            limiter = get_limiter(provider.value, model)
+        self.limiter: Optional[AdaptiveLimiter] = limiter or None
+        
+        # 请求调度：True 表示使用进程内共享的调度器，未指定时读取 AI_PALETTE_SCHEDULER；租户为 API key
+        if scheduler is None:
+            scheduler = os.getenv("AI_PALETTE_SCHEDULER", "").lower() in ("1", "true", "yes")
+        if scheduler is True:
+            scheduler = get_scheduler()
+        self.scheduler: Optional[RequestScheduler] = scheduler or None
+        if self.scheduler is not None and lane not in self.scheduler.lanes:
+            raise ValueError(f"调度器中没有通道: {lane}")
+        self.lane = lane
+        
+        # Ollama 模型在内存中保留的时间（如 "30m"，-1 表示一直保留），未指定时读取 OLLAMA_KEEP_ALIVE 环境变量
+        if keep_alive is None:
+            keep_alive = os.getenv("OLLAMA_KEEP_ALIVE") or None
+        if keep_alive is not None:
+            from .ollama import normalize_keep_alive
+            keep_alive = normalize_keep_alive(keep_alive)
+        self.keep_alive = keep_alive
+        
+        # 多台 Ollama 服务的负载均衡：True 表示使用按 OLLAMA_HOSTS 创建的共享服务池，未指定时设置了 OLLAMA_HOSTS 即启用
+        if provider == APIProvider.OLLAMA and (pool is None or pool is True):
+            from .ollama import get_pool
+            shared = get_pool()
+            if pool is True and shared is None:
+                raise ValueError("pool=True 需要设置 OLLAMA_HOSTS 环境变量")
+            pool = shared
+        elif pool and provider != APIProvider.OLLAMA:
+            raise ValueError("pool 仅支持 Ollama")
+        self.pool: Optional["OllamaPool"] = pool or None
         
         # 验证配置
         self._validate_config()
@@ -144,12 +421,15 @@ class AIChat:
         if not self.model:
             raise ValueError("Model name is required")
             
+        # 回放模式不访问网络，不需要密钥
+        replaying = self.cassette is not None and self.cassette.replaying
+            
         # 特定供应商的验证
-        if self.provider == APIProvider.ERNIE and not self.api_secret:
+        if self.provider == APIProvider.ERNIE and not self.api_secret and not replaying:
             raise ValueError("API secret is required for ERNIE")
             
         # Ollama 不需要 API key
-        if self.provider != APIProvider.OLLAMA and not self.api_key:
+        if self.provider != APIProvider.OLLAMA and not self.api_key and not replaying:
             raise ValueError("API key is required")
 
     def _get_api_url(self) -> str:
@@ -173,14 +453,34 @@ class AIChat:
         return headers
 
     def _get_ernie_access_token(self) -> str:
-        """获取文心一言的access token"""
-        url = f'https://aip.baidubce.com/oauth/2.0/token?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.api_secret}'
-        response = requests.post(url)
-        return response.json().get('access_token', '')
+        """获取文心一言的access token
+
+        token 按 token_url 和密钥在进程内缓存，到期前 ERNIE_TOKEN_REFRESH_MARGIN 秒重新获取。
+        """
+        base_url = self.token_url or 'https://aip.baidubce.com/oauth/2.0/token'
+        key = (base_url, self.api_key, self.api_secret)
+        cached = _ernie_tokens.get(key)
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+        with _ernie_tokens_lock:
+            # 并发请求只获取一次
+            cached = _ernie_tokens.get(key)
+            if cached is not None and cached[1] > time.monotonic():
+                return cached[0]
+            url = f'{base_url}?grant_type=client_credentials&client_id={self.api_key}&client_secret={self.api_secret}'
+            response = self._session().post(url, timeout=Deadline(self.timeouts).request_timeout())
+            token_data = response.json()
+            token = token_data.get('access_token', '')
+            if token and token_data.get('expires_in'):
+                expires_at = time.monotonic() + token_data['expires_in'] - ERNIE_TOKEN_REFRESH_MARGIN
+                _ernie_tokens[key] = (token, expires_at)
+            return token
 
     def add_context(self, content: str, role: str = "system") -> None:
         """添加上下文消息
         
+        添加到实例的默认对话中；多个线程共享同一个实例时，请为每个对话使用单独的 Conversation。
+        
         Args:
             content: 消息内容
             role: 消息角色，可以是 "system"、"user" 或 "assistant"
@@ -188,14 +488,7 @@ class AIChat:
         Raises:
             ValueError: 当尝试添加多个系统提示词时抛出
         """
-        if role == "system":
-            if self._system_prompt is not None:
-                raise ValueError("只能设置一个系统提示词（system prompt）")
-            self._system_prompt = Message(role="system", content=content)
-        else:
-            if role not in ["user", "assistant"]:
-                raise ValueError("角色必须是 'system'、'user' 或 'assistant'")
-            self._context.append(Message(role=role, content=content))
+        self._conversation.add(content, role)
 
     def clear_context(self, include_system_prompt: bool = False) -> None:
         """清除上下文
@@ -203,20 +496,13 @@ class AIChat:
         Args:
             include_system_prompt: 是否同时清除系统提示词
         """
-        self._context.clear()
-        if include_system_prompt:
-            self._system_prompt = None
+        self._conversation.clear(include_system_prompt)
 
-    def _prepare_messages(self, prompt: str, messages: Optional[List[Message]] = None) -> List[Dict[str, str]]:
+    def _prepare_messages(self, prompt: str, messages: Optional[List[Message]] = None,
+                          conversation: Optional[Conversation] = None) -> List[Dict[str, str]]:
         """准备发送给AI的消息列表"""
-        final_messages = []
-        
-        # 添加系统提示词（如果存在）
-        if self._system_prompt:
-            final_messages.append(self._system_prompt.to_dict())
-        
-        # 添加上下文消息
-        final_messages.extend([msg.to_dict() for msg in self._context])
+        # 添加系统提示词和上下文消息
+        final_messages = (conversation or self._conversation).to_dicts()
         
         # 添加额外的消息历史（如果提供）
         if messages:
@@ -240,7 +526,7 @@ class AIChat:
                 data["max_tokens"] = self.max_tokens
             return data
         elif self.provider == APIProvider.OLLAMA:
-            return {
+            data = {
                 "model": self.model,
                 "messages": [
                     {
@@ -254,6 +540,9 @@ class AIChat:
                     "temperature": self.temperature
                 } if self.temperature != 1.0 else {}
             }
+            if self.keep_alive is not None:
+                data["keep_alive"] = self.keep_alive
+            return data
         elif self.provider in [APIProvider.SILICONFLOW, APIProvider.DEEPSEEK]:
             data = {
                 "model": self.model,
@@ -275,36 +564,329 @@ class AIChat:
             }
             if self.max_tokens:
                 data["max_tokens"] = self.max_tokens
+            if stream and self.stream_usage and self.provider in [APIProvider.OPENAI, APIProvider.DASHSCOPE]:
+                data["stream_options"] = {"include_usage": True}
             return data
 
+    def _metric_labels(self) -> tuple:
+        """指标标签：(provider, model)"""
+        return (self.provider.value, self.model)
+
+    def add_hook(self, callback: _hooks.HookCallback) -> None:
+        """注册请求生命周期钩子（只对当前实例生效）
+
+        Args:
+            callback: 接收 HookEvent 的回调函数，事件类型见 ai_palette.hooks
+        """
+        if callback not in self._hooks:
+            self._hooks.append(callback)
+
+    def remove_hook(self, callback: _hooks.HookCallback) -> None:
+        """移除请求生命周期钩子"""
+        if callback in self._hooks:
+            self._hooks.remove(callback)
+
+    def _emit(self, name: str, request_id: int, size: Optional[int] = None, **data: Any) -> None:
+        """触发钩子事件（调用方应先检查是否注册了钩子）"""
+        event = _hooks.HookEvent(
+            name=name,
+            timestamp_ns=time.perf_counter_ns(),
+            provider=self.provider.value,
+            model=self.model,
+            request_id=request_id,
+            size=size,
+            data=data
+        )
+        for callback in _hooks.global_hooks + self._hooks:
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"钩子 {callback} 处理 {name} 事件出错: {str(e)}")
+
+    def _new_trace(self) -> Dict[str, Any]:
+        """创建单次请求的追踪状态，未注册钩子时 request_id 为 0"""
+        request_id = 0
+        if self._hooks or _hooks.global_hooks:
+            request_id = _hooks.next_request_id()
+            _hooks.set_current_request(request_id)
+        return {"request_id": request_id, "response_bytes": 0, "meta": {}}
+
+    def _encode_body(self, data: Dict, trace: Dict[str, Any]) -> bytes:
+        """序列化请求体（只序列化一次，同时记录大小）"""
+        body = json.dumps(data, allow_nan=False).encode("utf-8")
+        _metrics.registry.observe("ai_palette_request_bytes", self._metric_labels(), len(body))
+        if trace["request_id"]:
+            self._emit(_hooks.REQUEST_BUILT, trace["request_id"], len(body), stream=bool(data.get("stream")))
+        return body
+
+    def _session(self):
+        """获取发送请求的会话：录制/回放时使用 cassette 的会话，否则使用共享连接池"""
+        if self.cassette is not None:
+            return self.cassette.session()
+        return _http_session(self.http2)
+
+    def warmup(self) -> None:
+        """预热连接：解析 DNS 并建立到供应商的 TCP/TLS 连接，ERNIE 同时预先获取 access token
+
+        之后的第一个请求可以直接复用连接池中的连接。使用 cassette 时不访问网络，直接返回。
+
+        Raises:
+            requests.RequestException: 无法连接到供应商
+        """
+        if self.cassette is not None:
+            return
+        if self.provider == APIProvider.ERNIE:
+            self._get_ernie_access_token()
+        from .transport import preconnect
+        preconnect(self._session(), self._get_api_url(), Deadline(self.timeouts).request_timeout())
+
+    def preload(self) -> float:
+        """把 Ollama 模型提前加载到内存（使用实例的 keep_alive），之后的第一个请求没有冷启动
+
+        使用服务池时在所有可用的服务上并发加载；使用 cassette 时不访问网络，直接返回 0。
+
+        Returns:
+            float: 加载耗时（秒），模型已经加载时很短；使用服务池时为最长的耗时
+
+        Raises:
+            ValueError: 不是 Ollama
+            requests.RequestException: 无法连接或加载失败（例如模型不存在）
+        """
+        if self.provider != APIProvider.OLLAMA:
+            raise ValueError(f"preload 仅支持 Ollama，当前供应商为 {self.provider.value}")
+        if self.cassette is not None:
+            return 0.0
+        timeout = self.timeouts.total or 300.0
+        if self.pool is not None:
+            return max(self.pool.preload(self.model, self.keep_alive, timeout).values(), default=0.0)
+        from .ollama import preload
+        return preload(self.model, self._get_api_url(), self.keep_alive, timeout)
+
+    def _post(self, url: str, headers: Dict[str, str], body: bytes, stream: bool, trace: Dict[str, Any],
+              deadline: Deadline):
+        """发送 HTTP 请求（共享连接池），并触发连接和响应头事件
+
+        Raises:
+            ChatTimeout: 建立连接或等待响应超时
+        """
+        import requests
+        from .transport import trace_connections
+        request_id = trace["request_id"]
+
+        def on_connection(host: str, reused: bool) -> None:
+            self._emit(_hooks.CONNECTION_ACQUIRED, request_id, host=host, reused=reused)
+
+        try:
+            with trace_connections(on_connection if request_id else None):
+                response = self._session().post(url, headers=headers, data=body, stream=stream,
+                                                timeout=deadline.request_timeout())
+        except requests.exceptions.ConnectTimeout as e:
+            raise deadline.connect_error() from e
+        except requests.exceptions.Timeout as e:
+            raise deadline.read_error() from e
+        provider_request_id = response.headers.get("X-Request-Id")
+        if provider_request_id:
+            trace["meta"]["request_id"] = provider_request_id
+        if request_id:
+            length = response.headers.get("Content-Length")
+            self._emit(_hooks.RESPONSE_HEADERS, request_id, int(length) if length else None,
+                       status_code=response.status_code,
+                       http_version=getattr(response, "http_version", None))
+        return response
+
+    def _record_request(self, stream: bool, start: float, error: Optional[BaseException] = None) -> None:
+        """记录请求耗时和结果"""
+        registry = _metrics.registry
+        if not registry.enabled:
+            return
+        labels = self._metric_labels()
+        stream_label = "true" if stream else "false"
+        registry.observe("ai_palette_request_duration_seconds", labels + (stream_label,), time.perf_counter() - start)
+        registry.inc("ai_palette_requests_total", labels + (stream_label, "error" if error else "ok"))
+        if error is not None:
+            registry.inc("ai_palette_errors_total", labels + (_metrics.error_class(error),))
+
+    def _on_retry(self, retries: int, error: Exception) -> None:
+        """重试回调"""
+        _metrics.registry.inc("ai_palette_retries_total", self._metric_labels())
+        if self._hooks or _hooks.global_hooks:
+            self._emit(_hooks.RETRY, _hooks.current_request() or 0, attempt=retries, error=error)
+
+    def _finish_trace(self, trace: Dict[str, Any], start: float, error: Optional[BaseException] = None) -> None:
+        """触发完成或失败事件"""
+        if not trace["request_id"]:
+            return
+        duration = time.perf_counter() - start
+        if error is None:
+            self._emit(_hooks.COMPLETE, trace["request_id"], trace["response_bytes"], duration=duration)
+        else:
+            self._emit(_hooks.ERROR, trace["request_id"], trace["response_bytes"], duration=duration,
+                       error=error, error_class=_metrics.error_class(error))
+
+    def _build_result(self, content: str, reasoning_content: str, meta: Dict[str, Any],
+                      latency: float, ttft: Optional[float] = None) -> ChatResult:
+        """构造 ChatResult，并把用量写入汇总"""
+        self._local.reasoning_content = reasoning_content
+        usage = _usage.Usage.from_dict(meta.get("usage"))
+        result = ChatResult(
+            content,
+            reasoning_content=reasoning_content,
+            usage=usage,
+            finish_reason=meta.get("finish_reason"),
+            latency=latency,
+            ttft=ttft,
+            request_id=meta.get("request_id") or meta.get("id"),
+            provider=self.provider.value,
+            model=self.model
+        )
+        _usage.tracker.record(self.provider.value, self.model, usage)
+        if self.provider == APIProvider.OLLAMA and self.pool is None and self.cassette is None:
+            from .ollama import tracker, ollama_host
+            tracker.mark_loaded(ollama_host(self._get_api_url()), self.model, self.keep_alive)
+        if self.usage_tracker is not None:
+            self.usage_tracker.record(self.provider.value, self.model, usage)
+        if usage is not None and _metrics.registry.enabled:
+            labels = self._metric_labels()
+            _metrics.registry.inc("ai_palette_tokens_total", labels + ("prompt",), usage.prompt_tokens)
+            _metrics.registry.inc("ai_palette_tokens_total", labels + ("completion",), usage.completion_tokens)
+            _metrics.registry.inc("ai_palette_tokens_total", labels + ("cached",), usage.cached_tokens)
+        return result
+
+    def acquire_ticket(self) -> Optional[Ticket]:
+        """提前在调度器中排队取得发送名额，未启用调度器时返回 None
+
+        流式请求要到开始读取时才排队。Web 服务在返回 SSE 响应之前调用它，排队超时可以作为 503
+        返回；取得的名额通过 ask(..., ticket=...) 交给请求，请求结束时归还。流没有开始读取就被
+        close() 时同样归还。
+
+        Raises:
+            RequestShed: 排队超过截止时间
+        """
+        if self.scheduler is None:
+            return None
+        return self.scheduler.acquire(self.lane, self.api_key)
+
+    def release_ticket(self, ticket: Optional[Ticket]) -> None:
+        """归还 acquire_ticket() 取得但没有使用的名额（已经归还时不起作用）"""
+        if ticket is not None and self.scheduler is not None:
+            self.scheduler.release(ticket)
+
+    def _acquire_slot(self, ticket: Optional[Ticket] = None) -> Optional[tuple]:
+        """依次在调度器和并发限制器中等待发送名额，再从 Ollama 服务池中选择服务，都未启用时返回 None
+
+        录制/回放时不使用服务池（录制的请求地址需要固定）。
+
+        Args:
+            ticket: acquire_ticket() 提前取得的调度名额；已经归还（例如重试）时重新排队
+
+        Raises:
+            RequestShed: 在调度器中排队超过截止时间
+        """
+        pool = self.pool if self.cassette is None else None
+        if self.scheduler is None and self.limiter is None and pool is None:
+            return None
+        if ticket is None or not ticket.granted:
+            ticket = self.scheduler.acquire(self.lane, self.api_key) if self.scheduler is not None else None
+        try:
+            permit = self.limiter.acquire() if self.limiter is not None else None
+        except BaseException:
+            if ticket is not None:
+                self.scheduler.release(ticket)
+            raise
+        host = pool.acquire(self.model) if pool is not None else None
+        return ticket, permit, host
+
+    def _slot_url(self, slot: Optional[tuple]) -> str:
+        """本次请求的接口地址：使用服务池时为选中的服务"""
+        if slot is not None and slot[2] is not None:
+            return f"{slot[2]}/api/chat"
+        return self._get_api_url()
+
+    def _release_slot(self, slot: Optional[tuple], error: Optional[BaseException] = None, sample: bool = True,
+                      latency: Optional[float] = None) -> None:
+        """归还发送名额，并把结果反馈给并发限制器和 Ollama 服务池"""
+        if slot is None:
+            return
+        ticket, permit, host = slot
+        if host is not None:
+            self.pool.release(host, self.model, error, self.keep_alive)
+        if permit is not None:
+            self.limiter.release(permit, error, sample, latency)
+        if ticket is not None:
+            self.scheduler.release(ticket)
+
     @retry_with_exponential_backoff()
-    def _normal_request(self, data: Dict) -> str:
-        """发送普通请求"""
+    def _normal_request(self, data: Dict, cancel: Optional[CancelToken] = None,
+                        started: Optional[float] = None, ticket: Optional[Ticket] = None) -> ChatResult:
+        """发送普通请求（取消只在发送前和重试前检查，已发出的普通请求会等待响应）"""
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        slot = self._acquire_slot(ticket)
+        start = time.perf_counter()
+        trace = self._new_trace()
+        trace["url"] = self._slot_url(slot)
         try:
-            response = requests.post(
-                url=self._get_api_url(),
-                headers=self._get_headers(),
-                json=data,
-                timeout=self.timeout
-            )
+            content = self._send_normal_request(data, trace, Deadline(self.timeouts, started))
+        except Exception as e:
+            self._release_slot(slot, e)
+            self._record_request(False, start, e)
+            self._finish_trace(trace, start, e)
+            raise
+        self._release_slot(slot)
+        self._record_request(False, start)
+        self._finish_trace(trace, start)
+        return self._build_result(content, trace["meta"].get("reasoning_content", ""), trace["meta"],
+                                  time.perf_counter() - start)
+
+    def _read_body(self, response, deadline: Deadline) -> bytes:
+        """读取完整的响应体
+
+        socket 超时只限制每次读取，响应体断断续续到达时由看门狗按 first_token 和 total
+        限制整体耗时，到期时断开连接。
+        """
+        from .transport import abort_response, is_read_timeout
+        unwatch = _watchdog.watch(deadline, lambda: abort_response(response)) if self.timeouts.watched else None
+        try:
+            content = response.content
+            deadline.check()
+            return content
+        except ChatTimeout:
+            raise
+        except Exception as e:
+            if deadline.expired is not None:
+                raise deadline.expired from e
+            if is_read_timeout(e):
+                raise deadline.read_error() from e
+            raise
+        finally:
+            if unwatch is not None:
+                unwatch()
+            response.close()
+
+    def _send_normal_request(self, data: Dict, trace: Dict[str, Any], deadline: Optional[Deadline] = None) -> str:
+        """发送普通请求并解析响应"""
+        import requests
+        if deadline is None:
+            deadline = Deadline(self.timeouts)
+        try:
+            deadline.check()
+            url = trace.get("url") or self._get_api_url()
+            headers = self._get_headers()
+            # 以流式读取响应体，使 first_token 和 total 限制完整响应的到达时间
+            response = self._post(url, headers, self._encode_body(data, trace), True, trace, deadline)
+            trace["response_bytes"] = len(self._read_body(response, deadline))
+            _metrics.registry.observe("ai_palette_response_bytes", self._metric_labels(), trace["response_bytes"])
             
             # 记录请求和响应信息
-            logger.debug(f"Request URL: {self._get_api_url()}")
-            logger.debug(f"Request Headers: {self._get_headers()}")
+            logger.debug(f"Request URL: {url}")
+            logger.debug(f"Request Headers: {headers}")
             logger.debug(f"Request Data: {json.dumps(data, ensure_ascii=False)}")
             logger.debug(f"Response Status: {response.status_code}")
             logger.debug(f"Response Headers: {response.headers}")
             
             # 检查响应状态码
             if response.status_code != 200:
-                error_msg = f"API请求失败: HTTP {response.status_code}"
-                try:
-                    error_detail = response.json()
-                    error_msg += f" - {error_detail.get('error', {}).get('message', '')}"
-                except:
-                    error_msg += f" - {response.text}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
+                raise self._api_error(response)
             
             # 检查响应内容是否为空
             if not response.text.strip():
@@ -328,9 +910,14 @@ class AIChat:
                 logger.error(error_msg)
                 raise ValueError(error_msg)
             
-            elif self.provider == APIProvider.OLLAMA:
+            self._collect_meta(trace["meta"], response_json)
+            
+            if self.provider == APIProvider.OLLAMA:
                 if "message" not in response_json:
                     raise ValueError("OLLAMA响应缺少 'message' 字段")
+                trace["meta"]["usage"] = {key: response_json[key] for key in ("prompt_eval_count", "eval_count") if key in response_json}
+                if response_json.get("done_reason"):
+                    trace["meta"]["finish_reason"] = response_json["done_reason"]
                 message = response_json["message"]
                 if not isinstance(message, dict):
                     raise ValueError(f"OLLAMA响应message格式错误: {message}")
@@ -356,7 +943,7 @@ class AIChat:
                 if not isinstance(message, dict):
                     raise ValueError(f"响应message格式错误: {message}")
                 
-                self._last_reasoning_content = message.get("reasoning_content", "")
+                trace["meta"]["reasoning_content"] = message.get("reasoning_content", "")
                 content = message.get("content")
                 if content is None:
                     raise ValueError("响应缺少content字段")
@@ -369,8 +956,8 @@ class AIChat:
                 raise ValueError("'choices' 数组为空")
             return response_json["choices"][0]["message"]["content"]
             
-        except requests.exceptions.Timeout:
-            error_msg = f"请求超时(超过{self.timeout}秒)"
+        except ChatTimeout as e:
+            error_msg = f"请求超时: {str(e)}"
             logger.error(error_msg)
             raise
         except requests.exceptions.RequestException as e:
@@ -382,133 +969,408 @@ class AIChat:
             logger.error(error_msg)
             raise
 
+    @staticmethod
+    def _api_error(response) -> APIError:
+        """根据错误状态码的响应构造 APIError（普通和流式请求一致，均不重试）"""
+        error_msg = f"API请求失败: HTTP {response.status_code}"
+        try:
+            error_detail = response.json()
+            error_msg += f" - {error_detail.get('error', {}).get('message', '')}"
+        except:
+            error_msg += f" - {response.text}"
+        logger.error(error_msg)
+        return APIError(error_msg, status_code=response.status_code)
+
     @retry_with_exponential_backoff()
-    def _stream_request(self, data: Dict) -> Generator[Dict[str, str], None, None]:
+    def _stream_request(self, data: Dict, meta: Optional[Dict[str, Any]] = None,
+                        cancel: Optional[CancelToken] = None, started: Optional[float] = None,
+                        ticket: Optional[Ticket] = None) -> Generator[Dict[str, str], None, None]:
         """发送流式请求"""
-        response = requests.post(
-            self._get_api_url(),
-            headers=self._get_headers(),
-            json=data,
-            stream=True,
-            timeout=self.timeout
-        )
-        response.raise_for_status()
-        
+        slot = self._acquire_slot(ticket)
+        limiter_error: Optional[BaseException] = None
+        sample = True
+        start = time.perf_counter()
+        first_chunk_at = None
+        chunks = 0
+        trace = self._new_trace()
+        trace["url"] = self._slot_url(slot)
+        if meta is not None:
+            trace["meta"] = meta
+        request_id = trace["request_id"]
+        try:
+            for chunk in self._send_stream_request(data, trace, cancel, Deadline(self.timeouts, started)):
+                if first_chunk_at is None:
+                    first_chunk_at = time.perf_counter()
+                    _metrics.registry.observe("ai_palette_time_to_first_token_seconds",
+                                              self._metric_labels(), first_chunk_at - start)
+                    if request_id:
+                        self._emit(_hooks.FIRST_CHUNK, request_id, len(chunk["content"]), type=chunk["type"])
+                if request_id:
+                    self._emit(_hooks.CHUNK, request_id, len(chunk["content"]), type=chunk["type"])
+                chunks += 1
+                yield chunk
+        except (GeneratorExit, RequestCancelled):
+            # 调用方提前结束读取或取消了请求
+            sample = False
+            self._record_request(True, start)
+            self._finish_trace(trace, start)
+            raise
+        except Exception as e:
+            limiter_error = e
+            self._record_request(True, start, e)
+            self._finish_trace(trace, start, e)
+            raise
+        finally:
+            # 流式请求的总耗时取决于输出长度，按首字耗时判断延迟是否异常
+            self._release_slot(slot, limiter_error, sample,
+                               latency=first_chunk_at - start if first_chunk_at is not None else None)
+            labels = self._metric_labels()
+            _metrics.registry.observe("ai_palette_response_bytes", labels, trace["response_bytes"])
+            if first_chunk_at is not None and chunks > 1:
+                elapsed = time.perf_counter() - first_chunk_at
+                if elapsed > 0:
+                    _metrics.registry.observe("ai_palette_stream_chunks_per_second", labels, (chunks - 1) / elapsed)
+                    # 片段数不等于 token 数，只有供应商返回了用量时才记录 token 速度
+                    usage = _usage.Usage.from_dict(trace["meta"].get("usage"))
+                    if usage is not None and usage.completion_tokens > 0:
+                        _metrics.registry.observe("ai_palette_stream_tokens_per_second", labels,
+                                                  usage.completion_tokens / elapsed)
+        self._record_request(True, start)
+        self._finish_trace(trace, start)
+
+    def _iter_lines(self, response, trace: Dict[str, Any]) -> Generator[bytes, None, None]:
+        """逐行读取响应并累计接收字节数"""
+        for line in response.iter_lines():
+            trace["response_bytes"] += len(line)
+            yield line
+
+    def _send_stream_request(self, data: Dict, trace: Dict[str, Any], cancel: Optional[CancelToken] = None,
+                             deadline: Optional[Deadline] = None) -> Generator[Dict[str, str], None, None]:
+        """发送流式请求并解析响应
+
+        取消或超时时在调用 cancel() 的线程（或看门狗线程）中直接关闭响应，阻塞在读取上的线程
+        随即返回，上游连接不会放回连接池。
+        """
+        from .transport import abort_response, set_read_timeout, is_read_timeout
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        if deadline is None:
+            deadline = Deadline(self.timeouts)
+        deadline.check()
+        response = self._post(trace.get("url") or self._get_api_url(), self._get_headers(),
+                              self._encode_body(data, trace), True, trace, deadline)
+        # 收到响应头之后，首字、空闲和总耗时由看门狗检查，socket 只保留 read 超时
+        set_read_timeout(response, self.timeouts.read)
+        cleanups = []
+        if cancel is not None:
+            cleanups.append(cancel.on_cancel(lambda: abort_response(response)))
+        if self.timeouts.watched:
+            cleanups.append(_watchdog.watch(deadline, lambda: abort_response(response)))
+        try:
+            if response.status_code != 200:
+                raise self._api_error(response)
+            for chunk in self._parse_stream(self._iter_lines(response, trace), trace["meta"]):
+                # 调用方处理片段的时间不算作上游的空闲时间
+                deadline.touch()
+                yield chunk
+                deadline.resume()
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            deadline.check()
+        except Exception as e:
+            # 连接被关闭导致的读取错误统一报告为取消或对应的超时
+            if cancel is not None and cancel.cancelled and not isinstance(e, RequestCancelled):
+                raise RequestCancelled("请求已取消") from e
+            if deadline.expired is not None and e is not deadline.expired:
+                raise deadline.expired from e
+            if is_read_timeout(e):
+                error_class = FirstTokenTimeout if deadline.last_chunk is None else IdleTimeout
+                raise error_class(self.timeouts.read) from e
+            raise
+        finally:
+            for cleanup in cleanups:
+                cleanup()
+            response.close()
+
+    def _parse_stream(self, lines: Iterable[bytes], meta: Optional[Dict[str, Any]] = None) -> Generator[Dict[str, str], None, None]:
+        """按供应商格式解析流式响应的原始行
+
+        Args:
+            lines: 响应的原始行（bytes），可以来自网络，也可以来自录制的数据
+            meta: 可选，用于收集 usage、finish_reason 和响应 id 的字典
+
+        Returns:
+            Generator[Dict[str, str], None, None]: 与 ask(stream=True) 相同格式的字典生成器
+        """
+        if meta is None:
+            meta = {}
         if self.provider == APIProvider.DASHSCOPE:
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        if line.strip() == 'data: [DONE]':
-                            break
-                        try:
-                            json_data = json.loads(line[6:])
-                            if "choices" in json_data and json_data["choices"]:
-                                choice = json_data["choices"][0]
-                                delta = choice.get("delta", {})
-                                
-                                # 处理第一条消息（role）
-                                if "role" in delta:
-                                    continue
-                                    
-                                # 处理内容
-                                content = delta.get("content", "")
-                                if content:
-                                    yield {"type": "content", "content": content}
-                                    
-                                # 处理结束标志
-                                if choice.get("finish_reason") == "stop":
-                                    break
-                                    
-                        except (json.JSONDecodeError, KeyError, TypeError) as e:
-                            logger.error(f"处理DASHSCOPE响应时出错: {str(e)}\n响应内容: {line}")
-                            continue
-                            
+            return self._parse_dashscope_stream(lines, meta)
         elif self.provider == APIProvider.OLLAMA:
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
+            return self._parse_ollama_stream(lines, meta)
+        elif self.provider in [APIProvider.DEEPSEEK, APIProvider.SILICONFLOW]:
+            return self._parse_deepseek_stream(lines, meta)
+        return self._parse_openai_stream(lines, meta)
+
+    @staticmethod
+    def _collect_meta(meta: Dict[str, Any], json_data: Dict) -> None:
+        """从响应（或流式片段）中收集 usage、finish_reason 和响应 id"""
+        if "id" not in meta:
+            response_id = json_data.get("id") or json_data.get("request_id")
+            if response_id:
+                meta["id"] = response_id
+        usage = json_data.get("usage")
+        if usage:
+            meta["usage"] = usage
+        choices = json_data.get("choices")
+        if choices and isinstance(choices[0], dict) and choices[0].get("finish_reason"):
+            meta["finish_reason"] = choices[0]["finish_reason"]
+
+    def _parse_dashscope_stream(self, lines: Iterable[bytes], meta: Dict[str, Any]) -> Generator[Dict[str, str], None, None]:
+        """解析 DASHSCOPE 的 SSE 响应"""
+        for line in lines:
+            if line:
+                line = line.decode('utf-8')
+                if line.startswith('data: '):
+                    if line.strip() == 'data: [DONE]':
+                        break
                     try:
-                        json_data = json.loads(line)
-                        if json_data.get("done", False):
-                            break
-                        content = json_data.get("message", {}).get("content", "")
-                        if content:
-                            yield {"type": "content", "content": content}
+                        json_data = json.loads(line[6:])
+                        self._collect_meta(meta, json_data)
+                        if "choices" in json_data and json_data["choices"]:
+                            choice = json_data["choices"][0]
+                            delta = choice.get("delta", {})
+                            
+                            # 处理第一条消息（role）
+                            if "role" in delta:
+                                continue
+                                
+                            # 处理内容
+                            content = delta.get("content", "")
+                            if content:
+                                yield {"type": "content", "content": content}
+                                
+                            # 处理结束标志（请求了 usage 时，usage 在结束片段之后单独返回）
+                            if choice.get("finish_reason") == "stop" and not self.stream_usage:
+                                break
+                                
                     except (json.JSONDecodeError, KeyError, TypeError) as e:
-                        logger.error(f"处理OLLAMA响应时出错: {str(e)}\n响应内容: {line}")
+                        logger.error(f"处理DASHSCOPE响应时出错: {str(e)}\n响应内容: {line}")
                         continue
-                        
-        elif self.provider in [APIProvider.DEEPSEEK, APIProvider.SILICONFLOW]:
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        if line.strip() == 'data: [DONE]':
-                            break
-                        try:
-                            json_data = json.loads(line[6:])
-                            if "choices" in json_data and json_data["choices"] and json_data["choices"][0]:
-                                delta = json_data["choices"][0].get("delta", {})
-                                reasoning_content = delta.get("reasoning_content")
-                                content = delta.get("content")
-                                
-                                if reasoning_content:
-                                    yield {"type": "reasoning", "content": reasoning_content}
-                                if content:
-                                    yield {"type": "content", "content": content}
-                        except (json.JSONDecodeError, KeyError, TypeError) as e:
-                            logger.error(f"处理DEEPSEEK/SILICONFLOW响应时出错: {str(e)}\n响应内容: {line}")
-                            continue
+
+    def _parse_ollama_stream(self, lines: Iterable[bytes], meta: Dict[str, Any]) -> Generator[Dict[str, str], None, None]:
+        """解析 OLLAMA 的 NDJSON 响应"""
+        for line in lines:
+            if line:
+                line = line.decode('utf-8')
+                try:
+                    json_data = json.loads(line)
+                    if json_data.get("done", False):
+                        # 最后一行包含 token 统计
+                        meta["usage"] = {key: json_data[key] for key in ("prompt_eval_count", "eval_count") if key in json_data}
+                        if json_data.get("done_reason"):
+                            meta["finish_reason"] = json_data["done_reason"]
+                        break
+                    content = json_data.get("message", {}).get("content", "")
+                    if content:
+                        yield {"type": "content", "content": content}
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    logger.error(f"处理OLLAMA响应时出错: {str(e)}\n响应内容: {line}")
+                    continue
+
+    def _parse_deepseek_stream(self, lines: Iterable[bytes], meta: Dict[str, Any]) -> Generator[Dict[str, str], None, None]:
+        """解析 DEEPSEEK/SILICONFLOW 的 SSE 响应（包含 reasoning_content）"""
+        for line in lines:
+            if line:
+                line = line.decode('utf-8')
+                if line.startswith('data: '):
+                    if line.strip() == 'data: [DONE]':
+                        break
+                    try:
+                        json_data = json.loads(line[6:])
+                        self._collect_meta(meta, json_data)
+                        if "choices" in json_data and json_data["choices"] and json_data["choices"][0]:
+                            delta = json_data["choices"][0].get("delta", {})
+                            reasoning_content = delta.get("reasoning_content")
+                            content = delta.get("content")
                             
-        else:  # OpenAI格式
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        if line.strip() == 'data: [DONE]':
-                            break
-                        try:
-                            json_data = json.loads(line[6:])
-                            if "choices" in json_data and json_data["choices"]:
-                                delta = json_data["choices"][0].get("delta", {})
-                                content = delta.get("content", "")
-                                if content:
-                                    yield {"type": "content", "content": content}
-                        except (json.JSONDecodeError, KeyError, TypeError) as e:
-                            logger.error(f"处理响应时出错: {str(e)}\n响应内容: {line}")
-                            continue
+                            if reasoning_content:
+                                yield {"type": "reasoning", "content": reasoning_content}
+                            if content:
+                                yield {"type": "content", "content": content}
+                    except (json.JSONDecodeError, KeyError, TypeError) as e:
+                        logger.error(f"处理DEEPSEEK/SILICONFLOW响应时出错: {str(e)}\n响应内容: {line}")
+                        continue
+
+    def _parse_openai_stream(self, lines: Iterable[bytes], meta: Dict[str, Any]) -> Generator[Dict[str, str], None, None]:
+        """解析 OpenAI 格式的 SSE 响应"""
+        for line in lines:
+            if line:
+                line = line.decode('utf-8')
+                if line.startswith('data: '):
+                    if line.strip() == 'data: [DONE]':
+                        break
+                    try:
+                        json_data = json.loads(line[6:])
+                        self._collect_meta(meta, json_data)
+                        if "choices" in json_data and json_data["choices"]:
+                            delta = json_data["choices"][0].get("delta", {})
+                            content = delta.get("content", "")
+                            if content:
+                                yield {"type": "content", "content": content}
+                    except (json.JSONDecodeError, KeyError, TypeError) as e:
+                        logger.error(f"处理响应时出错: {str(e)}\n响应内容: {line}")
+                        continue
 
     def get_last_reasoning_content(self) -> str:
-        """获取最后一次 Deepseek 的推理内容
+        """获取当前线程最后一次请求的推理内容
+        
+        多线程共享实例时请直接使用返回结果的 reasoning_content。
         
         Returns:
             str: 推理内容。如果不是 Deepseek 模型或没有推理内容，返回空字符串
         """
-        return self._last_reasoning_content
+        return getattr(self._local, "reasoning_content", "")
 
-    def ask(self, prompt: str, messages: Optional[List[Message]] = None, stream: Optional[bool] = None) -> Union[str, Generator[Dict[str, str], None, None]]:
+    def ask(self, prompt: str, messages: Optional[List[Message]] = None, stream: Optional[bool] = None,
+            conversation: Optional[Conversation] = None, cancel: Optional[CancelToken] = None,
+            stop: Optional[Union[StopCondition, str, List[str]]] = None,
+            ticket: Optional[Ticket] = None) -> Union[ChatResult, ChatStream]:
         """发送请求并获取回复
 
         Args:
             prompt: 提示词
             messages: 可选的消息历史
             stream: 是否使用流式输出，如果为 None 则使用实例的 enable_streaming 设置
+            conversation: 使用的对话（系统提示词和上下文），为 None 时使用 add_context() 添加的上下文
+            cancel: 取消令牌，可以在其他线程中取消请求；流式请求未指定时会自动创建，
+                ChatStream.close() 即通过它立即关闭上游连接
+            stop: 客户端停止条件（StopCondition，或停止字符串及其列表），满足时立即关闭上游连接，
+                result.finish_reason 为 "stop"（max_chars 时为 "length"）；非流式请求指定时在内部使用流式请求
+            ticket: acquire_ticket() 提前取得的调度名额，请求使用它而不再排队
 
         Returns:
-            Union[str, Generator[Dict[str, str], None, None]]:
-            - 如果不是流式输出，返回字符串
-            - 如果是流式输出，返回字典生成器，每个字典包含：
+            Union[ChatResult, ChatStream]:
+            - 如果不是流式输出，返回 ChatResult（str 子类，附带 usage、finish_reason、latency 等）
+            - 如果是流式输出，返回可迭代的 ChatStream，每个元素是字典：
               - type: 内容类型，"content" 或 "reasoning"
               - content: 具体内容
+              读取结束后 ChatStream.result 为完整的 ChatResult
         """
+        started = time.monotonic()  # 总耗时（timeout.total）从这里开始计算，包括重试
         use_stream = stream if stream is not None else self.enable_streaming
-        messages_dict = self._prepare_messages(prompt, messages)
-        data = self._prepare_request_data(messages_dict, use_stream)
+        conversation = conversation or self._conversation
+        messages_dict = self._prepare_messages(prompt, messages, conversation)
+        data = self._prepare_request_data(messages_dict, use_stream or stop is not None)
         
-        if use_stream:
-            return self._stream_request(data)
-        return self._normal_request(data)
+        if use_stream or stop is not None:
+            meta: Dict[str, Any] = {}
+
+            def finish(content: str, reasoning: str, latency: float, ttft: Optional[float]) -> ChatResult:
+                result = self._build_result(content, reasoning, meta, latency, ttft)
+                self._maybe_compact(conversation, result)
+                return result
+
+            cancel = cancel or CancelToken()
+            chunks = self._stream_request(data, meta, cancel, started, ticket)
+            if stop is not None:
+                chunks = StopCondition.coerce(stop).apply(chunks, meta)
+            chat_stream = ChatStream(chunks, finish, cancel,
+                                     on_unused=(lambda: self.release_ticket(ticket)) if ticket is not None else None)
+            if use_stream:
+                return chat_stream
+            # 非流式请求：读完（或满足停止条件）后返回完整结果
+            for _ in chat_stream:
+                pass
+            return chat_stream.result
+        result = self._normal_request(data, cancel, started, ticket)
+        self._maybe_compact(conversation, result)
+        return result
+
+    def _maybe_compact(self, conversation: Conversation, result: ChatResult) -> None:
+        """请求完成后按需在后台压缩对话"""
+        if self.compactor is not None:
+            self.compactor.maybe_compact(conversation, result.usage.prompt_tokens if result.usage else None)
+
+def warmup(*targets: Union[AIChat, APIProvider, str], timeout: float = 10.0) -> Dict[str, bool]:
+    """并发预热多个供应商的连接
+
+    Args:
+        targets: AIChat 实例、供应商（名称或枚举）或接口地址。供应商的接口地址优先读取
+            {PROVIDER}_API_URL 环境变量；ERNIE 在环境变量中配置了密钥时会同时预先获取 access token
+        timeout: 每个目标的超时时间（秒）
+
+    Returns:
+        Dict[str, bool]: 每个目标是否预热成功，失败只记录警告，不抛出异常
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def warm(target) -> bool:
+        try:
+            if isinstance(target, AIChat):
+                target.warmup()
+                return True
+            if isinstance(target, str) and target.startswith(("http://", "https://")):
+                url = target
+            else:
+                provider = APIProvider(target.lower()) if isinstance(target, str) else target
+                prefix = provider.value.upper()
+                if provider == APIProvider.ERNIE and os.getenv(f"{prefix}_API_KEY") and os.getenv(f"{prefix}_API_SECRET"):
+                    AIChat(provider=provider, model="ernie-bot", timeout=timeout).warmup()
+                    return True
+                url = os.getenv(f"{prefix}_API_URL") or provider.get_base_url()
+            from .transport import preconnect, http2_available
+            http2 = os.getenv("AI_PALETTE_HTTP2", "").lower() in ("1", "true", "yes") and http2_available()
+            preconnect(_http_session(http2), url, timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"预热 {_target_name(target)} 失败：{e}")
+            return False
+
+    _ensure_env_loaded()
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(targets), 16)) as executor:
+        results = list(executor.map(warm, targets))
+    return {_target_name(target): ok for target, ok in zip(targets, results)}
+
+def _target_name(target: Union[AIChat, APIProvider, str]) -> str:
+    if isinstance(target, AIChat):
+        return f"{target.provider.value}:{target.model}"
+    return target.value if isinstance(target, APIProvider) else target
+
+from .metrics import get_metrics, render_prometheus, reset_metrics, set_metrics_enabled
+from .hooks import HookEvent, add_hook, remove_hook
+from .usage import Usage, ModelPrice, UsageTracker, get_usage, reset_usage, set_price
+from .broadcast import BroadcastStream, Subscription, SubscriberLagged
+
+# 依赖较重的子模块按需导入（PEP 562）
+_LAZY_EXPORTS = {
+    "Pipeline": ".pipeline",
+    "Stage": ".pipeline",
+    "StageTiming": ".pipeline",
+    "PipelineResult": ".pipeline",
+    "PromptTemplate": ".pipeline",
+    "Comparison": ".pipeline",
+    "ComparisonResult": ".pipeline",
+    "Cassette": ".cassette",
+    "CassetteMiss": ".cassette",
+    "SessionStore": ".session",
+    "ContextCompactor": ".compaction",
+    "enable_dns_cache": ".transport",
+    "disable_dns_cache": ".transport",
+}
+
+def __getattr__(name: str):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS))
 
 # 使用示例
 if __name__ == "__main__":
@@ -2,12 +2,201 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from flask import Flask, render_template, request, jsonify, Response, send_from_directory
-from ai_palette import AIChat, Message
-import json
+from ai_palette import AIChat, APIProvider, BroadcastStream, CancelToken, Comparison, Conversation, Message, Pipeline, RequestShed, Stage, StopCondition, Timeouts, render_prometheus, load_env, warmup
+from ai_palette.relay import SSERelay
+from ai_palette.session import SessionStore
 import requests
+import threading
+import uuid
+from collections import OrderedDict
 
+load_env()
 app = Flask(__name__)
 
+# AIChat 实例可以被多个线程共享，按配置缓存，避免每个请求重新创建
+CLIENT_CACHE_SIZE = 128
+_clients = OrderedDict()
+_clients_lock = threading.Lock()
+
+# 可以被其他客户端同时观看的流式回答：{stream_id: BroadcastStream}
+BROADCAST_CACHE_SIZE = 64
+_broadcasts = OrderedDict()
+_broadcasts_lock = threading.Lock()
+
+# 连接超时和流式输出的片段间隔超时（秒）；请求中的 timeout 参数限制等待第一个片段的时间
+CONNECT_TIMEOUT = float(os.getenv('AI_PALETTE_CONNECT_TIMEOUT', '10'))
+IDLE_TIMEOUT = float(os.getenv('AI_PALETTE_IDLE_TIMEOUT', '60'))
+
+# 服务端会话：浏览器每轮只上传新消息
+sessions = SessionStore(
+    max_sessions=int(os.getenv('AI_PALETTE_SESSION_CACHE', '1000')),
+    persist_dir=os.getenv('AI_PALETTE_SESSION_DIR') or None
+)
+
+class SessionOutOfSync(Exception):
+    """会话不存在（例如服务重启且未开启持久化）或与客户端的历史条数不一致，需要客户端重新上传 context"""
+
+class InvalidRequest(ValueError):
+    """请求参数格式错误，返回 400"""
+
+def _session_history(data):
+    """获取本轮请求的历史消息
+
+    带 session_id 时：请求中有 context 则以它为准覆盖会话（新建会话或重新同步），
+    否则使用服务端保存的历史，并用 history_length（客户端的历史条数）校验是否一致。
+    不带 session_id 时与以前一样使用请求中的 context。
+
+    Returns:
+        (session_id, 历史消息列表)
+
+    Raises:
+        InvalidRequest: session_id 或 history_length 格式错误
+        SessionOutOfSync: 需要客户端重新上传 context
+    """
+    session_id = data.get('session_id')
+    context = data.get('context')
+    if not session_id:
+        return None, _clean_context(context or [])
+    if not SessionStore.is_valid_id(session_id):
+        raise InvalidRequest(f'无效的会话 ID: {session_id!r}')
+    raw_length = data.get('history_length')
+    history_length = None
+    if raw_length is not None:
+        # GET 请求的参数是字符串；JSON 中的布尔值和小数不是合法的条数
+        if not isinstance(raw_length, (bool, float)):
+            try:
+                history_length = int(raw_length)
+            except (TypeError, ValueError):
+                pass
+        if history_length is None or history_length < 0:
+            raise InvalidRequest(f'history_length 必须是非负整数: {raw_length!r}')
+    if context is not None:
+        messages = _clean_context(context)
+        sessions.replace(session_id, messages)
+        return session_id, messages
+    messages = sessions.get(session_id)
+    if messages is None and history_length == 0:
+        # 新会话
+        return session_id, []
+    if messages is None or (history_length is not None and history_length != len(messages)):
+        raise SessionOutOfSync(session_id)
+    return session_id, messages
+
+def _remember_turn(session_id, prompt, answer):
+    """把一轮成功的问答追加到会话"""
+    if session_id and answer:
+        sessions.append(session_id, Message(role='user', content=prompt),
+                        Message(role='assistant', content=_strip_think(answer)))
+
+def _session_out_of_sync(session_id):
+    return jsonify({'success': False, 'error': f'会话不存在或与客户端不一致: {session_id}', 'resend_context': True}), 409
+
+def _get_client(**params):
+    """获取（或创建）与参数对应的共享 AIChat 实例"""
+    key = tuple(sorted(params.items()))
+    with _clients_lock:
+        chat = _clients.get(key)
+        if chat is not None:
+            _clients.move_to_end(key)
+            return chat
+    chat = AIChat(**params)
+    with _clients_lock:
+        _clients[key] = chat
+        while len(_clients) > CLIENT_CACHE_SIZE:
+            _clients.popitem(last=False)
+    return chat
+
+def _share_stream(stream):
+    """登记可共享的流式回答，所有观看者都断开后取消上游请求"""
+    stream_id = uuid.uuid4().hex
+    broadcast = BroadcastStream(stream, auto_close=True)
+    with _broadcasts_lock:
+        _broadcasts[stream_id] = broadcast
+        while len(_broadcasts) > BROADCAST_CACHE_SIZE:
+            _broadcasts.popitem(last=False)
+    return stream_id, broadcast
+
+def _watch(subscription):
+    """逐个转发订阅到的片段，客户端断开时退出订阅"""
+    try:
+        yield from subscription
+    finally:
+        subscription.close()
+
+def _ask_stream(chat, prompt, **kwargs):
+    """先在调度器中排队，再创建流式请求
+
+    排队超时（RequestShed）在返回 SSE 响应之前抛出，调用方返回 503；之后响应头和保活注释
+    立即发出，不必等到第一个片段。创建请求失败时归还名额。
+    """
+    ticket = chat.acquire_ticket()
+    try:
+        return chat.ask(prompt, stream=True, ticket=ticket, **kwargs)
+    except BaseException:
+        chat.release_ticket(ticket)
+        raise
+
+def _timeout_param(data):
+    """请求中的 timeout（秒，默认 120）；GET 请求的参数是字符串
+
+    Raises:
+        InvalidRequest: 不是正数
+    """
+    value = data.get('timeout', 120)
+    timeout = None
+    if not isinstance(value, bool):
+        try:
+            timeout = float(value)
+        except (TypeError, ValueError):
+            pass
+    if timeout is None or not 0 < timeout < float('inf'):
+        raise InvalidRequest(f'timeout 必须是正数（秒）: {value!r}')
+    return timeout
+
+def _stop_condition(data):
+    """请求中的 stop（停止字符串或列表）和 max_chars（最多输出的字符数），都没有时返回 None
+
+    Raises:
+        InvalidRequest: stop 不是非空字符串（列表），或 max_chars 不是正整数
+    """
+    stop = data.get('stop') or None
+    value = data.get('max_chars')
+    max_chars = None
+    if value not in (None, ''):
+        if not isinstance(value, bool):
+            try:
+                max_chars = int(value)
+            except (TypeError, ValueError):
+                pass
+        if max_chars is None or max_chars <= 0 or (isinstance(value, float) and value != max_chars):
+            raise InvalidRequest(f'max_chars 必须是正整数: {value!r}')
+    if stop is not None and not (isinstance(stop, str) or
+                                 isinstance(stop, list) and all(isinstance(s, str) and s for s in stop)):
+        raise InvalidRequest(f'stop 必须是非空字符串或字符串列表: {stop!r}')
+    if stop is None and max_chars is None:
+        return None
+    return StopCondition(stop=stop, max_chars=max_chars)
+
+def _strip_think(content):
+    """去掉 assistant 消息中 </think> 及之前的思考过程"""
+    if '<think>' in content:
+        start = content.find('<think>')
+        end = content.find('</think>')
+        if end > start:
+            content = content[end + 8:].strip()  # 8是</think>的长度
+    return content
+
+def _clean_context(context):
+    """将前端传来的上下文转换为消息列表，assistant 消息去掉思考过程"""
+    messages = []
+    for msg in context:
+        content = msg['content']
+        # 如果是assistant的消息,需要过滤掉思考过程
+        if msg['role'] == 'assistant':
+            content = _strip_think(content)
+        messages.append(Message(role=msg['role'], content=content))
+    return messages
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -16,6 +205,11 @@ def index():
 def serve_static(filename):
     return send_from_directory(os.path.dirname(os.path.abspath(__file__)), filename)
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的请求指标"""
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/models', methods=['GET'])
 def get_models():
     model_provider = request.args.get('type')
@@ -37,13 +231,29 @@ def get_models():
         
         # Ollama 本地模型
         if model_provider == 'ollama':
+            from ai_palette import ollama
             try:
-                response = requests.get('http://localhost:11434/api/tags')
-                if response.status_code == 200:
-                    models = response.json()
-                    return jsonify({'success': True, 'models': [model['name'] for model in models['models']]})
+                pool = ollama.get_pool()
+                if pool is not None:
+                    # 多台服务：汇总所有可用服务的模型
+                    pool.check()
+                    hosts = pool.models()
+                    models = list(hosts)
                 else:
-                    return jsonify({'success': False, 'error': 'Ollama 服务未启动或无法访问'}), response.status_code
+                    host = ollama.ollama_host()
+                    models = ollama.list_models(host)
+                    ollama.tracker.refresh(host, force=True)
+                    hosts = {model: [host] for model in models}
+                # 已加载到内存的模型排在前面，选择它们没有冷启动
+                resident = [model for model in models
+                            if any(ollama.tracker.is_warm(host, model) for host in hosts[model])]
+                models = resident + [model for model in models if model not in resident]
+                result = {'success': True, 'models': models, 'resident': resident}
+                if pool is not None:
+                    result['hosts'] = hosts
+                return jsonify(result)
+            except requests.HTTPError as e:
+                return jsonify({'success': False, 'error': 'Ollama 服务未启动或无法访问'}), e.response.status_code
             except Exception as e:
                 return jsonify({'success': False, 'error': f'连接 Ollama 失败: {str(e)}'}), 500
         
@@ -93,73 +303,75 @@ def chat():
     prompt = data.get('prompt')
     model = data.get('model')
     enable_streaming = data.get('enable_streaming', False)
-    timeout = data.get('timeout', 120)  # 添加超时参数，默认120秒
     include_reasoning = data.get('include_reasoning', True)  # 是否包含思考过程
-    context = data.get('context', [])  # 获取上下文
+    candidates = data.get('candidates')  # Ollama 的候选模型，优先使用已经加载到内存的
     
     try:
-        # 根据不同的模型类型设置不同的参数
-        chat_params = {
-            'provider': model_type,  # 使用 model_type 作为 provider
-            'api_key': api_key,
-            'model': model,
-            'enable_streaming': enable_streaming,
-            'timeout': timeout
-        }
-        
-        chat = AIChat(**chat_params)
-        
-        # 添加上下文消息
-        for msg in context:
-            # 如果是assistant的消息,需要过滤掉思考过程
-            if msg['role'] == 'assistant':
-                content = msg['content']
-                # 如果内容包含<think>标记,只保留非思考部分
-                if '<think>' in content:
-                    # 移除<think>到</think>之间的内容
-                    start = content.find('<think>')
-                    end = content.find('</think>')
-                    if end > start:
-                        content = content[end + 8:].strip()  # 8是</think>的长度
-                chat.add_context(content=content, role=msg['role'])
-            else:
-                chat.add_context(content=msg['content'], role=msg['role'])
+        timeout = _timeout_param(data)  # 首字和读取超时，默认120秒
+        session_id, history = _session_history(data)
+        stop = _stop_condition(data)  # 客户端停止条件，满足时立即关闭上游连接
+        if model_type == 'ollama' and candidates:
+            from ai_palette.ollama import prefer_warm
+            model = prefer_warm(candidates.split(',') if isinstance(candidates, str) else candidates)
+
+        # 客户端按配置共享，上下文只属于本次请求
+        chat = _get_client(
+            provider=model_type,  # 使用 model_type 作为 provider
+            api_key=api_key,
+            model=model,
+            timeout=Timeouts(connect=CONNECT_TIMEOUT, first_token=timeout, idle=IDLE_TIMEOUT, read=timeout)
+        )
+        conversation = Conversation(messages=history)
         
         if enable_streaming:
+            if data.get('share_stream'):
+                # 共享的回答：其他客户端可以通过 /api/streams/<stream_id> 同时观看
+                stream_id, broadcast = _share_stream(_ask_stream(chat, prompt, conversation=conversation, stop=stop))
+                subscription = broadcast.subscribe()
+
+                def generate_shared():
+                    yield from _watch(subscription)
+                    if broadcast.result is not None:
+                        _remember_turn(session_id, prompt, broadcast.result)
+                response = Response(SSERelay(generate_shared()), mimetype='text/event-stream')
+                response.headers['X-Stream-Id'] = stream_id
+                response.headers['X-Model'] = model
+                return response
+
+            # 客户端断开时 SSERelay 通过取消令牌立即关闭上游连接
+            cancel = CancelToken()
+            stream = _ask_stream(chat, prompt, conversation=conversation, cancel=cancel, stop=stop)
+
             def generate():
-                for chunk in chat.ask(prompt):
-                    if isinstance(chunk, dict):
-                        # 对于结构化的输出直接传递
-                        yield f"data: {json.dumps(chunk)}\n\n"
-                    else:
-                        # 尝试获取推理过程
-                        try:
-                            if hasattr(chat, 'get_last_reasoning_content'):
-                                reasoning = chat.get_last_reasoning_content()
-                                if reasoning:
-                                    print(f"推理过程: {reasoning}")
-                                    yield f"data: {json.dumps({'type': 'reasoning', 'content': reasoning})}\n\n"
-                        except Exception as e:
-                            print(f"获取推理过程失败: {e}")
-                        
-                        # 发送实际内容
-                        yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
-                        print(f"实际内容: {chunk}")
-            return Response(generate(), mimetype='text/event-stream')
+                yield from stream
+                if stream.result is not None:
+                    _remember_turn(session_id, prompt, stream.result)
+            # 响应头和保活注释立即发出；响应没有被读取就关闭时归还提前取得的名额
+            response = Response(SSERelay(generate(), cancel=cancel), mimetype='text/event-stream',
+                                headers={'X-Model': model})
+            response.call_on_close(stream.close)
+            return response
         else:
-            response = chat.ask(prompt)
-            result = {'success': True, 'response': response}
+            response = chat.ask(prompt, stream=False, conversation=conversation, stop=stop)
+            _remember_turn(session_id, prompt, response)
+            result = {'success': True, 'response': response, 'model': model}
+            if response.finish_reason:
+                result['finish_reason'] = response.finish_reason
+            if response.usage:
+                result['usage'] = response.usage.to_dict()
             
             # 如果需要包含思考过程
-            if include_reasoning and hasattr(chat, 'get_last_reasoning_content'):
-                try:
-                    reasoning = chat.get_last_reasoning_content()
-                    if reasoning:
-                        result['reasoning'] = reasoning
-                except Exception as e:
-                    result['reasoning_error'] = str(e)
+            if include_reasoning and response.reasoning_content:
+                result['reasoning'] = response.reasoning_content
             
             return jsonify(result)
+    except SessionOutOfSync as e:
+        return _session_out_of_sync(str(e))
+    except InvalidRequest as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RequestShed as e:
+        # 调度队列已满，客户端稍后重试
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -173,7 +385,6 @@ def chain_chat():
     query = data.get('query')  # 用户请求
     enable_streaming = data.get('enable_streaming', False)
     use_reasoning_field = data.get('use_reasoning_field', True)  # 是否使用 reasoning_content 字段
-    context = data.get('context', [])  # 获取上下文
     
     # 获取推理链配置
     thinking_config = data.get('thinkingConfig', {})
@@ -182,98 +393,247 @@ def chain_chat():
     result_prompt = data.get('resultPrompt', '')
     
     try:
-        # 创建思考阶段的聊天实例
-        thinking_chat = AIChat(
-            provider=thinking_config.get('modelType'),
-            api_key=thinking_config.get('apiKey'),
-            model=thinking_config.get('model'),
-            enable_streaming=enable_streaming,
-            timeout=120
-        )
-        
-        # 创建结果阶段的聊天实例
-        result_chat = AIChat(
-            provider=result_config.get('modelType'),
-            api_key=result_config.get('apiKey'),
-            model=result_config.get('model'),
-            enable_streaming=enable_streaming,
-            timeout=120
-        )
-        
-        # 处理上下文
-        for msg in context:
-            if msg['role'] == 'assistant':
-                content = msg['content']
-                if '<think>' in content:
-                    start = content.find('<think>')
-                    end = content.find('</think>')
-                    if end > start:
-                        content = content[end + 8:].strip()
-                thinking_chat.add_context(content=content, role=msg['role'])
-                result_chat.add_context(content=content, role=msg['role'])
-            else:
-                thinking_chat.add_context(content=msg['content'], role=msg['role'])
-                result_chat.add_context(content=msg['content'], role=msg['role'])
+        session_id, messages = _session_history(data)
+        # 思考阶段和结果阶段组成两级流水线，结果阶段通过 [$thought$] 依赖思考阶段
+        pipeline = Pipeline([
+            Stage(
+                name='thought',
+                provider=thinking_config.get('modelType'),
+                api_key=thinking_config.get('apiKey'),
+                model=thinking_config.get('model'),
+                template=thinking_prompt,
+                options={'timeout': 120}
+            ),
+            Stage(
+                name='result',
+                provider=result_config.get('modelType'),
+                api_key=result_config.get('apiKey'),
+                model=result_config.get('model'),
+                template=result_prompt,
+                depends_on=['thought'],
+                options={'timeout': 120}
+            )
+        ])
         
         if enable_streaming:
+            cancel = CancelToken()
+
             def generate():
-                # 思考阶段
-                thought_content = []
-                thinking_prompt_filled = thinking_prompt.replace('[$query$]', query)
-                
-                if not use_reasoning_field:
-                    yield f"data: {json.dumps({'type': 'content', 'content': '<think>'})}"
-                
-                for chunk in thinking_chat.ask(thinking_prompt_filled):
-                    if isinstance(chunk, dict):
-                        content = chunk.get('content')
-                        thought_content.append(content)
-                        if use_reasoning_field:
-                            yield f"data: {json.dumps({'type': 'reasoning', 'content': content})}"
+                answer = []
+                for event in pipeline.stream({'query': query}, context=messages, cancel=cancel):
+                    if event['type'] == 'stage_start' and event['stage'] == 'thought':
+                        if not use_reasoning_field:
+                            yield {'type': 'content', 'content': '<think>'}
+                    elif event['type'] == 'stage_end' and event['stage'] == 'thought':
+                        if not use_reasoning_field:
+                            yield {'type': 'content', 'content': '</think>'}
+                    elif event['type'] in ('reasoning', 'content'):
+                        # 思考阶段的输出都作为思考过程
+                        if event['stage'] == 'thought' and use_reasoning_field:
+                            yield {'type': 'reasoning', 'content': event['content']}
                         else:
-                            yield f"data: {json.dumps({'type': 'content', 'content': content})}"
-                if not use_reasoning_field:
-                    yield f"data: {json.dumps({'type': 'content', 'content': '</think>'})}"
-                
-                thought = ''.join(thought_content)
-                
-                # 结果阶段
-                result_prompt_filled = result_prompt.replace('[$query$]', query).replace('[$thought$]', thought)
-                for chunk in result_chat.ask(result_prompt_filled):
-                    if isinstance(chunk, dict):
-                        yield f"data: {json.dumps({'type': 'content', 'content': chunk.get('content')})}\n\n"
+                            yield {'type': 'content', 'content': event['content']}
+                        if event['type'] == 'content' and event['stage'] == 'result':
+                            answer.append(event['content'])
+                    elif event['type'] == 'stage_error':
+                        # 思考阶段失败时结果阶段会被跳过，只报告第一个错误，失败的轮次不计入会话
+                        yield {'type': 'error', 'content': event['error']}
+                        return
+                _remember_turn(session_id, query, ''.join(answer))
                         
-            return Response(generate(), mimetype='text/event-stream')
+            return Response(SSERelay(generate(), cancel=cancel), mimetype='text/event-stream')
         else:
-            # 思考阶段
-            thinking_prompt_filled = thinking_prompt.replace('[$query$]', query)
-            thought = thinking_chat.ask(thinking_prompt_filled)
+            result = pipeline.run({'query': query}, context=messages)
+            thought = result.outputs.get('thought')
             if not thought:
                 return jsonify({'success': False, 'error': '思考阶段失败'}), 500
-                
-            # 结果阶段
-            result_prompt_filled = result_prompt.replace('[$query$]', query).replace('[$thought$]', thought)
-            result = result_chat.ask(result_prompt_filled)
-            if not result:
+            answer = result.outputs.get('result')
+            if not answer:
                 return jsonify({'success': False, 'error': '结果阶段失败'}), 500
+            _remember_turn(session_id, query, answer)
             
             # 构建响应
             response = {
                 'success': True,
-                'response': result
+                'response': answer,
+                'timings': {name: timing.to_dict() for name, timing in result.timings.items()}
             }
             
             if use_reasoning_field:
                 response['reasoning_content'] = thought
             else:
-                response['response'] = f'<think>{thought}</think>{result}'
+                response['response'] = f'<think>{thought}</think>{answer}'
             
             return jsonify(response)
             
+    except SessionOutOfSync as e:
+        return _session_out_of_sync(str(e))
+    except InvalidRequest as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except RequestShed as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/streams/<stream_id>', methods=['GET'])
+def watch_stream(stream_id):
+    """观看一个共享的流式回答（先回放已经输出的内容）"""
+    with _broadcasts_lock:
+        broadcast = _broadcasts.get(stream_id)
+    if broadcast is None:
+        return jsonify({'success': False, 'error': f'流不存在或已过期: {stream_id}'}), 404
+    return Response(SSERelay(_watch(broadcast.subscribe())), mimetype='text/event-stream')
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    """删除服务端保存的会话历史"""
+    try:
+        sessions.delete(session_id)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True})
+
+def _target_from_json(config):
+    """将前端的模型配置（兼容 modelType/apiKey 写法）转换为 Stage/Comparison 的配置"""
+    config = dict(config)
+    if 'modelType' in config:
+        config['provider'] = config.pop('modelType')
+    if 'apiKey' in config:
+        config['api_key'] = config.pop('apiKey')
+    config.setdefault('timeout', 120)
+    return config
+
+def _stage_from_json(config):
+    """将前端的阶段配置转换为 Stage"""
+    return Stage.from_dict(_target_from_json(config))
+
+@app.route('/api/pipeline', methods=['POST'])
+def run_pipeline():
+    """声明式多阶段流水线
+
+    请求体示例：
+    {
+        "stages": [
+            {"name": "plan", "modelType": "deepseek", "apiKey": "...", "model": "deepseek-chat", "template": "[$query$]"},
+            {"name": "critic", "modelType": "openai", "apiKey": "...", "model": "gpt-4o-mini", "template": "[$query$]"},
+            {"name": "answer", "modelType": "deepseek", "apiKey": "...", "model": "deepseek-chat",
+             "template": "[$plan$]\n[$critic$]\n[$query$]"}
+        ],
+        "inputs": {"query": "..."},
+        "output": "answer",
+        "enable_streaming": true
+    }
+    """
+    data = request.json
+    enable_streaming = data.get('enable_streaming', False)
+    inputs = data.get('inputs', {})
+    context = data.get('context', [])
+    
+    try:
+        pipeline = Pipeline([_stage_from_json(stage) for stage in data.get('stages', [])])
+        output = data.get('output') or pipeline.outputs[-1]
+        if output not in pipeline.stages:
+            return jsonify({'success': False, 'error': f'输出阶段不存在: {output}'}), 400
+        messages = _clean_context(context)
+        
+        if enable_streaming:
+            cancel = CancelToken()
+
+            def generate():
+                for event in pipeline.stream(inputs, context=messages, cancel=cancel):
+                    event.pop('exception', None)
+                    yield event
+            return Response(SSERelay(generate(), cancel=cancel), mimetype='text/event-stream')
+        else:
+            result = pipeline.run(inputs, context=messages)
+            return jsonify({
+                'success': True,
+                'response': result.outputs.get(output),
+                'outputs': result.outputs,
+                'reasoning': result.reasoning,
+                'timings': {name: timing.to_dict() for name, timing in result.timings.items()},
+                'total_time': result.total_time
+            })
+    except RequestShed as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/compare', methods=['POST'])
+def compare():
+    """把同一个提示词并发发给多个模型，对比输出和耗时
+
+    请求体示例：
+    {
+        "prompt": "...",
+        "targets": [
+            {"modelType": "deepseek", "apiKey": "...", "model": "deepseek-chat"},
+            {"modelType": "ollama", "model": "qwen2.5:7b", "label": "本地"}
+        ],
+        "context": [...],
+        "enable_streaming": true
+    }
+
+    流式时所有模型的输出在同一个 SSE 连接上返回，每个事件的 target 为模型标签（默认 "provider:model"），
+    end 事件包含该模型的首字耗时（ttft）和总耗时（latency），最后的 done 事件汇总所有结果。
+    """
+    data = request.json
+    prompt = data.get('prompt')
+    enable_streaming = data.get('enable_streaming', False)
+    
+    try:
+        if not prompt:
+            return jsonify({'success': False, 'error': '缺少 prompt'}), 400
+        comparison = Comparison([_target_from_json(target) for target in data.get('targets', [])])
+        messages = _clean_context(data.get('context', []))
+        
+        if enable_streaming:
+            # 客户端断开时关闭所有模型的上游连接
+            cancel = CancelToken()
+
+            def generate():
+                for event in comparison.stream(prompt, context=messages, cancel=cancel):
+                    event.pop('exception', None)
+                    yield event
+            return Response(SSERelay(generate(), cancel=cancel), mimetype='text/event-stream')
+        else:
+            events = list(comparison.stream(prompt, context=messages, stream=False))
+            shed = [event for event in events if isinstance(event.get('exception'), RequestShed)]
+            if len(shed) == len(comparison.targets):
+                # 所有模型都在调度队列中被丢弃，客户端稍后重试
+                return jsonify({'success': False, 'error': shed[0]['error']}), 503
+            done = events[-1]
+            return jsonify({'success': True, 'results': done['results'], 'total_time': done['total_time']})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _warmup_from_env():
+    """启动时按环境变量预热
+
+    - AI_PALETTE_DNS_TTL: 大于 0 时缓存 DNS 解析结果（秒）
+    - AI_PALETTE_WARMUP: 逗号分隔的供应商名称或接口地址，all 表示所有供应商
+    - AI_PALETTE_OLLAMA_PRELOAD: 逗号分隔的 Ollama 模型，启动时加载到内存（保留时间读取 OLLAMA_KEEP_ALIVE）
+    """
+    dns_ttl = float(os.getenv('AI_PALETTE_DNS_TTL', '0'))
+    if dns_ttl > 0:
+        from ai_palette import enable_dns_cache
+        enable_dns_cache(dns_ttl)
+    targets = [t.strip() for t in os.getenv('AI_PALETTE_WARMUP', '').split(',') if t.strip()]
+    if targets == ['all']:
+        targets = [provider.value for provider in APIProvider]
+    if targets:
+        results = warmup(*targets)
+        summary = ', '.join(f"{name}={'成功' if ok else '失败'}" for name, ok in results.items())
+        print(f"连接预热完成：{summary}")
+    for model in [m.strip() for m in os.getenv('AI_PALETTE_OLLAMA_PRELOAD', '').split(',') if m.strip()]:
+        try:
+            elapsed = AIChat(provider='ollama', model=model).preload()
+            print(f"Ollama 模型 {model} 已加载（{elapsed:.1f} 秒）")
+        except Exception as e:
+            print(f"Ollama 模型 {model} 加载失败：{e}")
+
 def run_server():
+    _warmup_from_env()
     app.run(host='0.0.0.0', port=18000)
 
 if __name__ == '__main__':
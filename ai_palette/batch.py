@@ -0,0 +1,340 @@
+"""批量任务
+
+从 JSONL 读取提示词，并发调用 AIChat，把结果逐行写入输出 JSONL。输出文件同时是检查点：
+中断后用相同的参数重新运行，已经完成的条目会被跳过。
+
+输入每行一个 JSON 对象，id 省略时使用行号（从 0 开始，不计空行）：
+
+    {"id": "q1", "prompt": "你好", "system": "可选的系统提示词", "messages": [{"role": "user", "content": "..."}]}
+
+输出每行一个结果，失败的条目带有 error 和 error_class：
+
+    {"id": "q1", "index": 0, "content": "...", "usage": {...}, "latency": 1.2, ...}
+    {"id": "q2", "index": 1, "error": "...", "error_class": "http_429"}
+
+命令行：
+
+    ai-palette-batch prompts.jsonl results.jsonl --provider deepseek --model deepseek-chat \\
+        --concurrency 8 --rps 5 --ordered
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Any, Iterator, Tuple, Set, List, Callable
+
+from . import AIChat, AdaptiveLimiter, Conversation, Message, set_log_level
+from .metrics import error_class
+
+@dataclass
+class BatchSummary:
+    """批量任务的统计"""
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0  # 检查点中已经完成的条目
+    elapsed: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    errors: Counter = field(default_factory=Counter)  # {错误类别: 次数}
+
+    @property
+    def completed(self) -> int:
+        """本次运行处理的条目数（成功和失败）"""
+        return self.succeeded + self.failed
+
+    @property
+    def throughput(self) -> float:
+        """每秒处理的条目数"""
+        return self.completed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def record(self, record: Dict[str, Any]) -> None:
+        if "error" in record:
+            self.failed += 1
+            self.errors[record["error_class"]] += 1
+            return
+        self.succeeded += 1
+        usage = record.get("usage") or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "errors": dict(self.errors)
+        }
+
+    def format(self) -> str:
+        """生成可读的汇总报告"""
+        tokens_per_second = self.completion_tokens / self.elapsed if self.elapsed > 0 else 0.0
+        lines = [
+            f"共 {self.total} 条：成功 {self.succeeded}，失败 {self.failed}，跳过（已完成）{self.skipped}",
+            f"耗时 {self.elapsed:.1f} 秒，{self.throughput:.2f} 条/秒，输出 {tokens_per_second:.1f} token/秒",
+            f"token：输入 {self.prompt_tokens}，输出 {self.completion_tokens}"
+        ]
+        if self.errors:
+            errors = "，".join(f"{name} × {count}" for name, count in self.errors.most_common())
+            lines.append(f"错误：{errors}")
+        return "\n".join(lines)
+
+class _RateLimiter:
+    """把请求的发出时间均匀地间隔开，每秒最多 rate 个"""
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError("rate 必须大于 0")
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+def _read_items(path: str) -> Iterator[Tuple[int, Any, Optional[str]]]:
+    """逐行读取输入，返回 (序号, 条目, 解析错误)"""
+    index = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                error = None if isinstance(item, dict) else "每行必须是 JSON 对象"
+            except json.JSONDecodeError as e:
+                item, error = None, f"JSON 解析错误: {e}"
+            yield index, item, error
+            index += 1
+
+def _item_id(index: int, item: Any) -> Any:
+    return item.get("id", index) if isinstance(item, dict) else index
+
+def _load_checkpoint(output_path: str, retry_errors: bool) -> Set[str]:
+    """读取已有的输出，返回已完成条目的 id
+
+    retry_errors 时失败的条目不算完成；被中断写了一半的最后一行会被丢弃。需要丢弃记录时重写输出文件。
+    """
+    if not os.path.exists(output_path):
+        return set()
+    kept: List[str] = []
+    done: Set[str] = set()
+    dropped = False
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                dropped = True
+                continue
+            if retry_errors and "error" in record:
+                dropped = True
+                continue
+            kept.append(line if line.endswith("\n") else line + "\n")
+            done.add(str(record.get("id")))
+    if dropped:
+        temp_path = f"{output_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(temp_path, output_path)
+    return done
+
+def _run_item(chat: AIChat, index: int, item: Any, error: Optional[str]) -> Dict[str, Any]:
+    """处理一个条目，返回要写入输出的记录"""
+    record: Dict[str, Any] = {"id": _item_id(index, item), "index": index}
+    try:
+        if error is not None:
+            raise ValueError(error)
+        if not item.get("prompt"):
+            raise ValueError("缺少 prompt 字段")
+        messages = [Message(role=msg["role"], content=msg["content"]) for msg in item.get("messages") or []]
+        conversation = Conversation(system_prompt=item.get("system"), messages=messages)
+        result = chat.ask(item["prompt"], stream=False, conversation=conversation)
+        data = result.to_dict()
+        del data["provider"], data["model"]
+        record.update(data)
+    except Exception as e:
+        record.update(error=str(e), error_class=error_class(e))
+    return record
+
+def run_batch(
+    chat: AIChat,
+    input_path: str,
+    output_path: str,
+    concurrency: int = 4,
+    rate: Optional[float] = None,
+    ordered: bool = False,
+    resume: bool = True,
+    retry_errors: bool = False,
+    on_progress: Optional[Callable[[BatchSummary], None]] = None,
+    lane: Optional[str] = None
+) -> BatchSummary:
+    """运行批量任务
+
+    Args:
+        chat: 使用的 AIChat（多个线程共享）
+        input_path: 输入 JSONL
+        output_path: 输出 JSONL，同时作为检查点
+        concurrency: 同时进行的请求数
+        rate: 每秒最多发出的请求数，None 表示不限制
+        ordered: True 时按输入顺序写出结果，否则按完成顺序（先完成先写出）
+        resume: 跳过输出中已经完成的条目；False 时覆盖输出文件
+        retry_errors: 续跑时重新处理失败的条目
+        on_progress: 每完成一个条目调用一次，参数为当前统计
+        lane: 在 chat 的调度器中使用的通道（如 "batch"），None 时使用 chat.lane
+
+    Returns:
+        BatchSummary: 统计结果；被 Ctrl+C 中断时返回已完成部分的统计（正在进行的请求会写完）
+    """
+    if concurrency <= 0:
+        raise ValueError("concurrency 必须大于 0")
+    if lane is not None and lane != chat.lane:
+        if chat.scheduler is not None and lane not in chat.scheduler.lanes:
+            raise ValueError(f"调度器中没有通道: {lane}")
+        # 浅拷贝共享连接、限制器和调度器，只替换通道，不修改调用方的实例
+        chat = copy.copy(chat)
+        chat.lane = lane
+    limiter = _RateLimiter(rate) if rate else None
+    done = _load_checkpoint(output_path, retry_errors) if resume else set()
+    summary = BatchSummary(total=sum(1 for _ in _read_items(input_path)))
+    lock = threading.Lock()
+    # 限制已读入但还没写出的条目数：输入不会一次性读入内存，ordered 时等待前面条目的结果也不会无限堆积
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    stopped = threading.Event()
+    waiting: deque = deque()  # ordered 时尚未写出的序号（按输入顺序）
+    ready: Dict[int, Optional[Dict[str, Any]]] = {}
+    start = time.perf_counter()
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as output:
+        def write(record: Dict[str, Any]) -> None:
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+
+        def complete(index: int, record: Optional[Dict[str, Any]]) -> None:
+            # record 为 None 表示中断后未处理的条目
+            written = 1
+            with lock:
+                if record is not None:
+                    summary.record(record)
+                    summary.elapsed = time.perf_counter() - start
+                if ordered:
+                    # 名额在条目写出时才归还，前面的条目较慢时最多缓存 concurrency * 2 个结果
+                    ready[index] = record
+                    written = 0
+                    while waiting and waiting[0] in ready:
+                        head = ready.pop(waiting.popleft())
+                        written += 1
+                        if head is not None:
+                            write(head)
+                elif record is not None:
+                    write(record)
+                if record is not None and on_progress is not None:
+                    on_progress(summary)
+            for _ in range(written):
+                slots.release()
+
+        def work(index: int, item: Any, error: Optional[str]) -> None:
+            record = None
+            try:
+                if not stopped.is_set():
+                    if limiter is not None:
+                        limiter.acquire()
+                    record = _run_item(chat, index, item, error)
+            finally:
+                complete(index, record)
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            try:
+                for index, item, error in _read_items(input_path):
+                    if str(_item_id(index, item)) in done:
+                        summary.skipped += 1
+                        continue
+                    slots.acquire()
+                    if ordered:
+                        with lock:
+                            waiting.append(index)
+                    pool.submit(work, index, item, error)
+            except KeyboardInterrupt:
+                stopped.set()
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="AI Palette 批量任务：从 JSONL 读取提示词并发请求，结果写入 JSONL")
+    parser.add_argument("input", help="输入 JSONL，每行包含 prompt，可选 id、system、messages")
+    parser.add_argument("output", help="输出 JSONL，同时作为检查点")
+    parser.add_argument("--provider", required=True, help="供应商，如 deepseek、openai、ollama")
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--api-key", help="默认读取 {PROVIDER}_API_KEY 环境变量")
+    parser.add_argument("--api-url")
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--max-tokens", type=int)
+    parser.add_argument("--timeout", type=float, default=120, help="请求超时（秒）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时进行的请求数（--adaptive 时为上限）")
+    parser.add_argument("--adaptive", action="store_true", help="根据 429、5xx 和延迟自动调整并发数")
+    parser.add_argument("--rps", type=float, help="每秒最多发出的请求数")
+    parser.add_argument("--lane", default="batch", help="启用调度器时使用的通道（默认 batch，优先级低于交互请求）")
+    parser.add_argument("--ordered", action="store_true", help="按输入顺序写出结果（默认按完成顺序）")
+    parser.add_argument("--restart", action="store_true", help="忽略已有输出，从头开始")
+    parser.add_argument("--retry-errors", action="store_true", help="续跑时重新处理失败的条目")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    set_log_level(args.log_level)
+    chat = AIChat(
+        provider=args.provider,
+        model=args.model,
+        api_key=args.api_key,
+        api_url=args.api_url,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens,
+        timeout=args.timeout,
+        lane=args.lane,
+        limiter=AdaptiveLimiter(initial_limit=min(4, args.concurrency), max_limit=args.concurrency) if args.adaptive else None
+    )
+    last_report = [0.0]
+
+    def report(summary: BatchSummary) -> None:
+        now = time.monotonic()
+        if now - last_report[0] >= 1.0 or summary.completed + summary.skipped == summary.total:
+            last_report[0] = now
+            print(f"\r进度 {summary.completed + summary.skipped}/{summary.total}，失败 {summary.failed}，"
+                  f"{summary.throughput:.2f} 条/秒", end="", file=sys.stderr, flush=True)
+
+    summary = run_batch(
+        chat,
+        args.input,
+        args.output,
+        concurrency=args.concurrency,
+        rate=args.rps,
+        ordered=args.ordered,
+        resume=not args.restart,
+        retry_errors=args.retry_errors,
+        on_progress=report
+    )
+    print(file=sys.stderr)
+    print(summary.format())
+    return 1 if summary.failed else 0
+
+def run_cli() -> None:
+    """ai-palette-batch 命令入口"""
+    sys.exit(main())
+
+if __name__ == "__main__":
+    run_cli()
@@ -0,0 +1,164 @@
+"""流式输出广播
+
+把一次流式生成分发给多个订阅者，例如多个 SSE 客户端同时观看同一个回答、日志和缓存写入：
+
+    from ai_palette import AIChat, BroadcastStream
+
+    broadcast = BroadcastStream(chat.ask("你好", stream=True))
+    for chunk in broadcast.subscribe():
+        print(chunk["content"], end="")
+
+上游只请求一次，由后台线程读取。片段保存在共享的历史中，每个订阅者只维护自己的读取位置，
+读得慢的订阅者不会阻塞上游和其他订阅者；后加入的订阅者先回放已经输出的片段。限制了
+max_history 时，落后超过历史长度的订阅者收到 SubscriberLagged。
+"""
+import threading
+from collections import deque
+from typing import Optional, Dict, Iterable, Any
+
+class SubscriberLagged(Exception):
+    """订阅者落后太多，尚未读取的片段已经从历史中丢弃"""
+
+    def __init__(self, missed: int):
+        super().__init__(f"订阅者落后太多，丢失了 {missed} 个片段")
+        self.missed = missed
+
+class Subscription:
+    """BroadcastStream 的一个订阅者，迭代得到与上游相同的片段"""
+
+    def __init__(self, broadcast: "BroadcastStream", cursor: int):
+        self._broadcast = broadcast
+        self._cursor = cursor
+        self._closed = False
+
+    def __iter__(self) -> "Subscription":
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        broadcast = self._broadcast
+        with broadcast._cond:
+            while True:
+                if self._closed:
+                    raise StopIteration
+                if self._cursor < broadcast._offset:
+                    missed = broadcast._offset - self._cursor
+                    self._leave()
+                    raise SubscriberLagged(missed)
+                index = self._cursor - broadcast._offset
+                if index < len(broadcast._history):
+                    self._cursor += 1
+                    return broadcast._history[index]
+                if broadcast._done:
+                    self._leave()
+                    if broadcast._error is not None:
+                        raise broadcast._error
+                    raise StopIteration
+                broadcast._cond.wait()
+
+    @property
+    def result(self):
+        """上游的 result（ChatStream 读取结束后为 ChatResult）"""
+        return self._broadcast.result
+
+    def _leave(self) -> None:
+        # 调用方需持有 broadcast._cond
+        if not self._closed:
+            self._closed = True
+            self._broadcast._unsubscribe()
+
+    def close(self) -> None:
+        """退出订阅（可以在其他线程调用，正在等待的读取随即结束）"""
+        with self._broadcast._cond:
+            self._leave()
+            self._broadcast._cond.notify_all()
+
+class BroadcastStream:
+    """把一个流式输出分发给多个订阅者
+
+    Args:
+        source: 上游事件迭代器，通常是 ask(stream=True) 返回的 ChatStream
+        max_history: 保留最近多少个片段，None 表示全部保留（后加入的订阅者可以完整回放）
+        auto_close: 所有订阅者都退出且上游尚未结束时，关闭上游（取消请求）
+    """
+
+    def __init__(self, source: Iterable[Dict[str, Any]], max_history: Optional[int] = None,
+                 auto_close: bool = False):
+        if max_history is not None and max_history <= 0:
+            raise ValueError("max_history 必须大于 0")
+        self.source = source
+        self.auto_close = auto_close
+        self._history: deque = deque(maxlen=max_history)
+        self._offset = 0  # 历史中第一个片段的序号
+        self._cond = threading.Condition()
+        self._done = False
+        self._error: Optional[Exception] = None
+        self._subscribers = 0
+        self._thread = threading.Thread(target=self._pump, name="ai-palette-broadcast", daemon=True)
+        self._thread.start()
+
+    def _pump(self) -> None:
+        """后台线程：读取上游并追加到历史"""
+        try:
+            for event in self.source:
+                with self._cond:
+                    if len(self._history) == self._history.maxlen:
+                        self._offset += 1
+                    self._history.append(event)
+                    self._cond.notify_all()
+        except Exception as e:
+            self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def subscribe(self, replay: bool = True) -> Subscription:
+        """新增订阅者
+
+        Args:
+            replay: 是否先回放历史中已有的片段，False 时只接收之后的片段
+        """
+        with self._cond:
+            self._subscribers += 1
+            cursor = self._offset if replay else self._offset + len(self._history)
+            return Subscription(self, cursor)
+
+    def _unsubscribe(self) -> None:
+        # 调用方需持有 _cond
+        self._subscribers -= 1
+        if self._subscribers == 0 and self.auto_close and not self._done:
+            threading.Thread(target=self.close, daemon=True).start()
+
+    @property
+    def subscribers(self) -> int:
+        """当前订阅者数量"""
+        return self._subscribers
+
+    @property
+    def done(self) -> bool:
+        """上游是否已经结束"""
+        return self._done
+
+    @property
+    def result(self):
+        """上游的 result（ChatStream 读取结束后为 ChatResult），其他上游为 None"""
+        return getattr(self.source, "result", None)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """等待上游结束
+
+        Returns:
+            bool: 上游是否已经结束
+        """
+        self._thread.join(timeout)
+        return self._done
+
+    def close(self) -> None:
+        """关闭上游（ChatStream 会立即断开连接），订阅者读完已有片段后收到上游的异常或结束"""
+        close = getattr(self.source, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # 普通生成器正在后台线程中执行，无法从外部关闭
+                pass
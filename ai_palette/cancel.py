@@ -0,0 +1,57 @@
+import threading
+from typing import Callable, List
+
+class RequestCancelled(Exception):
+    """请求已被取消（CancelToken.cancel() 或 ChatStream.close()）"""
+
+class CancelToken:
+    """取消令牌
+
+    可以在任意线程调用 cancel()：正在进行的流式请求会立即关闭上游连接，读取方收到
+    RequestCancelled；尚未发出的请求不再发送。一个令牌可以同时用于多个请求。
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """取消，并执行已注册的回调（只执行一次）"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """注册取消时执行的回调，已取消时立即执行
+
+        Returns:
+            Callable[[], None]: 调用后取消注册
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        """已取消时抛出 RequestCancelled"""
+        if self._event.is_set():
+            raise RequestCancelled("请求已取消")
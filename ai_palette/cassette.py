@@ -0,0 +1,319 @@
+"""请求录制与回放
+
+录制模式下，真实的供应商请求照常发出，同时把请求和响应（包括流式响应中每个数据块
+到达的时间）追加写入 cassette 文件（JSON Lines，每行一次交互）。回放模式下不访问网络，
+按原始速度或尽快把录制的响应交给 AIChat，解析、指标和钩子都和真实请求一样执行。
+
+请求头不会被录制；URL 中的 client_id/client_secret 等参数会被去掉。
+
+    from ai_palette import AIChat, Cassette
+
+    chat = AIChat(provider="deepseek", model="deepseek-chat", cassette=Cassette("deepseek.jsonl", mode="record"))
+    ...
+    chat = AIChat(provider="deepseek", model="deepseek-chat", api_key="any",
+                  cassette=Cassette("deepseek.jsonl", mode="replay", speed=0))
+"""
+import os
+import json
+import time
+import base64
+import itertools
+import threading
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .transport import POOL_MAXSIZE, _TracingAdapter
+
+MODES = ("record", "replay", "auto")
+
+# URL 中不写入 cassette 的查询参数
+SECRET_PARAMS = {"client_id", "client_secret", "access_token", "api_key", "key"}
+
+# 回放时不还原的响应头（录制的是已解码的内容）
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "set-cookie", "connection"}
+
+class CassetteMiss(ValueError):
+    """回放时找不到匹配的录制请求"""
+
+def _redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in SECRET_PARAMS]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+def _parse_body(body: Any) -> Any:
+    """把请求体转换为可写入 JSON 的形式"""
+    if body is None:
+        return None
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body
+
+def _match_key(method: str, url: str, body: Any) -> Tuple[str, str, str]:
+    return (method.upper(), url, json.dumps(body, sort_keys=True, ensure_ascii=False))
+
+def _url_key(method: str, url: str, body: Any) -> Tuple[str, str, bool]:
+    # 只按 URL 匹配时仍需区分流式和普通请求
+    stream = bool(body.get("stream")) if isinstance(body, dict) else False
+    return (method.upper(), url, stream)
+
+def _encode_chunk(offset: float, data: bytes) -> Dict[str, Any]:
+    try:
+        return {"t": round(offset, 6), "data": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        # 多字节字符被拆到两个数据块时保留原始字节
+        return {"t": round(offset, 6), "b64": base64.b64encode(data).decode("ascii")}
+
+def _decode_chunk(chunk: Dict[str, Any]) -> Tuple[float, bytes]:
+    if "b64" in chunk:
+        return chunk["t"], base64.b64decode(chunk["b64"])
+    return chunk["t"], chunk["data"].encode("utf-8")
+
+class _RecordingBody:
+    """包装 urllib3 响应体，记录每个数据块及其到达时间"""
+
+    def __init__(self, raw, started: float, on_finish):
+        self._raw = raw
+        self._started = started
+        self._on_finish = on_finish
+        self._chunks: List[Dict[str, Any]] = []
+        self._finished = False
+
+    def _record(self, data: bytes) -> None:
+        if data:
+            self._chunks.append(_encode_chunk(time.perf_counter() - self._started, data))
+
+    def _finish(self, complete: bool) -> None:
+        if not self._finished:
+            self._finished = True
+            self._on_finish(self._chunks, complete)
+
+    def stream(self, amt: int = 2 ** 16, decode_content: bool = True) -> Iterator[bytes]:
+        for data in self._raw.stream(amt, decode_content=decode_content):
+            self._record(data)
+            yield data
+        self._finish(True)
+
+    def read(self, amt: Optional[int] = None, decode_content: bool = True, **kwargs) -> bytes:
+        data = self._raw.read(amt, decode_content=decode_content, **kwargs)
+        self._record(data)
+        if not data or amt is None:
+            self._finish(True)
+        return data
+
+    def close(self) -> None:
+        self._finish(False)
+        self._raw.close()
+
+    def release_conn(self) -> None:
+        self._raw.release_conn()
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+class _ReplayBody:
+    """按录制的时间间隔（除以 speed）输出数据块"""
+
+    def __init__(self, chunks: List[Dict[str, Any]], started: float, speed: float):
+        self._chunks = [_decode_chunk(chunk) for chunk in chunks]
+        self._started = started
+        self._speed = speed
+        self._index = 0
+        self._closed = False
+
+    def _wait(self, offset: float) -> None:
+        if self._speed > 0:
+            delay = self._started + offset / self._speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def stream(self, amt: int = 2 ** 16, decode_content: bool = True) -> Iterator[bytes]:
+        while not self._closed and self._index < len(self._chunks):
+            offset, data = self._chunks[self._index]
+            self._index += 1
+            self._wait(offset)
+            yield data
+
+    def read(self, amt: Optional[int] = None, **kwargs) -> bytes:
+        return b"".join(self.stream())
+
+    def close(self) -> None:
+        self._closed = True
+
+    def release_conn(self) -> None:
+        pass
+
+class _RecordAdapter(_TracingAdapter):
+    """发出真实请求并把交互写入 cassette"""
+
+    def __init__(self, cassette: "Cassette", **kwargs):
+        super().__init__(**kwargs)
+        self._cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.perf_counter()
+        response = super().send(request, stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        headers_at = time.perf_counter() - started
+        entry = {
+            "request": {
+                "method": request.method,
+                "url": _redact_url(request.url),
+                "body": _parse_body(request.body)
+            },
+            "response": {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": {k: v for k, v in response.headers.items() if k.lower() not in _DROP_HEADERS},
+                "elapsed": round(headers_at, 6)
+            }
+        }
+
+        def on_finish(chunks: List[Dict[str, Any]], complete: bool) -> None:
+            entry["response"]["chunks"] = chunks
+            entry["response"]["complete"] = complete
+            self._cassette.append(entry)
+
+        response.raw = _RecordingBody(response.raw, started, on_finish)
+        return response
+
+class _ReplayAdapter(requests.adapters.BaseAdapter):
+    """从 cassette 构造响应，不访问网络"""
+
+    def __init__(self, cassette: "Cassette"):
+        super().__init__()
+        self._cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        started = time.perf_counter()
+        entry = self._cassette.match(request.method, request.url, request.body)
+        recorded = entry["response"]
+        speed = self._cassette.speed
+        if speed > 0 and recorded.get("elapsed"):
+            time.sleep(recorded["elapsed"] / speed)
+
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.reason = recorded.get("reason") or ""
+        response.headers = CaseInsensitiveDict(recorded.get("headers", {}))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _ReplayBody(recorded.get("chunks", []), started, speed)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self) -> None:
+        pass
+
+class Cassette:
+    """录制/回放的供应商交互文件
+
+    Args:
+        path: cassette 文件路径（JSON Lines）
+        mode: "record" 录制（追加写入），"replay" 回放，"auto" 文件存在时回放、否则录制
+        speed: 回放速度倍数，1.0 为原始速度，0 表示不等待、尽快输出
+    """
+
+    def __init__(self, path: str, mode: str = "auto", speed: float = 1.0):
+        if mode not in MODES:
+            raise ValueError(f"不支持的 cassette 模式: {mode}，可选值：{', '.join(MODES)}")
+        if speed < 0:
+            raise ValueError("回放速度不能为负数")
+        if mode == "auto":
+            mode = "replay" if os.path.exists(path) else "record"
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._exact: Dict[Tuple[str, str, str], Iterator[Dict[str, Any]]] = {}
+        self._by_url: Dict[Tuple[str, str, bool], Iterator[Dict[str, Any]]] = {}
+        if mode == "replay":
+            self._load()
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            raise ValueError(f"cassette 文件不存在: {self.path}")
+        exact: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = {}
+        by_url: Dict[Tuple[str, str, bool], List[Dict[str, Any]]] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                request = entry["request"]
+                exact.setdefault(_match_key(request["method"], request["url"], request.get("body")), []).append(entry)
+                by_url.setdefault(_url_key(request["method"], request["url"], request.get("body")), []).append(entry)
+        # 同一请求录制了多次时依次循环回放
+        self._exact = {key: itertools.cycle(entries) for key, entries in exact.items()}
+        self._by_url = {key: itertools.cycle(entries) for key, entries in by_url.items()}
+
+    def match(self, method: str, url: str, body: Any) -> Dict[str, Any]:
+        """查找与请求匹配的录制交互
+
+        优先匹配方法、URL 和请求体都相同的交互；找不到时使用同一 URL、同为流式或普通请求的
+        任意交互，这样可以用少量录制驱动任意提示词的压测。
+
+        Raises:
+            CassetteMiss: 没有录制过该 URL 的请求
+        """
+        url = _redact_url(url)
+        body = _parse_body(body)
+        with self._lock:
+            entries = self._exact.get(_match_key(method, url, body)) or self._by_url.get(_url_key(method, url, body))
+            if entries is None:
+                raise CassetteMiss(f"cassette {self.path} 中没有 {method} {url} 的录制")
+            return next(entries)
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        """追加一条录制的交互"""
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def session(self) -> requests.Session:
+        """获取挂载了录制或回放适配器的会话"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    if self.replaying:
+                        adapter = _ReplayAdapter(self)
+                    else:
+                        adapter = _RecordAdapter(self, pool_connections=16, pool_maxsize=POOL_MAXSIZE)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+_cassettes: Dict[Tuple[str, str, float], Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+def get_cassette(path: str, mode: str = "auto", speed: float = 1.0) -> Cassette:
+    """按路径获取共享的 Cassette 实例（同一文件只加载一次）"""
+    key = (os.path.abspath(path), mode, speed)
+    with _cassettes_lock:
+        cassette = _cassettes.get(key)
+        if cassette is None:
+            cassette = _cassettes[key] = Cassette(path, mode, speed)
+        return cassette
+
+def cassette_from_env() -> Optional[Cassette]:
+    """根据环境变量 AI_PALETTE_CASSETTE / AI_PALETTE_CASSETTE_MODE / AI_PALETTE_REPLAY_SPEED 获取 Cassette"""
+    path = os.getenv("AI_PALETTE_CASSETTE")
+    if not path:
+        return None
+    return get_cassette(path, os.getenv("AI_PALETTE_CASSETTE_MODE", "auto"),
+                        float(os.getenv("AI_PALETTE_REPLAY_SPEED", "1.0")))
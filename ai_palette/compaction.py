@@ -0,0 +1,119 @@
+"""长对话的上下文压缩
+
+对话的 prompt token 超过阈值后，在后台线程中用一个便宜的模型（例如本地 Ollama）把较早的
+对话总结成摘要，替换掉这些消息；之后的请求只携带摘要和最近几轮对话。压缩不在请求路径上，
+下一次 ask() 不会等待它，压缩完成前照常发送完整上下文。
+
+    from ai_palette import AIChat, ContextCompactor
+
+    compactor = ContextCompactor(AIChat(provider="ollama", model="qwen2.5:3b"), max_tokens=8000)
+    chat = AIChat(provider="deepseek", model="deepseek-chat", compactor=compactor)
+"""
+import threading
+from typing import Optional, List, Dict
+
+from . import AIChat, Conversation, Message, logger
+
+DEFAULT_PROMPT = """请把下面的对话历史压缩成一段简洁的摘要，保留用户的目标、偏好、已确定的事实和结论，以及尚未解决的问题。只输出摘要本身。
+
+[$summary$]
+[$history$]"""
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符按 1 个 token，其余按 4 个字符 1 个 token"""
+    cjk = sum(1 for ch in text if ch >= "⺀")
+    return cjk + (len(text) - cjk + 3) // 4
+
+class ContextCompactor:
+    """在后台把对话中较早的消息总结为摘要
+
+    Args:
+        chat: 用于生成摘要的 AIChat（建议使用便宜或本地的模型）
+        max_tokens: 对话的 prompt token 超过该值时触发压缩
+        keep_recent: 保留不压缩的最近消息条数
+        prompt: 摘要提示词模板，[$summary$] 为已有摘要，[$history$] 为待压缩的对话
+    """
+
+    def __init__(self, chat: AIChat, max_tokens: int = 4000, keep_recent: int = 6, prompt: str = DEFAULT_PROMPT):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens 必须大于 0")
+        if keep_recent < 0:
+            raise ValueError("keep_recent 不能为负数")
+        self.chat = chat
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.prompt = prompt
+        self._lock = threading.Lock()
+        self._running: Dict[int, threading.Thread] = {}
+
+    def estimate(self, conversation: Conversation) -> int:
+        """估算对话的 prompt token 数"""
+        return sum(estimate_tokens(msg["content"]) for msg in conversation.to_dicts())
+
+    def _build_prompt(self, summary: Optional[str], messages: List[Message]) -> str:
+        roles = {"user": "用户", "assistant": "助手"}
+        history = "\n".join(f"{roles.get(msg.role, msg.role)}：{msg.content}" for msg in messages)
+        previous = f"已有摘要：\n{summary}\n" if summary else ""
+        return self.prompt.replace("[$summary$]", previous).replace("[$history$]", f"对话：\n{history}")
+
+    def compact(self, conversation: Conversation) -> bool:
+        """立即压缩（同步执行）
+
+        Returns:
+            bool: 是否替换了消息；消息数不超过 keep_recent 或摘要为空时返回 False
+        """
+        with conversation.lock:
+            count = len(conversation.messages) - self.keep_recent
+            if count <= 0:
+                return False
+            old = conversation.messages[:count]
+            summary = conversation.summary
+        content = str(self.chat.ask(self._build_prompt(summary, old), stream=False, conversation=Conversation()))
+        if not content.strip():
+            return False
+        with conversation.lock:
+            # 压缩期间对话可能被清空或改写，只有前面的消息没变时才替换
+            if conversation.messages[:count] != old or conversation.summary != summary:
+                return False
+            del conversation.messages[:count]
+            conversation.summary = content.strip()
+        logger.info(f"上下文压缩完成：{count} 条消息替换为 {estimate_tokens(content)} token 的摘要")
+        return True
+
+    def maybe_compact(self, conversation: Conversation, prompt_tokens: Optional[int] = None) -> bool:
+        """超过阈值时在后台线程中压缩，立即返回
+
+        Args:
+            conversation: 要压缩的对话
+            prompt_tokens: 上一次请求实际的 prompt token 数（来自 usage），为空时按字符估算
+
+        Returns:
+            bool: 是否启动了压缩
+        """
+        tokens = prompt_tokens if prompt_tokens else self.estimate(conversation)
+        if tokens <= self.max_tokens or len(conversation.messages) <= self.keep_recent:
+            return False
+        key = id(conversation)
+        with self._lock:
+            if key in self._running:
+                return False
+            thread = threading.Thread(target=self._run, args=(conversation,), daemon=True)
+            self._running[key] = thread
+        thread.start()
+        return True
+
+    def _run(self, conversation: Conversation) -> None:
+        try:
+            self.compact(conversation)
+        except Exception as e:
+            logger.warning(f"上下文压缩失败，保留原始消息：{e}")
+        finally:
+            with self._lock:
+                self._running.pop(id(conversation), None)
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """等待正在进行的压缩完成"""
+        with self._lock:
+            threads = list(self._running.values())
+        for thread in threads:
+            thread.join(timeout)
@@ -0,0 +1,61 @@
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Callable
+
+# 请求生命周期事件
+REQUEST_BUILT = "request_built"              # 请求体已序列化，size 为请求体字节数
+CONNECTION_ACQUIRED = "connection_acquired"  # 从连接池取得连接，data["reused"] 表示是否复用（HTTP/2 传输不触发）
+RESPONSE_HEADERS = "response_headers"        # 收到响应头，data["status_code"]、data["http_version"]（仅 HTTP/2 传输）
+FIRST_CHUNK = "first_chunk"                  # 流式请求的第一个片段
+CHUNK = "chunk"                              # 流式请求的每个片段，size 为片段字符数
+RETRY = "retry"                              # 即将重试，data["attempt"]、data["error"]
+COMPLETE = "complete"                        # 请求完成，size 为响应字节数
+ERROR = "error"                              # 请求失败，data["error"]
+
+EVENTS = (REQUEST_BUILT, CONNECTION_ACQUIRED, RESPONSE_HEADERS, FIRST_CHUNK, CHUNK, RETRY, COMPLETE, ERROR)
+
+@dataclass
+class HookEvent:
+    """请求生命周期事件
+
+    timestamp_ns 来自 time.perf_counter_ns()，只适合计算同一进程内的时间差。
+    同一次请求（同一次重试尝试）的所有事件共享 request_id。
+    """
+    name: str
+    timestamp_ns: int
+    provider: str
+    model: str
+    request_id: int
+    size: Optional[int] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+
+HookCallback = Callable[[HookEvent], None]
+
+# 全局钩子，对所有 AIChat 实例生效
+global_hooks: List[HookCallback] = []
+
+_request_ids = itertools.count(1)
+_local = threading.local()
+
+def add_hook(callback: HookCallback) -> None:
+    """注册全局钩子"""
+    if callback not in global_hooks:
+        global_hooks.append(callback)
+
+def remove_hook(callback: HookCallback) -> None:
+    """移除全局钩子"""
+    if callback in global_hooks:
+        global_hooks.remove(callback)
+
+def next_request_id() -> int:
+    """分配新的请求 ID"""
+    return next(_request_ids)
+
+def set_current_request(request_id: Optional[int]) -> None:
+    """记录当前线程正在进行的请求（用于重试事件关联）"""
+    _local.request_id = request_id
+
+def current_request() -> Optional[int]:
+    """获取当前线程正在进行的请求 ID"""
+    return getattr(_local, "request_id", None)
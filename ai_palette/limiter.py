@@ -0,0 +1,136 @@
+"""自适应并发限制（AIMD）
+
+按供应商/模型限制同时进行的请求数，并根据结果自动调整上限：
+- 请求正常且上限已用满时，上限加性增长（每完成约 limit 个请求加 1）
+- 收到 429、5xx、超时，或延迟明显高于平时时，上限乘性下降；同一次拥塞只下降一次
+
+    from ai_palette import AIChat
+
+    chat = AIChat(provider="deepseek", model="deepseek-chat", limiter=True)  # 同一供应商/模型共享一个限制器
+
+也可以设置环境变量 AI_PALETTE_ADAPTIVE_CONCURRENCY=1 对所有实例生效。
+"""
+import time
+import threading
+from typing import Optional, Dict, Tuple
+
+def is_overload(error: BaseException) -> bool:
+    """错误是否表示供应商过载：429、5xx 或超时"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, TimeoutError) or type(error).__name__ in ("ConnectTimeout", "ReadTimeout")
+
+class AdaptiveLimiter:
+    """AIMD 并发限制器（线程安全）
+
+    Args:
+        initial_limit: 初始并发上限
+        min_limit: 并发上限的最小值
+        max_limit: 并发上限的最大值
+        backoff: 过载时上限乘以的系数
+        latency_tolerance: 延迟超过平时（指数移动平均）的多少倍视为过载
+        min_samples: 积累多少个正常样本后才按延迟判断过载
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.5,
+                 latency_tolerance: float = 2.0, min_samples: int = 5):
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError("需要满足 1 <= min_limit <= initial_limit <= max_limit")
+        if not 0 < backoff < 1:
+            raise ValueError("backoff 必须在 0 和 1 之间")
+        if latency_tolerance <= 1:
+            raise ValueError("latency_tolerance 必须大于 1")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.min_samples = min_samples
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._baseline: Optional[float] = None  # 正常请求延迟的指数移动平均
+        self._samples = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限"""
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        """正在进行的请求数"""
+        return self._in_flight
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        """等待一个并发名额
+
+        Returns:
+            float: 许可（请求开始的时间），完成后传给 release()
+
+        Raises:
+            TimeoutError: timeout 秒内没有空闲名额
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._in_flight < int(self._limit), timeout):
+                raise TimeoutError(f"等待并发名额超时（{timeout} 秒）")
+            self._in_flight += 1
+        return time.monotonic()
+
+    def release(self, permit: float, error: Optional[BaseException] = None, sample: bool = True,
+                latency: Optional[float] = None) -> None:
+        """归还名额并根据结果调整上限
+
+        Args:
+            permit: acquire() 返回的许可
+            error: 请求失败时的异常
+            sample: 是否作为调整依据，被调用方取消的请求传 False
+            latency: 用于判断延迟是否异常的耗时，默认为从 acquire() 到现在（流式请求可以传首字耗时）
+        """
+        now = time.monotonic()
+        if latency is None:
+            latency = now - permit
+        with self._cond:
+            saturated = self._in_flight >= int(self._limit)
+            self._in_flight -= 1
+            if sample:
+                if error is not None:
+                    if is_overload(error):
+                        self._decrease(permit, now)
+                else:
+                    spike = (self._samples >= self.min_samples
+                             and latency > self._baseline * self.latency_tolerance)
+                    self._samples += 1
+                    self._baseline = latency if self._baseline is None else self._baseline + 0.1 * (latency - self._baseline)
+                    if spike:
+                        self._decrease(permit, now)
+                    elif saturated:
+                        self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+            self._cond.notify_all()
+
+    def _decrease(self, permit: float, now: float) -> None:
+        # 上一次下降之前发出的请求反映的是旧的并发度，不再重复下降
+        if permit < self._last_decrease:
+            return
+        self._limit = max(self._limit * self.backoff, self.min_limit)
+        self._last_decrease = now
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    """获取进程内按供应商/模型共享的限制器"""
+    key = (provider, model)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = AdaptiveLimiter()
+        return limiter
+
+def get_limiters() -> Dict[Tuple[str, str], AdaptiveLimiter]:
+    """当前所有共享限制器：{(供应商, 模型): 限制器}"""
+    with _limiters_lock:
+        return dict(_limiters)
@@ -0,0 +1,226 @@
+import threading
+from bisect import bisect_left
+from typing import Optional, List, Dict, Tuple, Any
+
+# 默认分桶（秒），覆盖从几十毫秒的首字延迟到数分钟的长推理
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# 吞吐分桶（token/秒或片段/秒）
+RATE_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+# 报文大小分桶（字节）
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+LabelValues = Tuple[str, ...]
+
+class Histogram:
+    """固定分桶直方图（Prometheus 语义：累积计数 + sum + count）"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶是 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """记录一个观测值（调用方负责加锁）"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """根据分桶估算分位数（桶内线性插值）"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, upper in enumerate(self.buckets):
+            if seen + self.counts[i] >= rank:
+                if self.counts[i] == 0:
+                    return upper
+                return lower + (upper - lower) * (rank - seen) / self.counts[i]
+            seen += self.counts[i]
+            lower = upper
+        return self.buckets[-1] if self.buckets else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """导出当前状态"""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": cumulative,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+class _Family:
+    """一组同名、不同标签值的指标"""
+
+    def __init__(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...],
+                 buckets: Optional[Tuple[float, ...]] = None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.values: Dict[LabelValues, Any] = {}
+
+class MetricsRegistry:
+    """进程内指标注册表
+
+    所有写操作共用一把锁，每次记录只有一次字典查找和几次加法，
+    对请求热路径的开销可以忽略。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, _Family] = {}
+        self.enabled = True
+
+    def _family(self, name: str, kind: str, help_text: str, labels: Tuple[str, ...],
+                buckets: Optional[Tuple[float, ...]] = None) -> _Family:
+        family = self._families.get(name)
+        if family is None:
+            family = _Family(name, kind, help_text, labels, buckets)
+            self._families[name] = family
+        return family
+
+    def register_counter(self, name: str, help_text: str, labels: Tuple[str, ...]) -> None:
+        """注册计数器"""
+        with self._lock:
+            self._family(name, "counter", help_text, labels)
+
+    def register_histogram(self, name: str, help_text: str, labels: Tuple[str, ...],
+                           buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        """注册直方图"""
+        with self._lock:
+            self._family(name, "histogram", help_text, labels, buckets)
+
+    def inc(self, name: str, labels: LabelValues, value: float = 1) -> None:
+        """计数器累加"""
+        if not self.enabled:
+            return
+        with self._lock:
+            values = self._families[name].values
+            values[labels] = values.get(labels, 0) + value
+
+    def observe(self, name: str, labels: LabelValues, value: float) -> None:
+        """直方图记录观测值"""
+        if not self.enabled:
+            return
+        with self._lock:
+            family = self._families[name]
+            histogram = family.values.get(labels)
+            if histogram is None:
+                histogram = family.values[labels] = Histogram(family.buckets)
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        """清空所有已记录的数据（保留指标定义）"""
+        with self._lock:
+            for family in self._families.values():
+                family.values.clear()
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        """以字典形式导出所有指标
+
+        Returns:
+            Dict: 指标名 -> [{"labels": {...}, "value": ...} 或 {"labels": {...}, "count": ..., "p50": ...}]
+        """
+        result = {}
+        with self._lock:
+            for name, family in self._families.items():
+                series = []
+                for label_values, value in family.values.items():
+                    entry = {"labels": dict(zip(family.labels, label_values))}
+                    if family.kind == "histogram":
+                        entry.update(value.snapshot())
+                    else:
+                        entry["value"] = value
+                    series.append(entry)
+                result[name] = series
+        return result
+
+    def render_prometheus(self) -> str:
+        """导出 Prometheus 文本格式"""
+        lines = []
+        with self._lock:
+            for name, family in self._families.items():
+                lines.append(f"# HELP {name} {family.help}")
+                lines.append(f"# TYPE {name} {family.kind}")
+                for label_values, value in family.values.items():
+                    pairs = [f'{key}="{_escape(val)}"' for key, val in zip(family.labels, label_values)]
+                    if family.kind == "counter":
+                        lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _format_value(bound)
+                        le_pair = f'le="{le}"'
+                        lines.append(f"{name}_bucket{_format_labels(pairs + [le_pair])} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value.sum)}")
+                    lines.append(f"{name}_count{_format_labels(pairs)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(pairs: List[str]) -> str:
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+# 全局注册表及内置指标
+registry = MetricsRegistry()
+
+_REQUEST_LABELS = ("provider", "model", "stream")
+_MODEL_LABELS = ("provider", "model")
+
+registry.register_counter("ai_palette_requests_total", "请求总数（按结果分类）", _REQUEST_LABELS + ("status",))
+registry.register_counter("ai_palette_errors_total", "请求错误数（按错误类别分类）", _MODEL_LABELS + ("error",))
+registry.register_counter("ai_palette_retries_total", "重试次数", _MODEL_LABELS)
+registry.register_histogram("ai_palette_request_duration_seconds", "请求总耗时（秒）", _REQUEST_LABELS)
+registry.register_histogram("ai_palette_time_to_first_token_seconds", "流式请求首个片段耗时（秒）", _MODEL_LABELS)
+registry.register_histogram("ai_palette_stream_tokens_per_second",
+                            "流式输出速度（token/秒，按供应商返回的 completion_tokens 计算，首个片段之后）",
+                            _MODEL_LABELS, buckets=RATE_BUCKETS)
+registry.register_histogram("ai_palette_stream_chunks_per_second", "流式输出速度（片段/秒，首个片段之后）",
+                            _MODEL_LABELS, buckets=RATE_BUCKETS)
+registry.register_histogram("ai_palette_request_bytes", "请求体大小（字节）", _MODEL_LABELS, buckets=SIZE_BUCKETS)
+registry.register_histogram("ai_palette_response_bytes", "响应体大小（字节）", _MODEL_LABELS, buckets=SIZE_BUCKETS)
+registry.register_counter("ai_palette_tokens_total", "供应商返回的 token 用量（按类型分类）", _MODEL_LABELS + ("type",))
+
+def get_metrics() -> Dict[str, List[Dict[str, Any]]]:
+    """获取全局指标快照"""
+    return registry.snapshot()
+
+def render_prometheus() -> str:
+    """以 Prometheus 文本格式导出全局指标"""
+    return registry.render_prometheus()
+
+def reset_metrics() -> None:
+    """清空全局指标"""
+    registry.reset()
+
+def set_metrics_enabled(enabled: bool) -> None:
+    """开启或关闭指标采集"""
+    registry.enabled = enabled
+
+def error_class(error: BaseException) -> str:
+    """获取错误类别：HTTP 错误返回 http_<状态码>，其他返回异常类名"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    if status is not None:
+        return f"http_{status}"
+    return type(error).__name__
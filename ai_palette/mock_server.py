@@ -0,0 +1,456 @@
+"""本地模拟供应商服务
+
+按照 AIChat 对各个 APIProvider 的解析方式返回响应，用于离线测试和压测：
+
+- OpenAI 格式（openai、zhipu、minimax、ernie）：choices[].message / choices[].delta 的 SSE 流
+- DeepSeek / SiliconFlow：先输出 reasoning_content 增量，再输出 content 增量
+- Dashscope：第一个片段只包含 role，结束片段带 finish_reason="stop"
+- Ollama：NDJSON 流，最后一行 done=true；另外提供 /api/tags 和 /api/ps，按 keep_alive 模拟模型的加载和卸载
+- ERNIE：额外提供 /oauth/2.0/token 鉴权接口
+
+每个供应商挂在自己的路径前缀下，例如 http://127.0.0.1:port/deepseek/chat/completions。
+
+命令行启动：python -m ai_palette.mock_server --port 18001 --latency 0.2 --token-rate 50
+"""
+import json
+import time
+import random
+import argparse
+import sys
+import threading
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, List, Dict, Any, Tuple
+
+from .ollama import parse_keep_alive, normalize_model
+
+PROVIDERS = ("openai", "ernie", "dashscope", "ollama", "zhipu", "minimax", "deepseek", "siliconflow")
+
+# 各供应商的聊天接口路径（不含供应商前缀）
+CHAT_PATHS = {
+    "openai": "/v1/chat/completions",
+    "ernie": "/chat/completions",
+    "dashscope": "/compatible-mode/v1/chat/completions",
+    "ollama": "/api/chat",
+    "zhipu": "/api/paas/v4/chat/completions",
+    "minimax": "/v1/chat/completions",
+    "deepseek": "/chat/completions",
+    "siliconflow": "/chat/completions"
+}
+
+DEFAULT_RESPONSE = "这是来自模拟服务的回答，用于离线测试 AI Palette 的请求和流式解析。"
+DEFAULT_REASONING = "先分析问题，再组织答案。"
+
+@dataclass
+class MockConfig:
+    """模拟服务行为配置"""
+    latency: float = 0.0            # 返回响应头前的等待时间（秒）
+    token_rate: float = 0.0         # 流式输出速度（片段/秒），0 表示不限速
+    response_text: str = DEFAULT_RESPONSE
+    reasoning_text: str = DEFAULT_REASONING  # 仅 deepseek/siliconflow 输出
+    chunk_size: int = 2             # 每个流式片段包含的字符数
+    error_rate: float = 0.0         # 返回 500 的概率
+    rate_limit_rate: float = 0.0    # 返回 429 的概率
+    rate_limit_every: int = 0       # 每 N 个请求返回一次 429，0 表示不启用
+    require_auth: bool = True       # 非 Ollama 请求是否检查 Authorization
+    load_latency: float = 0.0       # Ollama 加载未驻留模型的时间（秒）
+    seed: Optional[int] = None
+
+def split_chunks(text: str, size: int) -> List[str]:
+    """按固定字符数切分文本"""
+    size = max(size, 1)
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "_MockHTTPServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- 通用写入 ----
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Request-Id", self.server.owner.next_request_id())
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Request-Id", self.server.owner.next_request_id())
+        self.end_headers()
+
+    def _write_chunk(self, data: str) -> None:
+        payload = data.encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self) -> None:
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except json.JSONDecodeError:
+            return {}
+
+    def _split_path(self) -> Tuple[str, str]:
+        path = self.path.split("?", 1)[0]
+        parts = path.split("/", 2)
+        provider = parts[1] if len(parts) > 1 else ""
+        rest = "/" + parts[2] if len(parts) > 2 else "/"
+        return provider, rest
+
+    # ---- 路由 ----
+    def do_GET(self):
+        provider, rest = self._split_path()
+        if provider == "ollama" and rest == "/api/tags":
+            models = [{"name": name} for name in self.server.owner.ollama_models]
+            self._send_json(200, {"models": models})
+        elif provider == "ollama" and rest == "/api/ps":
+            self._send_json(200, {"models": self.server.owner.ollama_running()})
+        elif rest in ("/", "/health"):
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        owner = self.server.owner
+        provider, rest = self._split_path()
+        body = self._read_body()
+
+        if provider == "ernie" and rest.startswith("/oauth/2.0/token"):
+            owner.record(provider, rest, body)
+            self._send_json(200, {"access_token": owner.ernie_token, "expires_in": 2592000})
+            return
+
+        if provider not in CHAT_PATHS or rest != CHAT_PATHS[provider]:
+            self._send_json(404, {"error": {"message": f"未知路径: {self.path}"}})
+            return
+
+        owner.record(provider, rest, body)
+        config = owner.config
+        status = owner.inject_failure()
+
+        if config.latency:
+            time.sleep(config.latency)
+
+        if status is not None:
+            message = "Rate limit exceeded" if status == 429 else "Injected server error"
+            self._send_json(status, {"error": {"message": message}})
+            return
+
+        if config.require_auth and provider != "ollama":
+            auth = self.headers.get("Authorization", "")
+            expected = f"Bearer {owner.ernie_token}" if provider == "ernie" else None
+            if not auth.startswith("Bearer ") or (expected and auth != expected):
+                self._send_json(401, {"error": {"message": "Unauthorized"}})
+                return
+
+        model = body.get("model", "mock-model")
+        if provider == "ollama":
+            if owner.load_ollama(model, body.get("keep_alive")) and config.load_latency:
+                time.sleep(config.load_latency)
+            if not body.get("messages"):
+                # 不带消息：只加载（keep_alive=0 时卸载）模型
+                done_reason = "unload" if body.get("keep_alive") == 0 else "load"
+                self._send_json(200, {"model": model, "message": {"role": "assistant", "content": ""},
+                                      "done": True, "done_reason": done_reason})
+                return
+        reasoning = config.reasoning_text if provider in ("deepseek", "siliconflow") else ""
+
+        if body.get("stream"):
+            if provider == "ollama":
+                self._stream_ollama(model)
+            else:
+                self._stream_openai(provider, model, reasoning)
+        else:
+            self._send_json(200, owner.build_completion(provider, model, reasoning))
+
+    # ---- 流式响应 ----
+    def _pace(self, started: float, index: int) -> None:
+        rate = self.server.owner.config.token_rate
+        if rate > 0:
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _stream_openai(self, provider: str, model: str, reasoning: str) -> None:
+        config = self.server.owner.config
+        created = int(time.time())
+        completion_id = f"chatcmpl-{self.server.owner.next_request_id()}"
+
+        def frame(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            payload.update(extra)
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        self._start_stream("text/event-stream")
+        try:
+            if provider == "dashscope":
+                self._write_chunk(frame({"role": "assistant", "content": ""}))
+            pieces = [("reasoning_content", piece) for piece in split_chunks(reasoning, config.chunk_size)] if reasoning else []
+            pieces += [("content", piece) for piece in split_chunks(config.response_text, config.chunk_size)]
+            started = time.perf_counter()
+            for index, (key, piece) in enumerate(pieces):
+                self._pace(started, index)
+                self._write_chunk(frame({key: piece}))
+            usage = self.server.owner.usage(config.response_text, reasoning)
+            self._write_chunk(frame({}, "stop", usage=usage))
+            self._write_chunk("data: [DONE]\n\n")
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _stream_ollama(self, model: str) -> None:
+        config = self.server.owner.config
+        self._start_stream("application/x-ndjson")
+        try:
+            started = time.perf_counter()
+            for index, piece in enumerate(split_chunks(config.response_text, config.chunk_size)):
+                self._pace(started, index)
+                line = {
+                    "model": model,
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "message": {"role": "assistant", "content": piece},
+                    "done": False
+                }
+                self._write_chunk(json.dumps(line, ensure_ascii=False) + "\n")
+            final = {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": ""},
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": 10,
+                "eval_count": len(config.response_text)
+            }
+            self._write_chunk(json.dumps(final) + "\n")
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    owner: "MockProviderServer"
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开（读完 [DONE] 前就关闭连接）是正常情况
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+class MockProviderServer:
+    """模拟供应商服务
+
+    使用示例：
+        with MockProviderServer(MockConfig(token_rate=100)) as server:
+            chat = AIChat(**server.chat_kwargs("deepseek"))
+            print(chat.ask("你好"))
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.ernie_token = "mock-ernie-access-token"
+        self.ollama_models = ["mock-llama", "mock-qwen"]
+        self.ollama_loaded: Dict[str, float] = {}  # {模型: 预计卸载的 time.time()}
+        self.requests: "deque[Dict[str, Any]]" = deque(maxlen=1000)  # 最近收到的请求
+        self.chat_count = 0
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+        self._random = random.Random(self.config.seed)
+        self._httpd: Optional[_MockHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 生命周期 ----
+    def start(self) -> "MockProviderServer":
+        """在后台线程启动服务"""
+        self._httpd = _MockHTTPServer((self.host, self.port), _Handler)
+        self._httpd.owner = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """停止服务"""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self) -> "MockProviderServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # ---- 地址 ----
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def url_for(self, provider: str) -> str:
+        """获取供应商聊天接口地址"""
+        return f"{self.base_url}/{provider}{CHAT_PATHS[provider]}"
+
+    def token_url(self) -> str:
+        """ERNIE 鉴权接口地址"""
+        return f"{self.base_url}/ernie/oauth/2.0/token"
+
+    def chat_kwargs(self, provider: str, model: Optional[str] = None) -> Dict[str, Any]:
+        """生成指向本服务的 AIChat 构造参数"""
+        kwargs: Dict[str, Any] = {
+            "provider": provider,
+            "model": model or f"mock-{provider}",
+            "api_url": self.url_for(provider)
+        }
+        if provider != "ollama":
+            kwargs["api_key"] = "mock-key"
+        if provider == "ernie":
+            kwargs["api_secret"] = "mock-secret"
+            kwargs["token_url"] = self.token_url()
+        return kwargs
+
+    # ---- 内部状态 ----
+    def next_request_id(self) -> str:
+        return f"mock-{next(self._counter)}"
+
+    def record(self, provider: str, path: str, body: Dict[str, Any]) -> None:
+        with self._lock:
+            self.requests.append({"provider": provider, "path": path, "body": body})
+            if not path.startswith("/oauth"):
+                self.chat_count += 1
+
+    def load_ollama(self, model: str, keep_alive: Any) -> bool:
+        """按 keep_alive 记录 Ollama 模型的卸载时间
+
+        Returns:
+            bool: 模型此前未加载（需要模拟加载耗时）
+        """
+        now = time.time()
+        name = normalize_model(model)
+        with self._lock:
+            cold = self.ollama_loaded.get(name, 0.0) <= now
+            seconds = parse_keep_alive(keep_alive)
+            if seconds == 0:
+                self.ollama_loaded.pop(name, None)
+            else:
+                self.ollama_loaded[name] = now + min(seconds, 10 * 365 * 86400.0)
+        return cold
+
+    def ollama_running(self) -> List[Dict[str, Any]]:
+        """/api/ps 的 models"""
+        now = time.time()
+        with self._lock:
+            loaded = [(name, expires) for name, expires in self.ollama_loaded.items() if expires > now]
+        return [{
+            "name": name,
+            "model": name,
+            "size_vram": 1024 ** 3,
+            "expires_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expires))
+        } for name, expires in loaded]
+
+    def inject_failure(self) -> Optional[int]:
+        """按配置决定本次请求是否返回错误状态码"""
+        config = self.config
+        with self._lock:
+            if config.rate_limit_every and self.chat_count % config.rate_limit_every == 0:
+                return 429
+            if config.rate_limit_rate and self._random.random() < config.rate_limit_rate:
+                return 429
+            if config.error_rate and self._random.random() < config.error_rate:
+                return 500
+        return None
+
+    def usage(self, content: str, reasoning: str = "") -> Dict[str, Any]:
+        """按字符数估算的 usage 字段"""
+        usage = {
+            "prompt_tokens": 10,
+            "completion_tokens": len(content) + len(reasoning),
+            "total_tokens": 10 + len(content) + len(reasoning)
+        }
+        if reasoning:
+            usage["completion_tokens_details"] = {"reasoning_tokens": len(reasoning)}
+        return usage
+
+    def build_completion(self, provider: str, model: str, reasoning: str) -> Dict[str, Any]:
+        """构造非流式响应"""
+        content = self.config.response_text
+        if provider == "ollama":
+            return {
+                "model": model,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "message": {"role": "assistant", "content": content},
+                "done": True,
+                "done_reason": "stop",
+                "prompt_eval_count": 10,
+                "eval_count": len(content)
+            }
+        message = {"role": "assistant", "content": content}
+        if reasoning:
+            message["reasoning_content"] = reasoning
+        return {
+            "id": f"chatcmpl-{self.next_request_id()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": self.usage(content, reasoning)
+        }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AI Palette 模拟供应商服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18001)
+    parser.add_argument("--latency", type=float, default=0.0, help="首字节前的等待时间（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="流式输出速度（片段/秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="每 N 个请求返回一次 429")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="Ollama 加载未驻留模型的时间（秒）")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency=args.latency,
+        token_rate=args.token_rate,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        rate_limit_every=args.rate_limit_every,
+        load_latency=args.load_latency
+    )
+    server = MockProviderServer(config, host=args.host, port=args.port).start()
+    print(f"模拟服务已启动: {server.base_url}")
+    for provider in PROVIDERS:
+        print(f"  {provider:12s} {server.url_for(provider)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""Ollama 本地模型管理
+
+Ollama 默认在模型空闲 5 分钟后把它从内存中卸载，之后的第一个请求需要重新加载（通常要几秒到几十秒）。
+这里提供：
+- keep_alive：请求时告诉 Ollama 模型在内存中保留多久（AIChat 的 keep_alive 参数或 OLLAMA_KEEP_ALIVE 环境变量）
+- preload()：提前把模型加载到内存，之后的请求没有冷启动
+- 常驻模型跟踪：根据 /api/ps 和最近的请求记录哪些模型已经加载，prefer_warm() 从候选模型中优先选择已加载的
+- OllamaPool：多台 Ollama 服务的负载均衡（健康检查、最少进行中请求、优先发往已加载模型的服务）
+
+    from ai_palette import AIChat
+
+    chat = AIChat(provider="ollama", model="qwen2.5:7b", keep_alive="30m")
+    chat.preload()  # 返回加载耗时（秒）
+
+    from ai_palette.ollama import prefer_warm
+    model = prefer_warm(["qwen2.5:7b", "llama3.1:8b"])
+
+多台服务时设置 OLLAMA_HOSTS=http://box1:11434,http://box2:11434，Ollama 的 AIChat 自动使用共享的 OllamaPool。
+"""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, List, Union, Sequence, Any
+
+DEFAULT_HOST = "http://localhost:11434"
+DEFAULT_KEEP_ALIVE = 300.0  # Ollama 默认保留 5 分钟
+
+KeepAlive = Union[str, int, float]
+
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+def parse_keep_alive(value: Optional[KeepAlive]) -> float:
+    """把 keep_alive 换算为秒
+
+    Args:
+        value: 秒数或 Ollama 的时长字符串（如 "30m"、"1h30m"），负数表示一直保留，None 表示 Ollama 的默认值
+
+    Returns:
+        float: 秒数，一直保留时为 inf
+
+    Raises:
+        ValueError: 无法解析的时长
+    """
+    if value is None:
+        return DEFAULT_KEEP_ALIVE
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            seconds = float(text)
+        except ValueError:
+            sign = -1.0 if text.startswith("-") else 1.0
+            text = text.lstrip("+-")
+            parts = _DURATION.findall(text)
+            if not parts or "".join(number + unit for number, unit in parts) != text:
+                raise ValueError(f"无法解析的 keep_alive: {value}")
+            seconds = sign * sum(float(number) * _UNITS[unit] for number, unit in parts)
+    else:
+        seconds = float(value)
+    return float("inf") if seconds < 0 else seconds
+
+def normalize_keep_alive(value: KeepAlive) -> KeepAlive:
+    """校验 keep_alive，纯数字的字符串（例如来自环境变量）转换为数字，Ollama 只接受带单位的时长字符串
+
+    Raises:
+        ValueError: 无法解析的时长
+    """
+    parse_keep_alive(value)
+    if isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return value.strip()
+        return int(number) if number.is_integer() else number
+    return value
+
+def ollama_host(api_url: Optional[str] = None) -> str:
+    """从接口地址（如 http://localhost:11434/api/chat）得到 Ollama 服务地址
+
+    未指定时读取 OLLAMA_API_URL 环境变量，默认为 http://localhost:11434
+    """
+    url = (api_url or os.getenv("OLLAMA_API_URL") or DEFAULT_HOST).rstrip("/")
+    index = url.find("/api/")
+    return url[:index] if index >= 0 else url
+
+def normalize_model(name: str) -> str:
+    """Ollama 的模型名省略标签时为 latest"""
+    return name if ":" in name else f"{name}:latest"
+
+def _parse_expires_at(value: Optional[str]) -> float:
+    """把 /api/ps 的 expires_at（RFC 3339，可能带纳秒）换算为 time.monotonic() 时间，无法解析时为 inf"""
+    if not value:
+        return float("inf")
+    text = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        remaining = datetime.fromisoformat(text).timestamp() - time.time()
+    except ValueError:
+        return float("inf")
+    return time.monotonic() + remaining
+
+class ResidencyTracker:
+    """记录各 Ollama 服务上已加载的模型（线程安全）
+
+    来源有两个：/api/ps 的结果（refresh），以及本进程成功完成的请求和 preload（按 keep_alive 估计卸载时间）。
+
+    Args:
+        max_age: /api/ps 结果的缓存时间（秒），超过后 refresh() 重新查询
+    """
+
+    def __init__(self, max_age: float = 5.0):
+        self.max_age = max_age
+        self._resident: Dict[str, Dict[str, float]] = {}  # {服务地址: {模型: 预计卸载的 monotonic 时间}}
+        self._details: Dict[str, Dict[str, Dict[str, Any]]] = {}  # {服务地址: {模型: /api/ps 的条目}}
+        self._refreshed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def mark_loaded(self, host: str, model: str, keep_alive: Optional[KeepAlive] = None) -> None:
+        """记录模型刚被使用过，将在 keep_alive 之后卸载"""
+        seconds = parse_keep_alive(keep_alive)
+        with self._lock:
+            models = self._resident.setdefault(host, {})
+            if seconds == 0:
+                models.pop(normalize_model(model), None)
+            else:
+                models[normalize_model(model)] = time.monotonic() + seconds
+
+    def mark_unloaded(self, host: str, model: str) -> None:
+        with self._lock:
+            self._resident.get(host, {}).pop(normalize_model(model), None)
+            self._details.get(host, {}).pop(normalize_model(model), None)
+
+    def update(self, host: str, running: List[Dict[str, Any]]) -> None:
+        """用 /api/ps 返回的 models 替换该服务的记录"""
+        with self._lock:
+            self._resident[host] = {normalize_model(item["name"]): _parse_expires_at(item.get("expires_at"))
+                                    for item in running}
+            self._details[host] = {normalize_model(item["name"]): item for item in running}
+            self._refreshed[host] = time.monotonic()
+
+    def resident(self, host: str) -> List[str]:
+        """该服务上（预计）仍在内存中的模型"""
+        now = time.monotonic()
+        with self._lock:
+            return [model for model, expires in self._resident.get(host, {}).items() if expires > now]
+
+    def is_warm(self, host: str, model: str) -> bool:
+        """模型是否（预计）仍在内存中"""
+        with self._lock:
+            expires = self._resident.get(host, {}).get(normalize_model(model))
+        return expires is not None and expires > time.monotonic()
+
+    def details(self, host: str, model: str) -> Optional[Dict[str, Any]]:
+        """最近一次 /api/ps 中该模型的条目（size_vram、expires_at 等）"""
+        with self._lock:
+            return self._details.get(host, {}).get(normalize_model(model))
+
+    def refresh(self, host: str, timeout: float = 2.0, force: bool = False) -> bool:
+        """查询 /api/ps 更新记录，缓存未过期时直接返回
+
+        Returns:
+            bool: 记录是否来自（足够新的）/api/ps；服务无法访问时返回 False，保留按请求估计的记录
+        """
+        refreshed = self._refreshed.get(host)
+        if not force and refreshed is not None and time.monotonic() - refreshed < self.max_age:
+            return True
+        try:
+            running_models(host, timeout)
+        except Exception as e:
+            from . import logger
+            logger.debug(f"查询 Ollama 已加载模型失败（{host}）：{e}")
+            return False
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._resident.clear()
+            self._details.clear()
+            self._refreshed.clear()
+
+tracker = ResidencyTracker()
+
+def _get(host: str, path: str, timeout: float) -> Dict[str, Any]:
+    from . import _http_session
+    response = _http_session(False).get(f"{host}{path}", timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def list_models(host: Optional[str] = None, timeout: float = 5.0) -> List[str]:
+    """已下载的模型（/api/tags）"""
+    return [item["name"] for item in _get(ollama_host(host), "/api/tags", timeout).get("models", [])]
+
+def running_models(host: Optional[str] = None, timeout: float = 5.0) -> List[Dict[str, Any]]:
+    """已加载到内存的模型（/api/ps），同时更新常驻模型记录
+
+    Returns:
+        List[Dict]: /api/ps 的 models，包含 name、size_vram、expires_at 等
+    """
+    host = ollama_host(host)
+    running = _get(host, "/api/ps", timeout).get("models", [])
+    tracker.update(host, running)
+    return running
+
+def preload(model: str, host: Optional[str] = None, keep_alive: Optional[KeepAlive] = None,
+            timeout: float = 300.0) -> float:
+    """把模型加载到内存（发送不带消息的对话请求），已加载时只刷新保留时间
+
+    Args:
+        model: 模型名
+        host: Ollama 服务地址或接口地址，默认读取 OLLAMA_API_URL
+        keep_alive: 加载后保留的时间，None 时使用 Ollama 的默认值（5 分钟）
+        timeout: 等待加载完成的时间（秒），大模型首次加载可能需要较长时间
+
+    Returns:
+        float: 耗时（秒）
+
+    Raises:
+        requests.RequestException: 无法连接或加载失败（例如模型不存在）
+    """
+    from . import _http_session
+    host = ollama_host(host)
+    body: Dict[str, Any] = {"model": model, "messages": []}
+    if keep_alive is not None:
+        body["keep_alive"] = keep_alive
+    start = time.perf_counter()
+    response = _http_session(False).post(f"{host}/api/chat", json=body, timeout=timeout)
+    response.raise_for_status()
+    tracker.mark_loaded(host, model, keep_alive)
+    return time.perf_counter() - start
+
+def unload(model: str, host: Optional[str] = None, timeout: float = 30.0) -> None:
+    """立即从内存中卸载模型（keep_alive=0）"""
+    from . import _http_session
+    host = ollama_host(host)
+    response = _http_session(False).post(f"{host}/api/chat", json={"model": model, "messages": [], "keep_alive": 0},
+                                         timeout=timeout)
+    response.raise_for_status()
+    tracker.mark_unloaded(host, model)
+
+def prefer_warm(models: Sequence[str], host: Optional[str] = None) -> str:
+    """从候选模型中选择已加载的，都未加载时返回第一个
+
+    Args:
+        models: 按优先级排列的候选模型
+        host: Ollama 服务地址或接口地址；未指定时设置了 OLLAMA_HOSTS 则任一可用服务已加载即可，
+            否则读取 OLLAMA_API_URL
+
+    Raises:
+        ValueError: 没有候选模型
+    """
+    if not models:
+        raise ValueError("至少需要一个候选模型")
+    pool = get_pool() if host is None else None
+    hosts = pool.available() if pool is not None else [ollama_host(host)]
+    for item in hosts:
+        tracker.refresh(item)
+    for model in models:
+        if any(tracker.is_warm(item, model) for item in hosts):
+            return model
+    return models[0]
+
+def is_host_down(error: BaseException) -> bool:
+    """错误是否表示服务无法连接（连接被拒绝、连接超时等）"""
+    if getattr(error, "phase", None) == "connect":
+        return True
+    return any(cls.__name__ in ("ConnectionError", "ConnectTimeout") for cls in type(error).__mro__)
+
+class _HostState:
+    def __init__(self):
+        self.in_flight = 0
+        self.healthy = True
+        self.models: Optional[Dict[str, str]] = None  # 已下载的模型（/api/tags）：{规范化的模型名: 模型名}，尚未检查时为 None
+        self.checked = float("-inf")            # 上次健康检查的 monotonic 时间
+        self.error: Optional[str] = None
+
+class OllamaPool:
+    """多台 Ollama 服务的负载均衡（线程安全）
+
+    选择服务时依次考虑：
+    1. 健康检查通过的服务（都不可用时仍然全部尝试）
+    2. 已下载该模型的服务
+    3. 已把模型加载到内存的服务（模型亲和）；它们进行中的请求比其他服务多出 max_imbalance 以上时，
+       改为发往较空闲的服务，在那里加载模型
+    4. 进行中请求最少的服务，相同时轮流选择
+
+    健康检查（/api/tags 和 /api/ps）每 check_interval 秒在后台进行一次；请求无法连接时服务立即被标记为不可用，
+    下一次检查通过后恢复。
+
+    Args:
+        hosts: Ollama 服务地址（如 http://box1:11434，也可以是 .../api/chat 接口地址）
+        check_interval: 健康检查间隔（秒）
+        timeout: 健康检查的超时时间（秒）
+        max_imbalance: 模型亲和允许的进行中请求数差距
+    """
+
+    def __init__(self, hosts: Sequence[str], check_interval: float = 10.0, timeout: float = 2.0,
+                 max_imbalance: int = 2):
+        self.hosts = list(OrderedDict.fromkeys(ollama_host(host) for host in hosts))
+        if not self.hosts:
+            raise ValueError("至少需要一个 Ollama 服务地址")
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self.max_imbalance = max_imbalance
+        self._state = {host: _HostState() for host in self.hosts}
+        self._next = 0  # 负载相同时轮流选择的起点
+        self._checking = False
+        self._lock = threading.Lock()
+
+    # ---- 健康检查 ----
+    def _check_host(self, host: str) -> bool:
+        try:
+            models = {normalize_model(name): name for name in list_models(host, self.timeout)}
+            running_models(host, self.timeout)
+            error = None
+        except Exception as e:
+            models, error = None, str(e)
+        with self._lock:
+            state = self._state[host]
+            state.checked = time.monotonic()
+            state.healthy = error is None
+            state.error = error
+            if models is not None:
+                state.models = models
+        return error is None
+
+    def check(self) -> Dict[str, bool]:
+        """立即并发检查所有服务
+
+        Returns:
+            Dict[str, bool]: {服务地址: 是否可用}
+        """
+        threads = [threading.Thread(target=self._check_host, args=(host,), daemon=True) for host in self.hosts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {host: self._state[host].healthy for host in self.hosts}
+
+    def _maybe_check(self) -> None:
+        """有服务超过检查间隔时在后台检查，不阻塞请求"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [host for host in self.hosts if now - self._state[host].checked >= self.check_interval]
+            if not stale or self._checking:
+                return
+            self._checking = True
+
+        def run():
+            try:
+                for host in stale:
+                    self._check_host(host)
+            finally:
+                self._checking = False
+        threading.Thread(target=run, name="ai-palette-ollama-check", daemon=True).start()
+
+    def available(self) -> List[str]:
+        """健康检查通过的服务，都不可用时返回全部"""
+        with self._lock:
+            return [host for host in self.hosts if self._state[host].healthy] or list(self.hosts)
+
+    # ---- 选择服务 ----
+    def acquire(self, model: str) -> str:
+        """为一个请求选择服务，完成后调用 release()
+
+        Returns:
+            str: 服务地址
+        """
+        self._maybe_check()
+        name = normalize_model(model)
+        with self._lock:
+            candidates = [host for host in self.hosts if self._state[host].healthy] or list(self.hosts)
+            candidates = [host for host in candidates
+                          if self._state[host].models is None or name in self._state[host].models] or candidates
+            order = {host: (index - self._next) % len(self.hosts) for index, host in enumerate(self.hosts)}
+            pick = min(candidates, key=lambda h: (self._state[h].in_flight, order[h]))
+            warm = [host for host in candidates if tracker.is_warm(host, name)]
+            if warm:
+                best_warm = min(warm, key=lambda h: (self._state[h].in_flight, order[h]))
+                if self._state[best_warm].in_flight - self._state[pick].in_flight <= self.max_imbalance:
+                    pick = best_warm
+            self._state[pick].in_flight += 1
+            self._next = (self.hosts.index(pick) + 1) % len(self.hosts)
+        return pick
+
+    def release(self, host: str, model: str, error: Optional[BaseException] = None,
+                keep_alive: Optional[KeepAlive] = None) -> None:
+        """请求完成：成功时记录模型已加载到该服务，无法连接时把服务标记为不可用"""
+        with self._lock:
+            state = self._state[host]
+            state.in_flight -= 1
+            if error is not None and is_host_down(error):
+                state.healthy = False
+                state.error = str(error)
+                state.checked = time.monotonic()
+        if error is None:
+            tracker.mark_loaded(host, model, keep_alive)
+
+    # ---- 汇总 ----
+    def models(self) -> Dict[str, List[str]]:
+        """汇总各服务已下载的模型：{模型: [服务地址]}，尚未检查过时先检查一次"""
+        with self._lock:
+            unchecked = any(state.models is None for state in self._state.values())
+        if unchecked:
+            self.check()
+        result: Dict[str, List[str]] = {}
+        with self._lock:
+            for host in self.hosts:
+                state = self._state[host]
+                if state.healthy and state.models:
+                    for model in sorted(state.models.values()):
+                        result.setdefault(model, []).append(host)
+        return result
+
+    def preload(self, model: str, keep_alive: Optional[KeepAlive] = None, timeout: float = 300.0) -> Dict[str, float]:
+        """在所有可用的服务上并发加载模型
+
+        Returns:
+            Dict[str, float]: {服务地址: 加载耗时（秒）}，加载失败的服务不在结果中
+        """
+        results: Dict[str, float] = {}
+
+        def load(host: str) -> None:
+            try:
+                results[host] = preload(model, host, keep_alive, timeout)
+            except Exception as e:
+                from . import logger
+                logger.warning(f"在 {host} 加载模型 {model} 失败：{e}")
+
+        threads = [threading.Thread(target=load, args=(host,), daemon=True) for host in self.available()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def status(self) -> List[Dict[str, Any]]:
+        """各服务的状态：地址、是否可用、进行中的请求数、已加载的模型"""
+        with self._lock:
+            states = [(host, self._state[host]) for host in self.hosts]
+            result = [{
+                "host": host,
+                "healthy": state.healthy,
+                "in_flight": state.in_flight,
+                "error": state.error
+            } for host, state in states]
+        for item in result:
+            item["resident"] = tracker.resident(item["host"])
+        return result
+
+_pool: Optional[OllamaPool] = None
+_pool_hosts: Optional[str] = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> Optional[OllamaPool]:
+    """获取按 OLLAMA_HOSTS（逗号分隔的服务地址）创建的共享 OllamaPool，未设置时返回 None"""
+    global _pool, _pool_hosts
+    hosts = os.getenv("OLLAMA_HOSTS", "").strip()
+    if not hosts:
+        return None
+    with _pool_lock:
+        if _pool is None or hosts != _pool_hosts:
+            _pool = OllamaPool([host.strip() for host in hosts.split(",") if host.strip()])
+            _pool_hosts = hosts
+        return _pool
@@ -0,0 +1,506 @@
+import re
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Generator, Union, Any
+
+from . import AIChat, APIProvider, CancelToken, Conversation, Message, logger
+
+# 模板占位符格式：[$name$]
+_PLACEHOLDER_PATTERN = re.compile(r"\[\$([A-Za-z_][A-Za-z0-9_]*)\$\]")
+
+class PromptTemplate:
+    """预编译的提示词模板
+
+    模板在创建时只解析一次，拆分为字面量片段和变量名，渲染时直接拼接，
+    不再对整段文本反复做 replace。未提供的变量保留原样输出。
+    """
+
+    def __init__(self, template: str):
+        self.template = template or ""
+        self._parts: List[str] = []
+        self._names: List[str] = []
+        last = 0
+        for match in _PLACEHOLDER_PATTERN.finditer(self.template):
+            self._parts.append(self.template[last:match.start()])
+            self._names.append(match.group(1))
+            last = match.end()
+        self._parts.append(self.template[last:])
+        self.variables = frozenset(self._names)
+
+    def render(self, values: Dict[str, str]) -> str:
+        """渲染模板
+
+        Args:
+            values: 变量名到取值的映射
+
+        Returns:
+            str: 渲染后的文本
+        """
+        pieces = [self._parts[0]]
+        for name, literal in zip(self._names, self._parts[1:]):
+            value = values.get(name)
+            pieces.append(value if value is not None else f"[${name}$]")
+            pieces.append(literal)
+        return "".join(pieces)
+
+@dataclass
+class Stage:
+    """流水线阶段定义
+
+    模板中引用的其他阶段名（如 [$thought$]）会自动成为依赖。
+    """
+    name: str
+    provider: Union[APIProvider, str]
+    model: str
+    template: str
+    depends_on: List[str] = field(default_factory=list)
+    api_key: Optional[str] = None
+    options: Dict[str, Any] = field(default_factory=dict)  # 透传给 AIChat 的其他参数
+
+    @classmethod
+    def from_dict(cls, config: Dict[str, Any]) -> "Stage":
+        """从字典配置创建阶段"""
+        known = {"name", "provider", "model", "template", "depends_on", "api_key", "options"}
+        options = dict(config.get("options") or {})
+        options.update({k: v for k, v in config.items() if k not in known})
+        return cls(
+            name=config["name"],
+            provider=config["provider"],
+            model=config["model"],
+            template=config.get("template", ""),
+            depends_on=list(config.get("depends_on") or []),
+            api_key=config.get("api_key"),
+            options=options
+        )
+
+@dataclass
+class StageTiming:
+    """阶段耗时（秒，相对于流水线启动时刻）"""
+    started: float = 0.0
+    first_token: Optional[float] = None
+    finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        """阶段总耗时"""
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        """转换为字典格式"""
+        return {
+            "started": self.started,
+            "first_token": self.first_token,
+            "finished": self.finished,
+            "elapsed": self.elapsed
+        }
+
+@dataclass
+class PipelineResult:
+    """流水线运行结果"""
+    outputs: Dict[str, str] = field(default_factory=dict)
+    reasoning: Dict[str, str] = field(default_factory=dict)
+    timings: Dict[str, StageTiming] = field(default_factory=dict)
+    total_time: float = 0.0
+
+class Pipeline:
+    """多阶段推理流水线（DAG）
+
+    每个阶段声明自己的模型和模板，模板中的 [$name$] 可以引用运行时输入
+    或上游阶段的输出。没有依赖关系的阶段并发执行，下游阶段在其所有上游
+    完成后立即启动，各阶段的输出以事件形式实时流出。
+    """
+
+    def __init__(self, stages: List[Union[Stage, Dict[str, Any]]], max_workers: Optional[int] = None):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if isinstance(stage, dict):
+                stage = Stage.from_dict(stage)
+            if stage.name in self.stages:
+                raise ValueError(f"阶段名重复: {stage.name}")
+            self.stages[stage.name] = stage
+            # 提前校验模型配置，避免在运行中途才发现缺少 API key 等问题
+            self._create_chat(stage, False)
+
+        if not self.stages:
+            raise ValueError("流水线至少需要一个阶段")
+
+        # 预编译模板并计算依赖
+        self.templates: Dict[str, PromptTemplate] = {}
+        self.dependencies: Dict[str, List[str]] = {}
+        for name, stage in self.stages.items():
+            template = PromptTemplate(stage.template)
+            self.templates[name] = template
+            deps = list(stage.depends_on)
+            for var in template.variables:
+                if var in self.stages and var not in deps:
+                    deps.append(var)
+            for dep in deps:
+                if dep not in self.stages:
+                    raise ValueError(f"阶段 {name} 依赖了不存在的阶段: {dep}")
+                if dep == name:
+                    raise ValueError(f"阶段 {name} 不能依赖自身")
+            self.dependencies[name] = deps
+
+        self.order = self._topological_order()
+        self.max_workers = max_workers or len(self.stages)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "Pipeline":
+        """从声明式配置创建流水线
+
+        Args:
+            config: 形如 {"stages": [{"name": ..., "provider": ..., "model": ...,
+                    "template": ..., "depends_on": [...]}, ...]} 的配置
+        """
+        return cls(config.get("stages", []), max_workers=config.get("max_workers"))
+
+    def _topological_order(self) -> List[str]:
+        """计算拓扑序，存在环时抛出异常"""
+        indegree = {name: len(deps) for name, deps in self.dependencies.items()}
+        ready = [name for name in self.stages if indegree[name] == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for other, deps in self.dependencies.items():
+                if name in deps:
+                    indegree[other] -= 1
+                    if indegree[other] == 0:
+                        ready.append(other)
+        if len(order) != len(self.stages):
+            cyclic = [name for name in self.stages if name not in order]
+            raise ValueError(f"流水线存在循环依赖: {', '.join(cyclic)}")
+        return order
+
+    @property
+    def outputs(self) -> List[str]:
+        """没有下游的阶段（最终输出阶段）"""
+        upstream = {dep for deps in self.dependencies.values() for dep in deps}
+        return [name for name in self.order if name not in upstream]
+
+    def _create_chat(self, stage: Stage, stream: bool) -> AIChat:
+        """为阶段创建聊天实例"""
+        return AIChat(
+            provider=stage.provider,
+            model=stage.model,
+            api_key=stage.api_key,
+            enable_streaming=stream,
+            **stage.options
+        )
+
+    def _run_stage(
+        self,
+        name: str,
+        prompt: str,
+        stream: bool,
+        context: Optional[List[Message]],
+        timing: StageTiming,
+        start: float,
+        events: "queue.Queue",
+        cancel: CancelToken
+    ) -> None:
+        """执行单个阶段，所有输出通过事件队列发出"""
+        stage = self.stages[name]
+        content_parts = []
+        reasoning_parts = []
+        try:
+            chat = self._create_chat(stage, stream)
+            conversation = Conversation(messages=context)
+            if stream:
+                for chunk in chat.ask(prompt, conversation=conversation, cancel=cancel):
+                    if timing.first_token is None:
+                        timing.first_token = time.perf_counter() - start
+                    if chunk.get("type") == "reasoning":
+                        reasoning_parts.append(chunk["content"])
+                    else:
+                        content_parts.append(chunk["content"])
+                    events.put({"type": chunk.get("type", "content"), "stage": name, "content": chunk["content"]})
+            else:
+                content = chat.ask(prompt, conversation=conversation, cancel=cancel)
+                timing.first_token = time.perf_counter() - start
+                reasoning = content.reasoning_content
+                if reasoning:
+                    reasoning_parts.append(reasoning)
+                    events.put({"type": "reasoning", "stage": name, "content": reasoning})
+                content_parts.append(content)
+                events.put({"type": "content", "stage": name, "content": content})
+        except Exception as e:
+            logger.error(f"流水线阶段 {name} 执行失败: {str(e)}")
+            timing.finished = time.perf_counter() - start
+            events.put({"type": "stage_error", "stage": name, "error": str(e), "exception": e})
+            return
+        timing.finished = time.perf_counter() - start
+        events.put({
+            "type": "stage_end",
+            "stage": name,
+            "output": "".join(content_parts),
+            "reasoning": "".join(reasoning_parts),
+            "timing": timing.to_dict()
+        })
+
+    def stream(
+        self,
+        inputs: Optional[Dict[str, str]] = None,
+        context: Optional[List[Message]] = None,
+        stream: bool = True,
+        cancel: Optional[CancelToken] = None
+    ) -> Generator[Dict[str, Any], None, None]:
+        """运行流水线并实时产出事件
+
+        提前关闭生成器（或取消 cancel）时，正在执行的阶段会立即关闭上游连接。
+
+        Args:
+            inputs: 模板输入变量，如 {"query": "..."}
+            context: 每个阶段共享的上下文消息
+            stream: 各阶段是否使用流式请求
+            cancel: 取消令牌
+
+        Returns:
+            Generator[Dict[str, Any], None, None]: 事件生成器，事件类型包括：
+            - stage_start: 阶段开始
+            - reasoning / content: 阶段输出片段
+            - stage_end: 阶段完成，包含完整输出和耗时
+            - stage_error: 阶段失败，依赖它的阶段不会执行
+        """
+        values = dict(inputs or {})
+        start = time.perf_counter()
+        events: "queue.Queue" = queue.Queue()
+        timings = {name: StageTiming() for name in self.stages}
+        pending = {name: set(deps) for name, deps in self.dependencies.items()}
+        running = set()
+        finished = set()
+
+        stages_cancel = CancelToken()
+        unregister = cancel.on_cancel(stages_cancel.cancel) if cancel is not None else None
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            def launch_ready():
+                for name in self.order:
+                    if name in running or name in finished or pending[name]:
+                        continue
+                    running.add(name)
+                    timings[name].started = time.perf_counter() - start
+                    prompt = self.templates[name].render(values)
+                    executor.submit(self._run_stage, name, prompt, stream, context, timings[name], start, events,
+                                    stages_cancel)
+                    yield {"type": "stage_start", "stage": name}
+
+            yield from launch_ready()
+            while running:
+                event = events.get()
+                name = event["stage"]
+                if event["type"] == "stage_end":
+                    running.discard(name)
+                    finished.add(name)
+                    values[name] = event["output"]
+                    for deps in pending.values():
+                        deps.discard(name)
+                    yield event
+                    yield from launch_ready()
+                elif event["type"] == "stage_error":
+                    running.discard(name)
+                    finished.add(name)
+                    yield event
+                    # 跳过所有直接或间接依赖失败阶段的下游
+                    failed = {name}
+                    for other in self.order:
+                        if other not in finished and failed & set(self.dependencies[other]):
+                            failed.add(other)
+                            finished.add(other)
+                            yield {
+                                "type": "stage_error",
+                                "stage": other,
+                                "error": f"上游阶段 {name} 失败，已跳过",
+                                "exception": None
+                            }
+                    yield from launch_ready()
+                else:
+                    yield event
+        finally:
+            if running:
+                stages_cancel.cancel()
+            if unregister is not None:
+                unregister()
+            executor.shutdown(wait=False)
+
+    def run(
+        self,
+        inputs: Optional[Dict[str, str]] = None,
+        context: Optional[List[Message]] = None,
+        stream: bool = False
+    ) -> PipelineResult:
+        """运行流水线并返回全部结果
+
+        Args:
+            inputs: 模板输入变量
+            context: 每个阶段共享的上下文消息
+            stream: 各阶段是否使用流式请求（可以得到更准确的首字耗时）
+
+        Returns:
+            PipelineResult: 各阶段输出、推理内容和耗时
+
+        Raises:
+            Exception: 任一阶段失败时抛出该阶段的原始异常
+        """
+        start = time.perf_counter()
+        result = PipelineResult()
+        for event in self.stream(inputs, context, stream=stream):
+            if event["type"] == "stage_end":
+                timing = event["timing"]
+                result.outputs[event["stage"]] = event["output"]
+                result.reasoning[event["stage"]] = event["reasoning"]
+                result.timings[event["stage"]] = StageTiming(
+                    started=timing["started"],
+                    first_token=timing["first_token"],
+                    finished=timing["finished"]
+                )
+            elif event["type"] == "stage_error":
+                if event.get("exception") is not None:
+                    raise event["exception"]
+                raise ValueError(event["error"])
+        result.total_time = time.perf_counter() - start
+        return result
+
+@dataclass
+class ComparisonResult:
+    """一个模型的对比结果（耗时单位为秒）"""
+    target: str
+    provider: str
+    model: str
+    output: str = ""
+    reasoning: str = ""
+    ttft: Optional[float] = None     # 首字耗时
+    latency: Optional[float] = None  # 总耗时
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典格式"""
+        return {
+            "target": self.target,
+            "provider": self.provider,
+            "model": self.model,
+            "output": self.output,
+            "reasoning": self.reasoning,
+            "ttft": self.ttft,
+            "latency": self.latency,
+            "error": self.error
+        }
+
+# 对比时提示词作为输入变量传给每个阶段
+_COMPARE_INPUT = "compare_prompt"
+
+class Comparison:
+    """把同一个提示词并发发给多个模型，对比输出和耗时
+
+    基于 Pipeline：每个模型是一个互不依赖的阶段，所有阶段同时启动，输出按模型打上标签后合并为一个事件流。
+
+        comparison = Comparison([
+            {"provider": "deepseek", "model": "deepseek-chat"},
+            {"provider": "ollama", "model": "qwen2.5:7b", "label": "本地"}
+        ])
+        for event in comparison.stream("你好"):
+            print(event["target"], event["type"], event.get("content", ""))
+
+    Args:
+        targets: 模型配置，与 Stage 相同（provider、model、api_key 及其他 AIChat 参数），不需要 name 和 template；
+            label 为事件中的模型标签，默认为 "provider:model"，重复时追加序号
+        max_workers: 同时进行的请求数，默认全部同时进行
+    """
+
+    def __init__(self, targets: List[Union[Stage, Dict[str, Any]]], max_workers: Optional[int] = None):
+        stages = []
+        for target in targets:
+            if isinstance(target, Stage):
+                config = {"name": target.name, "provider": target.provider, "model": target.model,
+                          "api_key": target.api_key, "options": target.options}
+            else:
+                config = dict(target)
+            provider = config["provider"]
+            provider = provider.value if isinstance(provider, APIProvider) else provider
+            label = config.pop("label", None) or config.get("name") or f"{provider}:{config['model']}"
+            name, index = label, 2
+            while any(stage.name == name for stage in stages):
+                name, index = f"{label}#{index}", index + 1
+            if name == _COMPARE_INPUT:
+                raise ValueError(f"模型标签不能为 {_COMPARE_INPUT}")
+            config.update(name=name, template=f"[${_COMPARE_INPUT}$]", depends_on=[])
+            stages.append(Stage.from_dict(config))
+        if not stages:
+            raise ValueError("至少需要一个对比的模型")
+        self.pipeline = Pipeline(stages, max_workers=max_workers)
+
+    @property
+    def targets(self) -> List[str]:
+        """模型标签"""
+        return list(self.pipeline.stages)
+
+    def stream(
+        self,
+        prompt: str,
+        context: Optional[List[Message]] = None,
+        stream: bool = True,
+        cancel: Optional[CancelToken] = None
+    ) -> Generator[Dict[str, Any], None, None]:
+        """并发请求所有模型并实时产出带模型标签（target）的事件
+
+        提前关闭生成器（或取消 cancel）时，所有仍在进行的请求都会立即关闭上游连接。
+
+        Args:
+            prompt: 提示词
+            context: 所有模型共享的上下文消息
+            stream: 是否使用流式请求（非流式时首字耗时等于总耗时）
+            cancel: 取消令牌
+
+        Returns:
+            Generator[Dict[str, Any], None, None]: 事件生成器，事件类型包括：
+            - start: 开始请求，包含 provider 和 model
+            - reasoning / content: 输出片段
+            - end: 完成，包含完整输出、ttft（首字耗时）和 latency（总耗时）
+            - error: 失败，其他模型不受影响
+            - done: 全部结束，results 为按总耗时排序的各模型结果
+        """
+        start = time.perf_counter()
+        results = {name: ComparisonResult(name, stage.provider.value if isinstance(stage.provider, APIProvider)
+                                          else stage.provider, stage.model)
+                   for name, stage in self.pipeline.stages.items()}
+        for event in self.pipeline.stream({_COMPARE_INPUT: prompt}, context, stream=stream, cancel=cancel):
+            kind = event["type"]
+            result = results[event["stage"]]
+            if kind == "stage_start":
+                yield {"type": "start", "target": result.target, "provider": result.provider, "model": result.model}
+            elif kind == "stage_end":
+                timing = event["timing"]
+                result.output = event["output"]
+                result.reasoning = event["reasoning"]
+                if timing["first_token"] is not None:
+                    result.ttft = timing["first_token"] - timing["started"]
+                result.latency = timing["elapsed"]
+                yield {"type": "end", "target": result.target, "output": result.output,
+                       "reasoning": result.reasoning, "ttft": result.ttft, "latency": result.latency}
+            elif kind == "stage_error":
+                result.error = event["error"]
+                yield {"type": "error", "target": result.target, "error": result.error,
+                       "exception": event.get("exception")}
+            else:
+                yield {"type": kind, "target": result.target, "content": event["content"]}
+        ranked = sorted(results.values(), key=lambda r: (r.error is not None, r.latency or 0.0))
+        yield {"type": "done", "total_time": time.perf_counter() - start,
+               "results": [result.to_dict() for result in ranked]}
+
+    def run(self, prompt: str, context: Optional[List[Message]] = None,
+            stream: bool = True) -> Dict[str, ComparisonResult]:
+        """并发请求所有模型并返回全部结果（失败的模型 error 不为空，不抛出异常）
+
+        Returns:
+            Dict[str, ComparisonResult]: {模型标签: 结果}，按传入顺序
+        """
+        results: Dict[str, ComparisonResult] = {}
+        for event in self.stream(prompt, context, stream=stream):
+            if event["type"] == "done":
+                ranked = {item["target"]: ComparisonResult(**item) for item in event["results"]}
+                results = {name: ranked[name] for name in self.targets}
+        return results
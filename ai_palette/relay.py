@@ -0,0 +1,166 @@
+import json
+import time
+import queue
+import threading
+from typing import Optional, Dict, Iterable, Iterator, Any, Tuple
+
+from .cancel import CancelToken
+
+# 默认合并窗口：30 毫秒或 512 字节，先到者触发发送
+DEFAULT_FLUSH_INTERVAL = 0.03
+DEFAULT_MAX_BYTES = 512
+# 长时间没有输出时发送保活注释的间隔（秒）
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+
+_END = object()
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """将事件编码为一个完整的 SSE 帧"""
+    return f"data: {json.dumps(event)}\n\n"
+
+class SSERelay:
+    """SSE 转发层
+
+    从上游事件迭代器中读取 {"type": ..., "content": ...} 事件，把相邻的同类
+    片段按时间/大小预算合并成一个 SSE 帧，减少逐 token 的序列化和 socket 写入；
+    上游长时间没有输出时（例如推理模型思考中）发送保活注释，防止代理断开连接。
+
+    上游在后台线程中读取，因此等待上游时仍能按时发送合并帧和保活注释。
+
+    客户端断开时 WSGI 服务器在写入失败后调用 close()，此时通过取消令牌立即关闭上游连接，
+    不再等待上游的下一个事件。
+    """
+
+    def __init__(
+        self,
+        events: Iterable[Dict[str, Any]],
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        heartbeat_interval: Optional[float] = DEFAULT_HEARTBEAT_INTERVAL,
+        standalone: Tuple[str, ...] = ("<think>", "</think>"),
+        cancel: Optional[CancelToken] = None
+    ):
+        """
+        Args:
+            events: 上游事件迭代器
+            flush_interval: 合并窗口的最长等待时间（秒）
+            max_bytes: 合并内容达到该字节数时立即发送
+            heartbeat_interval: 保活注释间隔（秒），None 表示不发送
+            standalone: 必须单独成帧的内容（前端依赖它们识别思考过程的边界）
+            cancel: 关闭时取消的令牌，为空时使用 events 的 cancel_token（ChatStream）
+        """
+        self._events = events
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.heartbeat_interval = heartbeat_interval
+        self.standalone = frozenset(standalone)
+        self._cancel = cancel or getattr(events, "cancel_token", None)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._upstream_done = False
+
+    def _pump(self) -> None:
+        """后台线程：读取上游事件放入队列"""
+        try:
+            for event in self._events:
+                if self._closed.is_set():
+                    break
+                self._queue.put(event)
+            else:
+                self._upstream_done = True
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            close = getattr(self._events, "close", None)
+            if close is not None and self._closed.is_set():
+                try:
+                    close()
+                except Exception:
+                    pass
+            self._queue.put(_END)
+
+    def _mergeable(self, pending: Dict[str, Any], event: Dict[str, Any]) -> bool:
+        """判断事件能否并入当前待发送的帧"""
+        if pending.keys() != event.keys():
+            return False
+        content = event.get("content")
+        if not isinstance(content, str) or content in self.standalone:
+            return False
+        return all(pending[key] == event[key] for key in pending if key != "content")
+
+    def close(self) -> None:
+        """停止转发；上游还未结束时（客户端断开）取消上游请求"""
+        self._closed.set()
+        if self._cancel is not None and not self._upstream_done:
+            self._cancel.cancel()
+
+    def __iter__(self) -> Iterator[str]:
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+        pending: Optional[Dict[str, Any]] = None
+        parts = []
+        size = 0
+        flush_at = 0.0
+        last_write = time.monotonic()
+
+        def flush() -> str:
+            nonlocal pending, parts, size
+            event = dict(pending)
+            event["content"] = "".join(parts)
+            pending, parts, size = None, [], 0
+            return format_sse(event)
+
+        try:
+            while True:
+                now = time.monotonic()
+                if pending is not None:
+                    timeout = max(flush_at - now, 0)
+                elif self.heartbeat_interval is not None:
+                    timeout = max(last_write + self.heartbeat_interval - now, 0)
+                else:
+                    timeout = None
+
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    if pending is not None:
+                        yield flush()
+                    else:
+                        yield ": keep-alive\n\n"
+                    last_write = time.monotonic()
+                    continue
+
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    if pending is not None:
+                        yield flush()
+                    raise item
+
+                if pending is not None and self._mergeable(pending, item):
+                    parts.append(item["content"])
+                    size += len(item["content"].encode("utf-8"))
+                else:
+                    if pending is not None:
+                        yield flush()
+                        last_write = time.monotonic()
+                    content = item.get("content")
+                    if not isinstance(content, str) or content in self.standalone:
+                        yield format_sse(item)
+                        last_write = time.monotonic()
+                        continue
+                    pending = dict(item)
+                    parts = [content]
+                    size = len(content.encode("utf-8"))
+                    flush_at = time.monotonic() + self.flush_interval
+
+                if size >= self.max_bytes:
+                    yield flush()
+                    last_write = time.monotonic()
+
+            if pending is not None:
+                yield flush()
+        finally:
+            self.close()
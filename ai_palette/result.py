@@ -0,0 +1,129 @@
+import time
+from typing import Optional, Dict, Iterator, Callable
+
+from .usage import Usage
+from .cancel import CancelToken, RequestCancelled
+
+class ChatResult(str):
+    """普通请求的回复
+
+    本身就是回复文本（str 子类），可以像以前一样直接使用；同时携带本次请求的元数据：
+    - usage: token 用量（供应商未返回时为 None）
+    - finish_reason: 结束原因，如 "stop"、"length"
+    - latency: 请求总耗时（秒）
+    - ttft: 首个片段耗时（秒，仅流式请求）
+    - request_id: 供应商的请求 ID（响应头 X-Request-Id 或响应体中的 id）
+    - reasoning_content: 推理内容（DeepSeek 等）
+    """
+
+    def __new__(
+        cls,
+        content: str,
+        reasoning_content: str = "",
+        usage: Optional[Usage] = None,
+        finish_reason: Optional[str] = None,
+        latency: Optional[float] = None,
+        ttft: Optional[float] = None,
+        request_id: Optional[str] = None,
+        provider: Optional[str] = None,
+        model: Optional[str] = None
+    ):
+        result = super().__new__(cls, content)
+        result.reasoning_content = reasoning_content
+        result.usage = usage
+        result.finish_reason = finish_reason
+        result.latency = latency
+        result.ttft = ttft
+        result.request_id = request_id
+        result.provider = provider
+        result.model = model
+        return result
+
+    @property
+    def content(self) -> str:
+        return str(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "content": str(self),
+            "reasoning_content": self.reasoning_content,
+            "usage": self.usage.to_dict() if self.usage else None,
+            "finish_reason": self.finish_reason,
+            "latency": self.latency,
+            "ttft": self.ttft,
+            "request_id": self.request_id,
+            "provider": self.provider,
+            "model": self.model
+        }
+
+class ChatStream:
+    """流式请求的句柄
+
+    可以像以前的生成器一样迭代，得到 {"type", "content"} 字典；读取结束（或调用 close()）
+    后，result 为包含完整回复和元数据的 ChatResult。
+
+    close() 可以在任意线程调用：上游连接会立即关闭，正在读取的线程收到 RequestCancelled。
+    """
+
+    def __init__(self, chunks: Iterator[Dict[str, str]], finish: Callable[[str, str, float, Optional[float]], ChatResult],
+                 cancel: Optional[CancelToken] = None, on_unused: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            chunks: 上游片段迭代器
+            finish: 读取结束时构造 ChatResult
+            cancel: 取消令牌
+            on_unused: 还没有开始读取就被 close() 时调用（归还提前取得的调度名额）
+        """
+        self._chunks = chunks
+        self._finish = finish
+        self._on_unused = on_unused
+        self.cancel_token = cancel
+        self._content = []
+        self._reasoning = []
+        self._start: Optional[float] = None
+        self._ttft: Optional[float] = None
+        self.result: Optional[ChatResult] = None
+
+    def __iter__(self) -> "ChatStream":
+        return self
+
+    def __next__(self) -> Dict[str, str]:
+        if self._start is None:
+            self._start = time.perf_counter()
+        try:
+            chunk = next(self._chunks)
+        except (StopIteration, RequestCancelled):
+            self._complete()
+            raise
+        if self._ttft is None:
+            self._ttft = time.perf_counter() - self._start
+        if chunk["type"] == "reasoning":
+            self._reasoning.append(chunk["content"])
+        else:
+            self._content.append(chunk["content"])
+        return chunk
+
+    def _complete(self) -> None:
+        if self.result is None and self._start is not None:
+            self.result = self._finish("".join(self._content), "".join(self._reasoning),
+                                       time.perf_counter() - self._start, self._ttft)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    def close(self) -> None:
+        """提前结束读取并关闭上游连接，result 中保留已收到的内容"""
+        if self.cancel_token is not None:
+            self.cancel_token.cancel()
+        if self._start is None and self._on_unused is not None:
+            on_unused, self._on_unused = self._on_unused, None
+            on_unused()
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # 其他线程正在读取（generator already executing），连接已由取消令牌关闭
+                return
+        self._complete()
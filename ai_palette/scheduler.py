@@ -0,0 +1,228 @@
+"""请求调度
+
+交互请求和批量任务共用同一个进程和供应商配额时，在发出请求前排队调度：
+- 优先级通道（lane）按权重做加权公平排队（WFQ），批量任务再多也只能分到自己的份额
+- 同一通道内按租户（默认为 API key）公平轮转，一个租户的大量请求不会饿死其他租户
+- 排队超过截止时间的请求被丢弃（RequestShed），不再占用配额
+
+    from ai_palette import AIChat, RequestScheduler, Lane
+
+    scheduler = RequestScheduler(max_concurrency=16)
+    web = AIChat(provider="deepseek", model="deepseek-chat", scheduler=scheduler)               # 默认 interactive
+    bulk = AIChat(provider="deepseek", model="deepseek-chat", scheduler=scheduler, lane="batch")
+"""
+import os
+import time
+import threading
+from collections import deque, OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Dict, Any
+
+class RequestShed(Exception):
+    """请求排队超过截止时间，被调度器丢弃"""
+
+@dataclass
+class Lane:
+    """优先级通道
+
+    Args:
+        weight: 权重，通道都有请求排队时按权重比例分配并发名额
+        max_wait: 默认的最长排队时间（秒），None 表示不限制
+    """
+    weight: float = 1.0
+    max_wait: Optional[float] = None
+
+    def __post_init__(self):
+        if self.weight <= 0:
+            raise ValueError("weight 必须大于 0")
+
+DEFAULT_LANES = {
+    "interactive": Lane(weight=8.0, max_wait=30.0),
+    "batch": Lane(weight=1.0)
+}
+
+class Ticket:
+    """一个排队中（或已获得名额）的请求"""
+
+    def __init__(self, lane: str, tenant: Any, cost: float, deadline: Optional[float]):
+        self.lane = lane
+        self.tenant = tenant
+        self.cost = cost
+        self.deadline = deadline  # time.monotonic() 时间
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.shed = False
+
+class _Queue:
+    """带虚拟时间的公平队列，子队列按 (虚拟时间, 加入顺序) 选出"""
+
+    def __init__(self):
+        self.children: "OrderedDict[Any, Any]" = OrderedDict()
+        self.vtime: Dict[Any, float] = {}
+
+    def activate(self, key: Any) -> None:
+        """子队列从空变为非空：虚拟时间从其他子队列的最小值开始，空闲期间不积累额度"""
+        self.vtime[key] = min((self.vtime[k] for k in self.children if k != key), default=0.0)
+
+    def deactivate(self, key: Any) -> None:
+        del self.children[key]
+        del self.vtime[key]
+
+    def pick(self) -> Any:
+        return min(self.children, key=lambda k: self.vtime[k])
+
+class RequestScheduler:
+    """按通道权重和租户公平地分配并发名额（线程安全）
+
+    Args:
+        max_concurrency: 同时进行的请求数
+        lanes: {通道名: Lane}，默认 interactive（权重 8，最多排队 30 秒）和 batch（权重 1）
+    """
+
+    def __init__(self, max_concurrency: int = 8, lanes: Optional[Dict[str, Lane]] = None):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency 必须大于 0")
+        self.max_concurrency = max_concurrency
+        self.lanes = dict(lanes or DEFAULT_LANES)
+        self._lanes = _Queue()  # 通道 -> _Queue(租户 -> deque[Ticket])
+        self._in_flight = 0
+        self._shed = 0
+        self._cond = threading.Condition()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def queued(self, lane: Optional[str] = None) -> int:
+        """排队中的请求数"""
+        with self._cond:
+            return sum(len(tickets) for name, tenants in self._lanes.children.items()
+                       if lane is None or name == lane for tickets in tenants.children.values())
+
+    @property
+    def shed_count(self) -> int:
+        """累计被丢弃的请求数"""
+        return self._shed
+
+    def acquire(self, lane: str = "interactive", tenant: Any = None, max_wait: Optional[float] = None,
+                cost: float = 1.0) -> Ticket:
+        """排队等待一个并发名额
+
+        Args:
+            lane: 通道名
+            tenant: 租户（例如 API key），同一通道内按租户轮转
+            max_wait: 最长排队时间（秒），默认使用通道的 max_wait
+            cost: 请求的相对开销，开销大的请求消耗更多份额
+
+        Returns:
+            Ticket: 完成后传给 release()
+
+        Raises:
+            ValueError: 通道不存在
+            RequestShed: 排队超过截止时间
+        """
+        if lane not in self.lanes:
+            raise ValueError(f"未知的通道: {lane}")
+        if max_wait is None:
+            max_wait = self.lanes[lane].max_wait
+        ticket = Ticket(lane, tenant, cost, time.monotonic() + max_wait if max_wait is not None else None)
+        with self._cond:
+            self._enqueue(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                if ticket.shed:
+                    raise RequestShed(f"请求排队超过 {max_wait} 秒，已丢弃（通道 {lane}）")
+                timeout = None
+                if ticket.deadline is not None:
+                    timeout = ticket.deadline - time.monotonic()
+                    if timeout <= 0:
+                        self._remove(ticket)
+                        continue
+                try:
+                    self._cond.wait(timeout)
+                except BaseException:
+                    # 等待被中断（例如 KeyboardInterrupt）时退出队列或归还已分到的名额
+                    if ticket.granted:
+                        ticket.granted = False
+                        self._in_flight -= 1
+                        self._dispatch()
+                    elif not ticket.shed:
+                        self._withdraw(ticket)
+                    self._cond.notify_all()
+                    raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """归还名额"""
+        with self._cond:
+            if ticket.granted:
+                ticket.granted = False
+                self._in_flight -= 1
+                self._dispatch()
+
+    def _enqueue(self, ticket: Ticket) -> None:
+        tenants = self._lanes.children.get(ticket.lane)
+        if tenants is None:
+            tenants = self._lanes.children[ticket.lane] = _Queue()
+            self._lanes.activate(ticket.lane)
+        tickets = tenants.children.get(ticket.tenant)
+        if tickets is None:
+            tickets = tenants.children[ticket.tenant] = deque()
+            tenants.activate(ticket.tenant)
+        tickets.append(ticket)
+
+    def _remove(self, ticket: Ticket) -> None:
+        """丢弃超时的请求（调用方需持有锁）"""
+        self._withdraw(ticket)
+        ticket.shed = True
+        self._shed += 1
+
+    def _withdraw(self, ticket: Ticket) -> None:
+        """把请求移出队列（调用方需持有锁）"""
+        tenants = self._lanes.children[ticket.lane]
+        tickets = tenants.children[ticket.tenant]
+        tickets.remove(ticket)
+        self._prune(ticket.lane, ticket.tenant)
+
+    def _prune(self, lane: str, tenant: Any) -> None:
+        tenants = self._lanes.children[lane]
+        if not tenants.children[tenant]:
+            tenants.deactivate(tenant)
+        if not tenants.children:
+            self._lanes.deactivate(lane)
+
+    def _dispatch(self) -> None:
+        """按虚拟时间把空闲名额分给排队的请求（调用方需持有锁）"""
+        granted = False
+        now = time.monotonic()
+        while self._in_flight < self.max_concurrency and self._lanes.children:
+            lane = self._lanes.pick()
+            tenants = self._lanes.children[lane]
+            tenant = tenants.pick()
+            ticket = tenants.children[tenant].popleft()
+            expired = ticket.deadline is not None and ticket.deadline <= now
+            if not expired:
+                self._lanes.vtime[lane] += ticket.cost / self.lanes[lane].weight
+                tenants.vtime[tenant] += ticket.cost
+            self._prune(lane, tenant)
+            granted = True  # 无论分配还是丢弃都需要唤醒等待者
+            if expired:
+                ticket.shed = True
+                self._shed += 1
+                continue
+            ticket.granted = True
+            self._in_flight += 1
+        if granted:
+            self._cond.notify_all()
+
+_default_scheduler: Optional[RequestScheduler] = None
+_default_lock = threading.Lock()
+
+def get_scheduler() -> RequestScheduler:
+    """获取进程内共享的调度器，并发数读取 AI_PALETTE_SCHEDULER_CONCURRENCY（默认 16）"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = RequestScheduler(int(os.getenv("AI_PALETTE_SCHEDULER_CONCURRENCY", "16")))
+    return _default_scheduler
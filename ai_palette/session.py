@@ -0,0 +1,119 @@
+"""服务端对话会话存储
+
+Web 服务按会话 ID 保存已经清理过（去掉 <think> 思考过程）的对话历史，浏览器每轮只需
+上传新消息，不再重复上传和解析完整的 context。
+
+内存中按 LRU 保留最近使用的会话；指定 persist_dir 时每个会话同时追加写入
+{persist_dir}/{session_id}.jsonl，被淘汰或服务重启后可以从磁盘恢复。
+"""
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+from typing import Optional, List, Iterable
+
+from . import Message
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+class SessionStore:
+    """会话历史存储（线程安全）
+
+    Args:
+        max_sessions: 内存中最多保留的会话数
+        persist_dir: 持久化目录，为空时只保存在内存中
+    """
+
+    def __init__(self, max_sessions: int = 1000, persist_dir: Optional[str] = None):
+        if max_sessions <= 0:
+            raise ValueError("max_sessions 必须大于 0")
+        self.max_sessions = max_sessions
+        self.persist_dir = persist_dir
+        self._sessions: "OrderedDict[str, List[Message]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if persist_dir:
+            os.makedirs(persist_dir, exist_ok=True)
+
+    @staticmethod
+    def is_valid_id(session_id) -> bool:
+        """会话 ID 是否合法（1~128 个字母、数字、下划线或连字符）"""
+        return isinstance(session_id, str) and bool(_SESSION_ID.match(session_id))
+
+    @classmethod
+    def _check_id(cls, session_id: str) -> None:
+        if not cls.is_valid_id(session_id):
+            raise ValueError(f"无效的会话 ID: {session_id!r}")
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.persist_dir, f"{session_id}.jsonl")
+
+    def _load(self, session_id: str) -> Optional[List[Message]]:
+        if not self.persist_dir or not os.path.exists(self._path(session_id)):
+            return None
+        with open(self._path(session_id), "r", encoding="utf-8") as f:
+            return [Message(**json.loads(line)) for line in f if line.strip()]
+
+    def _write(self, session_id: str, messages: Iterable[Message], mode: str) -> None:
+        if not self.persist_dir:
+            return
+        lines = "".join(json.dumps(msg.to_dict(), ensure_ascii=False) + "\n" for msg in messages)
+        with open(self._path(session_id), mode, encoding="utf-8") as f:
+            f.write(lines)
+
+    def _put(self, session_id: str, messages: List[Message]) -> None:
+        self._sessions[session_id] = messages
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _messages(self, session_id: str) -> Optional[List[Message]]:
+        messages = self._sessions.get(session_id)
+        if messages is not None:
+            self._sessions.move_to_end(session_id)
+            return messages
+        messages = self._load(session_id)
+        if messages is not None:
+            self._put(session_id, messages)
+        return messages
+
+    def get(self, session_id: str) -> Optional[List[Message]]:
+        """获取会话历史，会话不存在时返回 None"""
+        self._check_id(session_id)
+        with self._lock:
+            messages = self._messages(session_id)
+            return list(messages) if messages is not None else None
+
+    def replace(self, session_id: str, messages: Iterable[Message]) -> None:
+        """用完整的历史覆盖会话（新建会话或与客户端重新同步）"""
+        self._check_id(session_id)
+        messages = list(messages)
+        with self._lock:
+            self._put(session_id, messages)
+            self._write(session_id, messages, "w")
+
+    def append(self, session_id: str, *messages: Message) -> None:
+        """向会话追加消息，会话不存在时新建"""
+        self._check_id(session_id)
+        with self._lock:
+            history = self._messages(session_id)
+            if history is None:
+                history = []
+                self._put(session_id, history)
+            history.extend(messages)
+            self._write(session_id, messages, "a")
+
+    def delete(self, session_id: str) -> None:
+        """删除会话（包括磁盘上的记录）"""
+        self._check_id(session_id)
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.persist_dir and os.path.exists(self._path(session_id)):
+                os.remove(self._path(session_id))
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
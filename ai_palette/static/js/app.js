@@ -188,13 +188,14 @@ async function refreshModels() {
         
         if (data.success) {
             allModels = data.models;
+            const resident = data.resident || [];  // Ollama 已加载到内存的模型
             modelList.innerHTML = '';
             
             if (allModels.length > 0) {
                 allModels.forEach(model => {
                     const option = document.createElement('div');
                     option.className = 'px-4 py-2 hover:bg-slate-100 dark:hover:bg-slate-700 cursor-pointer';
-                    option.textContent = model;
+                    option.textContent = resident.includes(model) ? `${model}（已加载）` : model;
                     option.onclick = () => {
                         modelInput.value = model;
                         modelDropdown.classList.add('hidden');
@@ -584,6 +585,8 @@ async function sendMessage() {
 
     // 收集上下文
     let context = [];
+    // 重新发起的对话需要用截断后的上下文覆盖服务端会话
+    const isReask = !!window.reaskContext;
     // 如果是重新发起的对话，使用保存的上下文
     if (window.reaskContext) {
         context = window.reaskContext;
@@ -647,10 +650,15 @@ async function sendMessage() {
         console.log('当前选择的模型类型:', modelType);
         console.log('使用的接口endpoint:', endpoint);
 
+        // 服务端保存了会话历史时只上传新消息，history_length 用于校验两边是否一致
         let requestBody = {
             enable_streaming: enableStreaming,
-            context: context
+            session_id: getChatSessionId(),
+            history_length: context.length
         };
+        if (isReask) {
+            requestBody.context = context;
+        }
 
         if (isChainThinking) {
             // 从本地存储获取当前选中的推理链配置
@@ -708,13 +716,25 @@ async function sendMessage() {
         }
 
         // 发送请求并处理响应
-        const response = await fetch(endpoint, {
+        const postRequest = () => fetch(endpoint, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify(requestBody)
         });
+        let response = await postRequest();
+        // 服务端会话不存在或不一致（例如服务重启），上传完整上下文重新同步
+        if (response.status === 409 && !requestBody.context) {
+            requestBody.context = context;
+            response = await postRequest();
+        }
+
+        // 流式请求在发出响应头之前失败（例如调度队列已满返回 503）时，响应体是 JSON 错误
+        if (enableStreaming && !response.ok) {
+            const data = await response.json();
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
 
         if (enableStreaming) {
             const reader = response.body.getReader();
@@ -723,6 +743,7 @@ async function sendMessage() {
             const reasoningElement = aiMessage.querySelector('div[id^="ai-reasoning"]');
             responseElement.textContent = '';
             window.currentResponse = '';  // 清除缓存
+            let buffer = '';  // 跨数据块的未完整行
 
             while (true) {
                 const {value, done} = await reader.read();
@@ -733,8 +754,9 @@ async function sendMessage() {
                     break;
                 }
 
-                const text = decoder.decode(value);
-                const lines = text.split('\n');
+                buffer += decoder.decode(value, {stream: true});
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
 
                 for (const line of lines) {
                     if (line.startsWith('data: ')) {
@@ -824,6 +846,9 @@ async function sendMessage() {
                                         responseElement.innerHTML = escapeHtml(window.currentResponse);
                                     }
                                 }
+                            } else if (data.type === 'error') {
+                                // 推理链某个阶段失败，流随即结束
+                                showError(data.content);
                             }
                         } catch (e) {
                             console.error('解析响应失败:', e);
@@ -1022,11 +1047,31 @@ function reaskQuestion(button) {
     sendMessage();
 }
 
+// 获取服务端会话 ID（保存在本地存储中，清空对话时重新生成）
+function getChatSessionId() {
+    let sessionId = localStorage.getItem('aiPaletteSessionId');
+    if (!sessionId) {
+        sessionId = Date.now().toString(36) + Math.random().toString(36).slice(2, 10);
+        localStorage.setItem('aiPaletteSessionId', sessionId);
+    }
+    return sessionId;
+}
+
+// 删除服务端会话
+function resetChatSession() {
+    const sessionId = localStorage.getItem('aiPaletteSessionId');
+    if (sessionId) {
+        fetch(`/api/sessions/${sessionId}`, { method: 'DELETE' }).catch(() => {});
+        localStorage.removeItem('aiPaletteSessionId');
+    }
+}
+
 // 清空全部对话
 function clearAllMessages() {
     if (confirm('确定要清空全部对话吗？')) {
-        // 清空本地存储中的聊天记录
+        // 清空本地存储中的聊天记录和服务端会话
         localStorage.removeItem('aiPaletteChatHistory');
+        resetChatSession();
         // 清空页面内容并显示推荐
         restoreChatHistory();
     }
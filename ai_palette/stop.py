@@ -0,0 +1,121 @@
+"""流式输出的客户端停止条件
+
+部分供应商/模型的 stop 参数不可靠，推理模型有时只需要回答的前 N 个字符。在客户端判断停止条件，
+满足时立即关闭上游连接，不再等待（和付费）之后会被丢弃的 token：
+
+    from ai_palette import AIChat, StopCondition
+
+    stream = chat.ask("列出三个要点", stream=True, stop=["\\n\\n", "4."])
+    stream = chat.ask("写一篇长文", stream=True, stop=StopCondition(max_chars=200))
+    stream = chat.ask("...", stream=True, stop=StopCondition(pattern=r"答案：\\d+", predicate=lambda text: len(text) > 1000))
+
+停止条件只作用于回答内容（type 为 content 的片段），推理内容原样输出。
+"""
+import re
+from typing import Optional, Dict, Iterator, Generator, Callable, Sequence, Union, Pattern, Any
+
+class StopCondition:
+    """客户端停止条件，任一条件满足即停止
+
+    Args:
+        stop: 停止字符串，输出截止到第一个停止字符串之前（不包含它）；可能是停止字符串开头的末尾内容
+            会暂缓输出，直到确认不是停止字符串
+        pattern: 正则表达式，在已输出的内容中匹配到时停止，输出截止到匹配结束处（包含匹配内容）
+        max_chars: 最多输出的字符数
+        predicate: 以已输出的全部内容为参数，每个片段之后调用一次，返回 True 时停止
+    """
+
+    def __init__(
+        self,
+        stop: Optional[Union[str, Sequence[str]]] = None,
+        pattern: Optional[Union[str, Pattern]] = None,
+        max_chars: Optional[int] = None,
+        predicate: Optional[Callable[[str], bool]] = None
+    ):
+        self.stop = [stop] if isinstance(stop, str) else list(stop or [])
+        if any(not s for s in self.stop):
+            raise ValueError("停止字符串不能为空")
+        if max_chars is not None and max_chars <= 0:
+            raise ValueError("max_chars 必须大于 0")
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.max_chars = max_chars
+        self.predicate = predicate
+
+    @classmethod
+    def coerce(cls, value: Union["StopCondition", str, Sequence[str]]) -> "StopCondition":
+        """字符串或字符串列表视为停止字符串"""
+        return value if isinstance(value, StopCondition) else cls(stop=value)
+
+    def _hold(self, text: str) -> int:
+        """text 末尾可能是停止字符串开头的最长长度"""
+        longest = 0
+        for s in self.stop:
+            for size in range(min(len(s) - 1, len(text)), longest, -1):
+                if text.endswith(s[:size]):
+                    longest = size
+                    break
+        return longest
+
+    def apply(self, chunks: Iterator[Dict[str, str]], meta: Optional[Dict[str, Any]] = None
+              ) -> Generator[Dict[str, str], None, None]:
+        """按停止条件截断片段流，停止时关闭 chunks（流式请求随即关闭上游连接）
+
+        Args:
+            chunks: ask(stream=True) 格式的片段迭代器
+            meta: 停止时把 finish_reason 设为 "stop"（max_chars 时为 "length"）
+
+        Returns:
+            Generator[Dict[str, str], None, None]: 截断后的片段
+        """
+        visible = ""  # 已输出的回答内容
+        held = ""     # 暂缓输出、可能是停止字符串开头的内容
+
+        def cut(text: str, final: bool):
+            """返回 (可以输出的内容, 停止原因)"""
+            nonlocal held
+            text, held = held + text, ""
+            cuts = []
+            if self.stop:
+                found = [index for index in (text.find(s) for s in self.stop) if index >= 0]
+                if found:
+                    cuts.append((min(found), "stop"))
+                elif not final:
+                    hold = self._hold(text)
+                    if hold:
+                        text, held = text[:-hold], text[-hold:]
+            if self.pattern is not None:
+                match = self.pattern.search(visible + text)
+                if match:
+                    cuts.append((max(match.end() - len(visible), 0), "stop"))
+            if self.max_chars is not None and len(visible) + len(text) >= self.max_chars:
+                cuts.append((self.max_chars - len(visible), "length"))
+            if not cuts:
+                return text, None
+            position, reason = min(cuts, key=lambda item: item[0])
+            return text[:position], reason
+
+        try:
+            for chunk in chunks:
+                if chunk.get("type") == "reasoning":
+                    yield chunk
+                    continue
+                text, reason = cut(chunk["content"], False)
+                if text:
+                    visible += text
+                    yield dict(chunk, content=text)
+                if reason is None and self.predicate is not None and self.predicate(visible):
+                    reason = "stop"
+                if reason is not None:
+                    if meta is not None:
+                        meta["finish_reason"] = reason
+                    return
+            if held:
+                text, reason = cut("", True)
+                if text:
+                    yield {"type": "content", "content": text}
+                if reason is not None and meta is not None:
+                    meta["finish_reason"] = reason
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,243 @@
+"""细粒度超时
+
+    from ai_palette import AIChat, Timeouts
+
+    chat = AIChat(provider="deepseek", model="deepseek-chat",
+                  timeout=Timeouts(connect=5, first_token=60, idle=20, total=300))
+
+- connect: 建立 TCP/TLS 连接
+- first_token: 从发出请求到收到第一个输出片段（普通请求为收到完整响应）
+- idle: 流式输出中两个片段之间的最长间隔
+- total: 一次 ask() 的总耗时（包括重试）
+- read: 每次 socket 读取的超时（与以前的整数 timeout 含义相同）
+
+连接超时和等待响应头的超时由 socket 实现；收到响应头之后的首字、空闲和总耗时由后台看门狗线程
+检查，到期时直接断开上游连接。普通请求的 first_token 限制完整响应体的到达时间，响应体缓慢到达
+时也不会超过 first_token 和 total。超时抛出 ChatTimeout 的子类，除 TotalTimeout 外都会被自动重试。
+"""
+import time
+import threading
+from dataclasses import dataclass
+from typing import Optional, Union, Callable, Tuple, Set
+
+class ChatTimeout(TimeoutError):
+    """请求超时
+
+    Attributes:
+        phase: 超时阶段，"connect"、"first_token"、"idle" 或 "total"
+        timeout: 该阶段的超时设置（秒）
+    """
+    phase = ""
+
+    def __init__(self, timeout: Optional[float], message: Optional[str] = None):
+        super().__init__(message or f"{self.phase} 超时（{timeout} 秒）")
+        self.timeout = timeout
+
+class ConnectTimeout(ChatTimeout):
+    """建立连接超时"""
+    phase = "connect"
+
+class FirstTokenTimeout(ChatTimeout):
+    """等待第一个片段（或普通请求的响应）超时"""
+    phase = "first_token"
+
+class IdleTimeout(ChatTimeout):
+    """流式输出中片段间隔超时"""
+    phase = "idle"
+
+class TotalTimeout(ChatTimeout):
+    """请求总耗时超时"""
+    phase = "total"
+
+# 可以通过重试解决的超时（总耗时超时后重试只会再次超时）
+RETRYABLE_TIMEOUTS = (ConnectTimeout, FirstTokenTimeout, IdleTimeout)
+
+def _smallest(*values: Optional[float]) -> Optional[float]:
+    values = [v for v in values if v is not None]
+    return min(values) if values else None
+
+@dataclass(frozen=True)
+class Timeouts:
+    """各阶段的超时（秒），None 表示不限制"""
+    connect: Optional[float] = None
+    first_token: Optional[float] = None
+    idle: Optional[float] = None
+    total: Optional[float] = None
+    read: Optional[float] = None
+
+    def __post_init__(self):
+        for name in ("connect", "first_token", "idle", "total", "read"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError(f"超时时间必须大于 0: {name}={value}")
+
+    @classmethod
+    def from_value(cls, timeout: Union["Timeouts", int, float, None]) -> "Timeouts":
+        """兼容以前的整数 timeout：同时作为连接超时和读取超时"""
+        if isinstance(timeout, Timeouts):
+            return timeout
+        if timeout is None:
+            return cls()
+        return cls(connect=timeout, read=timeout)
+
+    @property
+    def watched(self) -> bool:
+        """是否需要看门狗检查"""
+        return self.first_token is not None or self.idle is not None or self.total is not None
+
+class Deadline:
+    """一次请求的各阶段截止时间
+
+    Args:
+        timeouts: 超时设置
+        started: 总耗时的起点（time.monotonic()），默认为现在；重试时传入第一次尝试的起点，
+            使 total 覆盖所有重试
+    """
+
+    def __init__(self, timeouts: Timeouts, started: Optional[float] = None):
+        self.timeouts = timeouts
+        self.start = time.monotonic()
+        self.started = started if started is not None else self.start
+        self.last_chunk: Optional[float] = None
+        self.paused = False
+        self._wake: Optional[Callable[[], None]] = None  # 由看门狗设置
+        self.expired: Optional[ChatTimeout] = None
+        self._connect_error: ChatTimeout = ConnectTimeout(timeouts.connect)
+        self._read_error: ChatTimeout = FirstTokenTimeout(timeouts.first_token)
+
+    def remaining(self) -> Optional[float]:
+        """距离总耗时截止还剩多少秒，未设置 total 时返回 None"""
+        if self.timeouts.total is None:
+            return None
+        return self.started + self.timeouts.total - time.monotonic()
+
+    def request_timeout(self) -> Tuple[Optional[float], Optional[float]]:
+        """发出请求时传给 HTTP 会话的 (连接超时, 读取超时)
+
+        读取超时同时限制等待响应头的时间，因此取 read、first_token 和剩余总耗时中最小的一个。
+        """
+        timeouts = self.timeouts
+        remaining = self.remaining()
+        if remaining is not None:
+            remaining = max(remaining, 0.001)
+        connect = timeouts.connect
+        if remaining is not None and (connect is None or remaining < connect):
+            connect, self._connect_error = remaining, TotalTimeout(timeouts.total)
+        else:
+            self._connect_error = ConnectTimeout(connect)
+        read = _smallest(timeouts.read, timeouts.first_token)
+        if remaining is not None and (read is None or remaining < read):
+            read, self._read_error = remaining, TotalTimeout(timeouts.total)
+        else:
+            self._read_error = FirstTokenTimeout(read)
+        return (connect, read)
+
+    def connect_error(self) -> ChatTimeout:
+        """建立连接时 socket 超时对应的异常"""
+        return self._connect_error
+
+    def read_error(self) -> ChatTimeout:
+        """等待响应时 socket 超时对应的异常"""
+        return self._read_error
+
+    def touch(self) -> None:
+        """收到一个输出片段并交给调用方，调用方处理期间不计算空闲时间"""
+        first = self.last_chunk is None
+        self.last_chunk = time.monotonic()
+        self.paused = True
+        if first and self._wake is not None:
+            # 从首字阶段进入空闲阶段，截止时间可能提前，需要唤醒看门狗重新计算
+            self._wake()
+
+    def resume(self) -> None:
+        """调用方处理完片段，开始等待下一个"""
+        self.last_chunk = time.monotonic()
+        self.paused = False
+
+    def next_expiry(self) -> Optional[Tuple[float, Optional[ChatTimeout]]]:
+        """最近的截止时间及到期时应抛出的异常
+
+        异常为 None 表示只需要在该时间重新检查：调用方正在处理片段时，空闲计时最早从现在开始。
+        """
+        candidates = []
+        timeouts = self.timeouts
+        if timeouts.total is not None:
+            candidates.append((self.started + timeouts.total, TotalTimeout(timeouts.total)))
+        if self.last_chunk is None:
+            if timeouts.first_token is not None:
+                candidates.append((self.start + timeouts.first_token, FirstTokenTimeout(timeouts.first_token)))
+        elif timeouts.idle is not None:
+            if self.paused:
+                candidates.append((time.monotonic() + timeouts.idle, None))
+            else:
+                candidates.append((self.last_chunk + timeouts.idle, IdleTimeout(timeouts.idle)))
+        return min(candidates, key=lambda item: item[0]) if candidates else None
+
+    def check(self) -> None:
+        """已到期时抛出对应的超时异常"""
+        if self.expired is None:
+            expiry = self.next_expiry()
+            if expiry is not None and expiry[1] is not None and expiry[0] <= time.monotonic():
+                self.expired = expiry[1]
+        if self.expired is not None:
+            raise self.expired
+
+class _Watchdog:
+    """后台线程：截止时间到期时调用回调（通常是断开上游连接）"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._watched: Set[Tuple[Deadline, Callable[[], None]]] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, deadline: Deadline, on_expire: Callable[[], None]) -> Callable[[], None]:
+        """开始检查截止时间
+
+        Returns:
+            Callable[[], None]: 调用后停止检查
+        """
+        entry = (deadline, on_expire)
+        deadline._wake = self._wake
+        with self._cond:
+            self._watched.add(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ai-palette-watchdog", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+        def unwatch() -> None:
+            with self._cond:
+                self._watched.discard(entry)
+        return unwatch
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            expired = []
+            with self._cond:
+                now = time.monotonic()
+                nearest = None
+                for entry in list(self._watched):
+                    expiry = entry[0].next_expiry()
+                    if expiry is None:
+                        continue
+                    if expiry[0] <= now and expiry[1] is not None:
+                        entry[0].expired = expiry[1]
+                        self._watched.discard(entry)
+                        expired.append(entry)
+                    elif nearest is None or expiry[0] < nearest:
+                        nearest = expiry[0]
+                if not expired:
+                    # 之后的片段只会推迟截止时间，醒来后重新计算即可
+                    self._cond.wait(None if nearest is None else nearest - now)
+                    continue
+            for _, on_expire in expired:
+                try:
+                    on_expire()
+                except Exception:
+                    pass
+
+watchdog = _Watchdog()
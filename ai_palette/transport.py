@@ -0,0 +1,422 @@
+import os
+import time
+import socket
+import threading
+from urllib.parse import urlsplit
+from contextlib import contextmanager
+from typing import Optional, Callable, Dict, Iterator, Tuple, List, Any, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 每个主机保留的最大连接数
+POOL_MAXSIZE = 64
+
+_local = threading.local()
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+class _TracingPoolMixin:
+    """在从连接池取得连接时通知当前线程注册的回调"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        callback = getattr(_local, "on_connection", None)
+        if callback is not None:
+            callback(self.host, getattr(conn, "sock", None) is not None)
+        return conn
+
+class _TracingHTTPConnectionPool(_TracingPoolMixin, HTTPConnectionPool):
+    pass
+
+class _TracingHTTPSConnectionPool(_TracingPoolMixin, HTTPSConnectionPool):
+    pass
+
+class _TracingAdapter(HTTPAdapter):
+    """使用可追踪连接池的 HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TracingHTTPConnectionPool,
+            "https": _TracingHTTPSConnectionPool
+        }
+
+def get_session() -> requests.Session:
+    """获取进程内共享的 HTTP 会话
+
+    所有 AIChat 实例共用同一个连接池，同一主机的后续请求可以复用已建立的
+    TCP/TLS 连接。
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = _TracingAdapter(pool_connections=16, pool_maxsize=POOL_MAXSIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+@contextmanager
+def trace_connections(callback: Optional[Callable[[str, bool], None]]):
+    """在当前线程内追踪连接获取
+
+    Args:
+        callback: 回调函数，参数为 (host, reused)；为 None 时不追踪
+    """
+    if callback is None:
+        yield
+        return
+    previous = getattr(_local, "on_connection", None)
+    _local.on_connection = callback
+    try:
+        yield
+    finally:
+        _local.on_connection = previous
+
+# ---- 可选的 HTTP/2 传输（httpx + h2） ----
+
+# HTTP/2 传输每个主机的最大连接数，可以用 AI_PALETTE_HTTP2_MAX_CONNECTIONS 环境变量修改。
+# HTTP/2 连接可以并发多路请求，只有单个连接的并发流达到服务端上限时才会新建连接；
+# 协商为 HTTP/1.1 时（例如明文 http:// 地址）这就是该主机的并发请求上限，因此与 POOL_MAXSIZE 一致
+HTTP2_MAX_CONNECTIONS = POOL_MAXSIZE
+
+_http2_session: Optional["HTTP2Session"] = None
+
+def http2_available() -> bool:
+    """是否安装了 HTTP/2 所需的 httpx 和 h2"""
+    from importlib.util import find_spec
+    return find_spec("httpx") is not None and find_spec("h2") is not None
+
+@contextmanager
+def _translate_errors():
+    """把 httpx 异常转换为对应的 requests 异常，使重试和错误处理保持一致"""
+    import httpx
+    try:
+        yield
+    except httpx.ConnectTimeout as e:
+        raise requests.exceptions.ConnectTimeout(str(e)) from e
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.ReadTimeout(str(e)) from e
+    except httpx.TransportError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.exceptions.RequestException(str(e)) from e
+
+def _httpx_timeout(timeout):
+    """把 requests 的 (连接超时, 读取超时) 转换为 httpx.Timeout"""
+    if isinstance(timeout, tuple):
+        import httpx
+        return httpx.Timeout(timeout[1], connect=timeout[0])
+    return timeout
+
+class HTTP2Response:
+    """把 httpx.Response 包装为 AIChat 使用的 requests.Response 接口"""
+
+    request = None
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.reason = response.reason_phrase
+        self.http_version = response.http_version
+        self.url = str(response.url)
+
+    @property
+    def content(self) -> bytes:
+        with _translate_errors():
+            return self._response.read()
+
+    @property
+    def text(self) -> str:
+        self.content
+        return self._response.text
+
+    def json(self, **kwargs):
+        self.content
+        return self._response.json(**kwargs)
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """按行读取响应体（与 requests 的行切分方式一致）"""
+        pending = None
+        with _translate_errors():
+            for chunk in self._response.iter_bytes():
+                if pending is not None:
+                    chunk = pending + chunk
+                lines = chunk.splitlines()
+                if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+                    pending = lines.pop()
+                else:
+                    pending = None
+                yield from lines
+        if pending is not None:
+            yield pending
+
+    def raise_for_status(self) -> None:
+        if 400 <= self.status_code < 600:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise requests.exceptions.HTTPError(
+                f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}", response=self)
+
+    def close(self) -> None:
+        self._response.close()
+
+    def abort(self) -> None:
+        """立即中断响应（可以在其他线程调用）
+
+        HTTP/2 连接上还有其他请求的流，只重置本请求的流；HTTP/1.1 与 requests 传输一样
+        shutdown 底层 socket，阻塞在读取上的线程随即出错返回。
+        """
+        if self.http_version == "HTTP/2" and _reset_http2_stream(self._response):
+            # 读取线程被唤醒后自己关闭响应；在这里关闭会使它一直等到读取超时
+            return
+        network_stream = self._response.extensions.get("network_stream")
+        sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.close()
+
+# _reset_http2_stream 用到的 httpcore HTTP2Connection 内部属性
+_HTTP2_CONNECTION_INTERNALS = ("_write_lock", "_events", "_h2_state", "_write_outgoing_data")
+
+def _reset_http2_stream(response) -> bool:
+    """重置（RST_STREAM）httpx 响应所在的 HTTP/2 流，并唤醒阻塞在该连接上读取的线程
+
+    httpcore 的同一连接上所有流由一个线程代为读取。只关闭响应时读取线程不会返回，
+    要一直等到读取超时，并因此把整个连接标记为出错。这里先在该流的事件队列中放入
+    StreamReset，再发送 RST_STREAM 和 PING：服务端的 PING 应答唤醒读取线程，它看到
+    StreamReset 后抛出异常并关闭本请求的流，连接上的其他流不受影响。
+
+    依赖 httpx/httpcore（0.17 至 1.x）和 h2 的内部结构，使用前逐一检查，结构不符合预期时
+    不做任何修改并返回 False，由调用方断开整个连接。
+
+    Returns:
+        bool: 是否已经处理（包括响应已经结束的情况）
+    """
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+    stream = getattr(response, "stream", None)
+    for name in ("_stream", "_httpcore_stream", "_stream"):
+        stream = getattr(stream, name, None)
+    connection = getattr(stream, "_connection", None)
+    stream_id = getattr(stream, "_stream_id", None)
+    if connection is None or stream_id is None or not hasattr(stream, "_request"):
+        return False
+    if not all(hasattr(connection, name) for name in _HTTP2_CONNECTION_INTERNALS):
+        return False
+    state = connection._h2_state
+    if not (callable(getattr(state, "reset_stream", None)) and callable(getattr(state, "ping", None))
+            and isinstance(connection._events, dict)):
+        return False
+    cancel = h2.errors.ErrorCodes.CANCEL
+    try:
+        event = h2.events.StreamReset(stream_id=stream_id, error_code=cancel)
+    except TypeError:
+        # h2 4.2 之前的事件没有构造参数
+        event = h2.events.StreamReset()
+        event.stream_id, event.error_code = stream_id, cancel
+    try:
+        with connection._write_lock:
+            events = connection._events.get(stream_id)
+            if events is None:
+                return True
+            events.append(event)
+            try:
+                state.reset_stream(stream_id, cancel)
+            except h2.exceptions.StreamClosedError:
+                # 服务端已经结束了这个流，剩余事件都在队列中，读取线程不会再阻塞
+                return True
+            state.ping(b"aipalett")
+        connection._write_outgoing_data(stream._request)
+    except Exception:
+        return False
+    return True
+
+class HTTP2Session:
+    """基于 httpx 的 HTTP/2 会话，提供与 requests.Session.post 相同的调用方式
+
+    同一主机的并发请求和流式响应复用少量多路复用连接，不再每个并发请求占用一个连接。
+    httpx 的连接数限制作用于整个客户端，因此每个主机使用独立的客户端，连接数按主机限制，
+    一个供应商的大量请求不会占满其他供应商的连接。
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, http1: bool = True):
+        """
+        Args:
+            max_connections: 每个主机的最大连接数，为空时读取 AI_PALETTE_HTTP2_MAX_CONNECTIONS 环境变量，
+                默认 HTTP2_MAX_CONNECTIONS
+            http1: 是否允许协商为 HTTP/1.1；为 False 时明文 http:// 地址也直接使用 HTTP/2（h2c），
+                用于只支持 h2c 的内网网关
+
+        Raises:
+            ValueError: 连接数不是正整数
+        """
+        if max_connections is None:
+            value = os.getenv("AI_PALETTE_HTTP2_MAX_CONNECTIONS")
+            try:
+                max_connections = int(value) if value else HTTP2_MAX_CONNECTIONS
+            except ValueError:
+                raise ValueError(f"AI_PALETTE_HTTP2_MAX_CONNECTIONS 必须是整数: {value}")
+        if max_connections <= 0:
+            raise ValueError("HTTP/2 每个主机的最大连接数必须大于 0")
+        self.max_connections = max_connections
+        self.http1 = http1
+        self._clients: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+
+    def _client(self, url: str):
+        """获取 url 所在主机的 httpx 客户端"""
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    import httpx
+                    client = httpx.Client(
+                        http1=self.http1,
+                        http2=True,
+                        limits=httpx.Limits(max_connections=self.max_connections,
+                                            max_keepalive_connections=self.max_connections)
+                    )
+                    self._clients[key] = client
+        return client
+
+    def post(self, url: str, headers: Optional[Dict[str, str]] = None, data: Optional[bytes] = None,
+             stream: bool = False, timeout: Union[float, Tuple[Optional[float], Optional[float]], None] = None) -> HTTP2Response:
+        client = self._client(url)
+        request = client.build_request("POST", url, headers=headers, content=data, timeout=_httpx_timeout(timeout))
+        with _translate_errors():
+            response = client.send(request, stream=stream)
+        return HTTP2Response(response)
+
+    def head(self, url: str, timeout: Union[float, Tuple[Optional[float], Optional[float]], None] = None) -> HTTP2Response:
+        with _translate_errors():
+            response = self._client(url).head(url, timeout=_httpx_timeout(timeout))
+        return HTTP2Response(response)
+
+    def close(self) -> None:
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+        for client in clients:
+            client.close()
+
+def get_http2_session() -> HTTP2Session:
+    """获取进程内共享的 HTTP/2 会话（需要安装 httpx[http2]）"""
+    global _http2_session
+    if _http2_session is None:
+        with _session_lock:
+            if _http2_session is None:
+                _http2_session = HTTP2Session()
+    return _http2_session
+
+def _response_socket(response) -> Optional[socket.socket]:
+    """取 requests 响应底层的 socket
+
+    服务端声明读完即关闭连接（HTTP/1.0 或 Connection: close）时，http.client 会把
+    socket 交给响应对象并清空连接上的引用，此时从响应的文件对象上取。
+    """
+    raw = getattr(response, "raw", None)
+    sock = getattr(getattr(raw, "connection", None), "sock", None)
+    if sock is None:
+        fp = getattr(getattr(raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    return sock
+
+def abort_response(response) -> None:
+    """立即中断响应（可以在其他线程调用）
+
+    只关闭响应不会唤醒阻塞在 recv 上的读取线程，因此先 shutdown 底层 socket，
+    读取线程随即出错返回，连接也不会再放回连接池。
+    """
+    abort = getattr(response, "abort", None)
+    if abort is not None:
+        abort()
+        return
+    sock = _response_socket(response)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    response.close()
+
+def set_read_timeout(response, timeout: Optional[float]) -> None:
+    """修改流式响应后续读取的 socket 超时（HTTP/2 响应不支持，保持发送时的设置）"""
+    sock = _response_socket(response)
+    if sock is not None:
+        try:
+            sock.settimeout(timeout)
+        except OSError:
+            pass
+
+def is_read_timeout(error: BaseException) -> bool:
+    """是否为读取超时（requests 在读取响应体时把读取超时包装为 ConnectionError）"""
+    from urllib3.exceptions import ReadTimeoutError
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return True
+    return isinstance(error, requests.exceptions.ConnectionError) and bool(error.args) \
+        and isinstance(error.args[0], ReadTimeoutError)
+
+# ---- 预连接与 DNS 缓存 ----
+
+def preconnect(session, url: str, timeout: float = 10.0) -> None:
+    """向 url 所在主机发送一次 HEAD 请求，使解析好的 DNS 和建立好的 TCP/TLS 连接留在连接池中
+
+    只关心连接是否建立，不检查响应状态码。
+
+    Args:
+        session: get_session() 或 get_http2_session() 返回的会话
+        url: 目标地址，只使用其中的协议和主机
+        timeout: 超时时间（秒）
+    """
+    parts = urlsplit(url)
+    response = session.head(f"{parts.scheme}://{parts.netloc}/", timeout=timeout)
+    response.close()
+
+_original_getaddrinfo: Optional[Callable[..., List[Any]]] = None
+_dns_cache: Dict[Tuple[Any, ...], Tuple[float, List[Any]]] = {}
+_dns_ttl = 0.0
+
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    key = (host, port, family, type, proto, flags)
+    now = time.monotonic()
+    cached = _dns_cache.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    result = _original_getaddrinfo(host, port, family, type, proto, flags)
+    _dns_cache[key] = (now + _dns_ttl, result)
+    return result
+
+def enable_dns_cache(ttl: float = 300.0) -> None:
+    """在进程内缓存 DNS 解析结果
+
+    替换 socket.getaddrinfo，对 requests 和 HTTP/2 传输的新建连接都生效。解析失败不缓存。
+
+    Args:
+        ttl: 缓存有效期（秒）
+    """
+    global _original_getaddrinfo, _dns_ttl
+    if ttl <= 0:
+        raise ValueError("DNS 缓存有效期必须大于 0")
+    _dns_ttl = ttl
+    if _original_getaddrinfo is None:
+        _original_getaddrinfo = socket.getaddrinfo
+        socket.getaddrinfo = _cached_getaddrinfo
+
+def disable_dns_cache() -> None:
+    """关闭 DNS 缓存并清空已缓存的结果"""
+    global _original_getaddrinfo
+    if _original_getaddrinfo is not None:
+        socket.getaddrinfo = _original_getaddrinfo
+        _original_getaddrinfo = None
+    _dns_cache.clear()
@@ -0,0 +1,140 @@
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any, Tuple, Union
+
+@dataclass
+class Usage:
+    """单次请求的 token 用量
+
+    各供应商的字段名不同，统一为 OpenAI 的命名：
+    - prompt_tokens: 输入 token（Dashscope input_tokens、Ollama prompt_eval_count）
+    - completion_tokens: 输出 token（Dashscope output_tokens、Ollama eval_count）
+    - cached_tokens: 命中缓存的输入 token（OpenAI prompt_tokens_details.cached_tokens、
+      DeepSeek prompt_cache_hit_tokens）
+    - reasoning_tokens: 输出中的推理 token
+    """
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    cached_tokens: int = 0
+    reasoning_tokens: int = 0
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, raw: Optional[Dict[str, Any]]) -> Optional["Usage"]:
+        """从供应商返回的 usage 字段构造，raw 为空时返回 None"""
+        if not raw:
+            return None
+        prompt = raw.get("prompt_tokens", raw.get("input_tokens", raw.get("prompt_eval_count"))) or 0
+        completion = raw.get("completion_tokens", raw.get("output_tokens", raw.get("eval_count"))) or 0
+        prompt_details = raw.get("prompt_tokens_details") or {}
+        completion_details = raw.get("completion_tokens_details") or {}
+        cached = prompt_details.get("cached_tokens", raw.get("prompt_cache_hit_tokens")) or 0
+        reasoning = completion_details.get("reasoning_tokens") or 0
+        return cls(
+            prompt_tokens=prompt,
+            completion_tokens=completion,
+            total_tokens=raw.get("total_tokens") or prompt + completion,
+            cached_tokens=cached,
+            reasoning_tokens=reasoning,
+            raw=raw
+        )
+
+    def to_dict(self) -> Dict[str, int]:
+        data = asdict(self)
+        data.pop("raw")
+        return data
+
+@dataclass
+class ModelPrice:
+    """模型价格（每百万 token），cached 为空时缓存命中按 input 计价"""
+    input: float
+    output: float
+    cached: Optional[float] = None
+    currency: str = "CNY"
+
+    def cost(self, usage: Usage) -> float:
+        cached_price = self.input if self.cached is None else self.cached
+        uncached = max(usage.prompt_tokens - usage.cached_tokens, 0)
+        return (uncached * self.input + usage.cached_tokens * cached_price
+                + usage.completion_tokens * self.output) / 1_000_000
+
+class UsageTracker:
+    """按 provider/model 汇总 token 用量和估算费用（线程安全）"""
+
+    _FIELDS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens",
+               "reasoning_tokens", "cost")
+
+    def __init__(self, prices: Optional[Dict[Union[str, Tuple[str, str]], ModelPrice]] = None):
+        self._lock = threading.Lock()
+        self._totals: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._prices: Dict[Union[str, Tuple[str, str]], ModelPrice] = dict(prices or {})
+
+    def set_price(self, model: str, price: ModelPrice, provider: Optional[str] = None) -> None:
+        """设置模型价格
+
+        Args:
+            model: 模型名称
+            price: 模型价格
+            provider: 供应商，为空时对所有供应商的同名模型生效
+        """
+        with self._lock:
+            self._prices[(provider, model) if provider else model] = price
+
+    def _price_for(self, provider: str, model: str) -> Optional[ModelPrice]:
+        return self._prices.get((provider, model)) or self._prices.get(model)
+
+    def record(self, provider: str, model: str, usage: Optional[Usage]) -> None:
+        """记录一次请求的用量，usage 为空时只计请求数"""
+        with self._lock:
+            totals = self._totals.get((provider, model))
+            if totals is None:
+                totals = self._totals[(provider, model)] = dict.fromkeys(self._FIELDS, 0)
+            totals["requests"] += 1
+            if usage is None:
+                return
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+            totals["total_tokens"] += usage.total_tokens
+            totals["cached_tokens"] += usage.cached_tokens
+            totals["reasoning_tokens"] += usage.reasoning_tokens
+            price = self._price_for(provider, model)
+            if price is not None:
+                totals["cost"] += price.cost(usage)
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """获取汇总结果：{provider: {model: {requests, prompt_tokens, ..., cost}}}"""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self._lock:
+            for (provider, model), totals in self._totals.items():
+                result.setdefault(provider, {})[model] = dict(totals)
+        return result
+
+    def totals(self) -> Dict[str, float]:
+        """所有 provider/model 的合计"""
+        total = dict.fromkeys(self._FIELDS, 0)
+        with self._lock:
+            for totals in self._totals.values():
+                for key in self._FIELDS:
+                    total[key] += totals[key]
+        return total
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+# 进程内默认的用量汇总，所有 AIChat 实例都会写入
+tracker = UsageTracker()
+
+def get_usage() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """获取进程内按 provider/model 汇总的 token 用量和费用"""
+    return tracker.snapshot()
+
+def reset_usage() -> None:
+    """清空进程内的用量汇总"""
+    tracker.reset()
+
+def set_price(model: str, input: float, output: float, cached: Optional[float] = None,
+              provider: Optional[str] = None) -> None:
+    """设置默认汇总使用的模型价格（每百万 token）"""
+    tracker.set_price(model, ModelPrice(input=input, output=output, cached=cached), provider)
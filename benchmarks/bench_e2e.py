@@ -0,0 +1,288 @@
+"""端到端吞吐/延迟基准测试
+
+针对本地模拟供应商服务（独立子进程）在不同并发度下驱动：
+- sync:          AIChat.ask 普通请求
+- stream:        AIChat.ask 流式请求（逐片段读取）
+- server_chat:   Web 服务 /api/chat 普通请求
+- server_stream: Web 服务 /api/chat 流式请求
+
+输出每个场景、每个并发度的 req/s、p50/p95/p99 延迟、首字耗时、每个片段的 CPU 时间和峰值 RSS，
+结果以 JSON 保存，可以与之前的结果对比以发现性能回退。
+AIChat 目前只有同步接口（流式也是同步生成器），没有异步路径可测。
+
+用法：
+    python benchmarks/bench_e2e.py --output bench.json
+    python benchmarks/bench_e2e.py --concurrency 1 8 32 --requests 200 --compare baseline.json
+"""
+import os
+import sys
+import json
+import time
+import logging
+import socket
+import argparse
+import platform
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from ai_palette import AIChat, set_metrics_enabled
+from ai_palette.mock_server import CHAT_PATHS
+
+SCENARIOS = ("sync", "stream", "server_chat", "server_stream")
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """计算分位数（最近秩法）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值常驻内存（MB）"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class MockProcess:
+    """在独立子进程中运行模拟服务，避免其 CPU 计入被测进程"""
+
+    def __init__(self, latency: float, token_rate: float):
+        self.port = free_port()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "ai_palette.mock_server", "--port", str(self.port),
+             "--latency", str(latency), "--token-rate", str(token_rate)],
+            stdout=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            try:
+                requests.get(f"{self.base_url}/health", timeout=0.5)
+                return
+            except requests.RequestException:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError("模拟服务启动失败")
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def url_for(self, provider: str) -> str:
+        return f"{self.base_url}/{provider}{CHAT_PATHS[provider]}"
+
+    def stop(self) -> None:
+        self.process.terminate()
+        self.process.wait(timeout=5)
+
+class AppServer:
+    """在后台线程中运行 Flask 应用"""
+
+    def __init__(self):
+        from werkzeug.serving import make_server
+        from ai_palette.app import app
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        self.server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.port = self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+def make_request_fn(scenario: str, provider: str, mock: MockProcess, app: Optional[AppServer]) -> Callable[[], Dict[str, Any]]:
+    """构造单次请求函数，返回 {"latency", "ttft", "chunks"}"""
+    chat_kwargs = {"provider": provider, "model": f"mock-{provider}", "api_key": "bench-key",
+                   "api_url": mock.url_for(provider), "timeout": 60}
+
+    if scenario == "sync":
+        chat = AIChat(**chat_kwargs)
+
+        def run() -> Dict[str, Any]:
+            start = time.perf_counter()
+            chat.ask("benchmark")
+            return {"latency": time.perf_counter() - start, "ttft": None, "chunks": 0}
+        return run
+
+    if scenario == "stream":
+        chat = AIChat(**chat_kwargs)
+
+        def run() -> Dict[str, Any]:
+            start = time.perf_counter()
+            ttft = None
+            chunks = 0
+            for _ in chat.ask("benchmark", stream=True):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                chunks += 1
+            return {"latency": time.perf_counter() - start, "ttft": ttft, "chunks": chunks}
+        return run
+
+    session = requests.Session()
+    stream = scenario == "server_stream"
+    payload = {
+        "model_type": provider,
+        "api_key": "bench-key",
+        "model": f"mock-{provider}",
+        "prompt": "benchmark",
+        "enable_streaming": stream,
+        "timeout": 60
+    }
+    os.environ[f"{provider.upper()}_API_URL"] = mock.url_for(provider)
+
+    def run() -> Dict[str, Any]:
+        start = time.perf_counter()
+        ttft = None
+        frames = 0
+        response = session.post(f"{app.base_url}/api/chat", json=payload, stream=stream, timeout=60)
+        if stream:
+            for line in response.iter_lines():
+                if line.startswith(b"data: "):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    frames += 1
+        else:
+            response.content
+        response.raise_for_status()
+        return {"latency": time.perf_counter() - start, "ttft": ttft, "chunks": frames}
+    return run
+
+def run_level(run: Callable[[], Dict[str, Any]], concurrency: int, total: int) -> Dict[str, Any]:
+    """在给定并发度下执行 total 个请求"""
+    samples: List[Dict[str, Any]] = []
+    errors: Dict[str, int] = {}
+    lock = threading.Lock()
+
+    def worker(_):
+        try:
+            sample = run()
+            with lock:
+                samples.append(sample)
+        except Exception as e:
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(total)))
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    latencies = [s["latency"] for s in samples]
+    ttfts = [s["ttft"] for s in samples if s["ttft"] is not None]
+    chunks = sum(s["chunks"] for s in samples)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(samples),
+        "errors": errors,
+        "wall_seconds": wall,
+        "req_per_sec": len(samples) / wall if wall else None,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "ttft_p50": percentile(ttfts, 0.50),
+        "ttft_p95": percentile(ttfts, 0.95),
+        "ttft_p99": percentile(ttfts, 0.99),
+        "cpu_seconds": cpu,
+        "cpu_ms_per_request": cpu * 1000 / len(samples) if samples else None,
+        "cpu_us_per_chunk": cpu * 1e6 / chunks if chunks else None,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def compare(results: Dict[str, Any], baseline_path: str, threshold: float) -> List[str]:
+    """与基线结果对比，返回退化项描述"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    index = {(r["scenario"], r["provider"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for current in results["results"]:
+        key = (current["scenario"], current["provider"], current["concurrency"])
+        base = index.get(key)
+        if not base:
+            continue
+        for metric, higher_is_better in (("req_per_sec", True), ("latency_p95", False),
+                                         ("ttft_p95", False), ("cpu_us_per_chunk", False)):
+            old, new = base.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (higher_is_better and change < -threshold) or (not higher_is_better and change > threshold):
+                regressions.append(f"{key} {metric}: {old:.6g} -> {new:.6g} ({change:+.1%})")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="AI Palette 端到端基准测试")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--provider", default="deepseek", help="模拟的供应商格式")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=100, help="每个并发度的请求数")
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务首字节延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="模拟服务输出速度（片段/秒）")
+    parser.add_argument("--output", default="bench_e2e.json", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="基线结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定为退化的相对变化")
+    args = parser.parse_args()
+
+    set_metrics_enabled(False)  # 基准测试只测量请求路径本身
+    mock = MockProcess(args.latency, args.token_rate)
+    app = AppServer() if any(s.startswith("server") for s in args.scenarios) else None
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args)
+        },
+        "results": []
+    }
+    try:
+        for scenario in args.scenarios:
+            run = make_request_fn(scenario, args.provider, mock, app)
+            run()  # 预热连接
+            for concurrency in args.concurrency:
+                total = max(args.requests, concurrency)
+                result = run_level(run, concurrency, total)
+                result.update({"scenario": scenario, "provider": args.provider})
+                results["results"].append(result)
+                print(f"{scenario:14s} c={concurrency:<4d} {result['req_per_sec'] or 0:8.1f} req/s  "
+                      f"p50={result['latency_p50'] or 0:.4f}s p95={result['latency_p95'] or 0:.4f}s "
+                      f"p99={result['latency_p99'] or 0:.4f}s errors={sum(result['errors'].values())}")
+    finally:
+        if app is not None:
+            app.stop()
+        mock.stop()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"性能退化: {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""import ai_palette 的耗时基准
+
+在全新的子进程中反复执行 import，输出中位数/最小值以及 ai_palette 自身和耗时最多的依赖模块
+（来自 -X importtime），并检查较重的依赖没有在导入时被加载。
+
+用法：
+    python benchmarks/bench_import.py --runs 20
+    python benchmarks/bench_import.py --max-ms 50   # 超过阈值时以非零状态码退出
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import ai_palette 时不应加载的模块
+HEAVY_MODULES = ("requests", "urllib3", "aiohttp", "asyncio", "loguru", "dotenv", "flask",
+                 "concurrent.futures", "httpx")
+
+def import_once(module: str) -> Tuple[Dict[str, int], List[str]]:
+    """在子进程中导入一次，返回 {模块: 累计耗时(us)} 和被加载的重依赖"""
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    # 只保留 module 自身及其导入的子树（-X importtime 按缩进表示层级，子模块先于父模块输出）
+    entries: List[Tuple[str, int, int]] = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        entries.append((name.strip(), len(name) - len(name.lstrip()) - 1, int(parts[1])))
+    timings: Dict[str, int] = {}
+    for name, depth, cumulative in reversed(entries):
+        if timings and depth == 0:
+            break
+        if timings or name == module:
+            timings[name] = cumulative
+    return timings, json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="import ai_palette 耗时基准")
+    parser.add_argument("--module", default="ai_palette")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="显示耗时最多的依赖模块数")
+    parser.add_argument("--max-ms", type=float, help="中位数超过该值时返回非零状态码")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    samples: List[Dict[str, int]] = []
+    heavy: List[str] = []
+    for _ in range(args.runs):
+        timings, loaded = import_once(args.module)
+        totals.append(timings.get(args.module, 0) / 1000)
+        samples.append(timings)
+        heavy = loaded
+
+    median = statistics.median(totals)
+    print(f"import {args.module}: 中位数 {median:.1f} ms，最小 {min(totals):.1f} ms（{args.runs} 次）")
+    last = samples[-1]
+    top = sorted(((name, us) for name, us in last.items() if name != args.module), key=lambda x: -x[1])[:args.top]
+    for name, us in top:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+    if heavy:
+        print(f"导入时加载了较重的依赖: {', '.join(heavy)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"module": args.module, "runs": totals, "median_ms": median,
+                       "heavy_modules": heavy, "top": top}, f, ensure_ascii=False, indent=2)
+
+    if heavy or (args.max_ms is not None and median > args.max_ms):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""请求/片段级微基准测试
+
+不访问网络，单独测量库自身的 CPU 开销：
+- _prepare_messages / _prepare_request_data / 请求体编码（大上下文）
+- 各供应商请求头构造
+- 各流式格式的逐行解析（使用 fixtures/ 下录制的原始响应行）
+- app.py 中 <think> 思考过程的剥离
+
+流式解析的结果按“每行”和“每个输出片段”的微秒数给出，它决定了单核能同时转发多少路流。
+
+用法：
+    python benchmarks/bench_micro.py --output micro.json
+    python benchmarks/bench_micro.py --compare micro.json
+    python benchmarks/bench_micro.py --record   # 用模拟服务重新录制 fixtures
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+from typing import Callable, Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai_palette import AIChat, Message, set_metrics_enabled
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# 每种流式格式用一个代表性的供应商录制
+STREAM_FORMATS = {
+    "openai": "openai",
+    "dashscope": "dashscope",
+    "ollama": "ollama",
+    "deepseek": "deepseek"
+}
+
+HEADER_PROVIDERS = ("openai", "dashscope", "zhipu", "minimax", "deepseek", "siliconflow", "ollama")
+
+def fixture_path(name: str) -> str:
+    return os.path.join(FIXTURE_DIR, f"{name}.stream")
+
+def load_fixture(name: str) -> List[bytes]:
+    """读取录制的原始响应行（保留空行）"""
+    with open(fixture_path(name), "rb") as f:
+        return f.read().split(b"\n")
+
+def record_fixtures(chunks: int) -> None:
+    """从模拟服务录制各流式格式的原始响应行"""
+    from ai_palette.mock_server import MockProviderServer, MockConfig
+    from ai_palette.transport import get_session
+
+    text = ("流式解析基准测试的回答内容，" * chunks)[:chunks * 2]
+    reasoning = ("推理过程，" * chunks)[:chunks * 2]
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    with MockProviderServer(MockConfig(response_text=text, reasoning_text=reasoning, chunk_size=2)) as server:
+        for name, provider in STREAM_FORMATS.items():
+            chat = AIChat(**server.chat_kwargs(provider))
+            data = chat._prepare_request_data(chat._prepare_messages("你好"), stream=True)
+            response = get_session().post(chat._get_api_url(), headers=chat._get_headers(), json=data, stream=True)
+            response.raise_for_status()
+            lines = list(response.iter_lines())
+            with open(fixture_path(name), "wb") as f:
+                f.write(b"\n".join(lines))
+            print(f"已录制 {name}: {len(lines)} 行")
+
+def measure(func: Callable[[], Any], min_time: float, repeat: int) -> float:
+    """返回单次调用的最佳耗时（秒）"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def large_context_chat(provider: str, turns: int, message_chars: int) -> AIChat:
+    chat = AIChat(provider=provider, model=f"bench-{provider}", api_key="bench-key")
+    chat.add_context("你是一个乐于助人的助手。" * 10)
+    for i in range(turns):
+        chat.add_context(("用户问题" * message_chars)[:message_chars], role="user")
+        chat.add_context(("助手回答" * message_chars)[:message_chars], role="assistant")
+    return chat
+
+def run_benchmarks(args) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+
+    def add(name: str, func: Callable[[], Any], **extra) -> None:
+        seconds = measure(func, args.min_time, args.repeat)
+        item = {"name": name, "us_per_op": seconds * 1e6}
+        for key, count in extra.items():
+            item[f"us_per_{key}"] = seconds * 1e6 / count if count else None
+        results.append(item)
+        detail = "  ".join(f"{k}={v:.3f}" for k, v in item.items() if k.startswith("us_per_") and v is not None)
+        print(f"{name:40s} {detail}")
+
+    # 消息与请求体构造
+    history = [Message(role="user", content="额外历史" * 50) for _ in range(10)]
+    for provider in ("openai", "ollama", "deepseek"):
+        chat = large_context_chat(provider, args.turns, args.message_chars)
+        messages = chat._prepare_messages("你好", history)
+        data = chat._prepare_request_data(messages, stream=True)
+        trace = chat._new_trace()
+        add(f"prepare_messages[{provider}]", lambda: chat._prepare_messages("你好", history),
+            message=len(messages))
+        add(f"prepare_request_data[{provider}]", lambda: chat._prepare_request_data(messages, True),
+            message=len(messages))
+        add(f"encode_body[{provider}]", lambda: chat._encode_body(data, trace),
+            kb=len(json.dumps(data).encode("utf-8")) / 1024)
+
+    # 请求头（ERNIE 需要网络获取 token，不在此测量）
+    for provider in HEADER_PROVIDERS:
+        chat = AIChat(provider=provider, model="bench", api_key="bench-key")
+        add(f"headers[{provider}]", chat._get_headers)
+
+    # 流式逐行解析
+    for name, provider in STREAM_FORMATS.items():
+        if not os.path.exists(fixture_path(name)):
+            print(f"缺少 fixture {name}，请先运行 --record")
+            continue
+        lines = load_fixture(name)
+        chat = AIChat(provider=provider, model="bench", api_key="bench-key")
+        chunks = sum(1 for _ in chat._parse_stream(lines))
+        add(f"parse_stream[{name}]", lambda: list(chat._parse_stream(lines)),
+            line=len(lines), chunk=chunks)
+
+    # <think> 剥离
+    from ai_palette.app import _strip_think, _clean_context
+    thought = "<think>" + "思考过程" * 2000 + "</think>" + "最终回答" * 500
+    add("strip_think[large]", lambda: _strip_think(thought), kb=len(thought.encode("utf-8")) / 1024)
+    context = [{"role": "user" if i % 2 == 0 else "assistant", "content": thought if i % 2 else "问题" * 100}
+               for i in range(args.turns * 2)]
+    add("clean_context[large]", lambda: _clean_context(context), message=len(context))
+    return results
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, threshold: float) -> List[str]:
+    """与基线结果对比，返回变慢超过阈值的项目"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {item["name"]: item for item in json.load(f).get("results", [])}
+    regressions = []
+    for item in results:
+        base = baseline.get(item["name"])
+        if not base or not base.get("us_per_op"):
+            continue
+        change = (item["us_per_op"] - base["us_per_op"]) / base["us_per_op"]
+        if change > threshold:
+            regressions.append(f"{item['name']}: {base['us_per_op']:.3f}us -> {item['us_per_op']:.3f}us ({change:+.1%})")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="AI Palette 微基准测试")
+    parser.add_argument("--turns", type=int, default=100, help="上下文对话轮数")
+    parser.add_argument("--message-chars", type=int, default=2000, help="每条上下文消息的字符数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮测量的最短时间（秒）")
+    parser.add_argument("--repeat", type=int, default=5, help="测量轮数，取最佳值")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="基线结果 JSON 文件")
+    parser.add_argument("--threshold", type=float, default=0.10, help="判定为退化的相对变化")
+    parser.add_argument("--record", action="store_true", help="重新录制流式 fixtures 后退出")
+    parser.add_argument("--record-chunks", type=int, default=100, help="录制时每个响应的片段数")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record_chunks)
+        return 0
+
+    set_metrics_enabled(False)
+    results = run_benchmarks(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "args": vars(args)
+                },
+                "results": results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"性能退化: {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -48,10 +48,15 @@ setup(
         'test': [
             'pytest>=7.4.3',
         ],
+        'http2': [
+            'httpx[http2]>=0.24.0,<1.0',
+            'httpcore<2.0',  # 取消 HTTP/2 流时用到 httpcore 的内部结构
+        ],
     },
     entry_points={
         'console_scripts': [
             'ai-palette-server=ai_palette.app:run_server',
+            'ai-palette-batch=ai_palette.batch:run_cli',
         ],
     },
 ) 
\ No newline at end of file
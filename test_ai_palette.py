@@ -1,10 +1,13 @@
 import os
-from ai_palette import AIChat, Message
+from ai_palette import AIChat, Message, load_env
 from typing import Dict, Optional
 import time
 import requests
 import json
 
+# 测试直接读取环境变量中的 API key，需要先加载 .env
+load_env()
+
 # 存储 Ollama 模型名称
 OLLAMA_MODEL = None
 
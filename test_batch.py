@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+import pytest
+from ai_palette import AIChat, RequestScheduler, Lane
+from ai_palette.batch import run_batch, main
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def write_prompts(path, count):
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"q{i}", "prompt": f"问题{i}"}, ensure_ascii=False) + "\n")
+        f.write(json.dumps({"id": "bad"}) + "\n")
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_batch_ordered_with_errors(tmp_path):
+    prompts, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_prompts(prompts, 6)
+    with MockProviderServer(MockConfig(latency=0.02)) as server:
+        chat = AIChat(**server.chat_kwargs("deepseek"))
+        summary = run_batch(chat, str(prompts), str(output), concurrency=3, ordered=True)
+    records = read_records(output)
+    assert [r["id"] for r in records] == [f"q{i}" for i in range(6)] + ["bad"]
+    assert all(r["content"] == DEFAULT_RESPONSE for r in records[:6])
+    assert (summary.total, summary.succeeded, summary.failed) == (7, 6, 1)
+    assert summary.errors == {"ValueError": 1}
+    assert summary.completion_tokens > 0
+
+def test_batch_resume_skips_finished(tmp_path):
+    prompts, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_prompts(prompts, 4)
+    # 模拟中断：两条已完成，最后一行只写了一半
+    output.write_text(json.dumps({"id": "q0", "index": 0, "content": "旧"}) + "\n"
+                      + json.dumps({"id": "q2", "index": 2, "content": "旧"}) + "\n"
+                      + '{"id": "q3", "ind', encoding="utf-8")
+    with MockProviderServer() as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        summary = run_batch(chat, str(prompts), str(output), concurrency=2, rate=50)
+        assert server.chat_count == 2
+    assert (summary.skipped, summary.succeeded, summary.failed) == (2, 2, 1)
+    assert sorted(r["id"] for r in read_records(output)) == ["bad", "q0", "q1", "q2", "q3"]
+
+def test_batch_cli(tmp_path, capsys):
+    prompts, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_prompts(prompts, 2)
+    with MockProviderServer() as server:
+        code = main([str(prompts), str(output), "--provider", "openai", "--model", "m",
+                     "--api-key", "k", "--api-url", server.url_for("openai"), "--concurrency", "2"])
+    assert code == 1  # 有一条失败
+    assert "成功 2，失败 1" in capsys.readouterr().out
+
+def test_batch_uses_lane(tmp_path, monkeypatch):
+    """run_batch 和命令行在调度器的 batch 通道中排队，不改变传入的实例"""
+    import ai_palette
+    prompts, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_prompts(prompts, 2)
+    scheduler = RequestScheduler(max_concurrency=2, lanes={"interactive": Lane(), "batch": Lane()})
+    lanes = []
+    acquire = scheduler.acquire
+    monkeypatch.setattr(scheduler, "acquire", lambda lane, *args, **kwargs: lanes.append(lane) or acquire(lane, *args, **kwargs))
+    with MockProviderServer() as server:
+        chat = AIChat(**server.chat_kwargs("openai"), scheduler=scheduler)
+        run_batch(chat, str(prompts), str(output), lane="batch", resume=False)
+        assert lanes == ["batch", "batch"] and chat.lane == "interactive"
+        with pytest.raises(ValueError):
+            run_batch(chat, str(prompts), str(output), lane="missing", resume=False)
+        # 命令行默认使用 batch 通道
+        monkeypatch.setenv("AI_PALETTE_SCHEDULER", "1")
+        monkeypatch.setattr(ai_palette, "get_scheduler", lambda: scheduler)
+        main([str(prompts), str(output), "--provider", "openai", "--model", "m", "--api-key", "k",
+              "--api-url", server.url_for("openai"), "--restart"])
+        assert lanes == ["batch"] * 4
+
+class _SlowHeadChat:
+    """第一个条目一直等到 release 被设置，其余条目立即完成"""
+    lane = "interactive"
+
+    def __init__(self):
+        self.started = []
+        self.release = threading.Event()
+
+    def ask(self, prompt, **kwargs):
+        self.started.append(prompt)
+        if prompt == "问题0":
+            self.release.wait(5)
+        return _Result(prompt)
+
+class _Result:
+    def __init__(self, content):
+        self.content = content
+
+    def to_dict(self):
+        return {"provider": "fake", "model": "fake", "content": self.content}
+
+def test_ordered_buffer_is_bounded(tmp_path):
+    """ordered 时第一个条目很慢，后面已完成但不能写出的结果最多 concurrency * 2 个"""
+    prompts, output = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    write_prompts(prompts, 20)
+    chat = _SlowHeadChat()
+    thread = threading.Thread(target=run_batch, args=(chat, str(prompts), str(output)),
+                              kwargs={"concurrency": 2, "ordered": True, "resume": False})
+    thread.start()
+    time.sleep(0.3)
+    assert len(chat.started) == 4
+    chat.release.set()
+    thread.join(5)
+    assert [r["id"] for r in read_records(output)] == [f"q{i}" for i in range(20)] + ["bad"]
@@ -0,0 +1,69 @@
+import json
+import threading
+import pytest
+from ai_palette import AIChat, BroadcastStream, SubscriberLagged
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def test_subscribers_and_late_joiner_get_same_chunks():
+    with MockProviderServer(MockConfig(token_rate=200)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        broadcast = BroadcastStream(chat.ask("你好", stream=True))
+        first, second = broadcast.subscribe(), broadcast.subscribe()
+        outputs = {}
+        threads = [threading.Thread(target=lambda name, sub: outputs.update({name: list(sub)}), args=item)
+                   for item in (("first", first), ("second", second))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 上游结束后加入的订阅者完整回放
+        late = list(broadcast.subscribe())
+        assert outputs["first"] == outputs["second"] == late
+        assert "".join(chunk["content"] for chunk in late) == DEFAULT_RESPONSE
+        assert broadcast.result == DEFAULT_RESPONSE
+        assert server.chat_count == 1
+
+def test_lagging_subscriber():
+    gate = threading.Event()
+
+    def source():
+        gate.wait()
+        for i in range(10):
+            yield {"type": "content", "content": str(i)}
+
+    broadcast = BroadcastStream(source(), max_history=3)
+    slow = broadcast.subscribe()
+    gate.set()
+    broadcast.join()
+    with pytest.raises(SubscriberLagged) as info:
+        next(slow)
+    assert info.value.missed == 7
+    assert [chunk["content"] for chunk in broadcast.subscribe()] == ["7", "8", "9"]
+
+def test_auto_close_cancels_upstream():
+    with MockProviderServer(MockConfig(token_rate=5, chunk_size=1)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        stream = chat.ask("你好", stream=True)
+        broadcast = BroadcastStream(stream, auto_close=True)
+        subscription = broadcast.subscribe()
+        next(subscription)
+        subscription.close()
+        assert broadcast.join(timeout=1)
+        assert stream.cancelled
+
+def test_watch_shared_stream(monkeypatch):
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        body = {"model_type": "openai", "api_key": "k", "model": "m", "prompt": "你好",
+                "enable_streaming": True, "share_stream": True}
+        monkeypatch.setenv("OPENAI_API_URL", server.url_for("openai"))
+        response = client.post("/api/chat", json=body)
+        origin = response.get_data(as_text=True)
+        watched = client.get(f"/api/streams/{response.headers['X-Stream-Id']}").get_data(as_text=True)
+
+    def content(text):
+        frames = [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")]
+        return "".join(frame["content"] for frame in frames)
+    assert content(origin) == content(watched) == DEFAULT_RESPONSE
+    assert client.get("/api/streams/missing").status_code == 404
@@ -0,0 +1,55 @@
+import threading
+import time
+import pytest
+from ai_palette import AIChat, CancelToken, RequestCancelled
+from ai_palette.relay import SSERelay
+from ai_palette.mock_server import MockProviderServer, MockConfig
+
+@pytest.fixture
+def slow_server():
+    """每秒 5 个片段的慢速流"""
+    with MockProviderServer(MockConfig(token_rate=5, chunk_size=1)) as server:
+        yield server
+
+def test_close_from_other_thread_aborts_upstream(slow_server):
+    chat = AIChat(**slow_server.chat_kwargs("openai"))
+    stream = chat.ask("你好", stream=True)
+    first = next(stream)
+    threading.Timer(0.3, stream.close).start()
+    start = time.perf_counter()
+    with pytest.raises(RequestCancelled):
+        for _ in stream:
+            pass
+    # 阻塞中的读取被立即唤醒，而不是等到下一个片段或整个回答结束
+    assert time.perf_counter() - start < 0.45
+    assert stream.cancelled
+    assert stream.result.startswith(first["content"])
+
+def test_cancel_before_send(slow_server):
+    chat = AIChat(**slow_server.chat_kwargs("deepseek"))
+    cancel = CancelToken()
+    cancel.cancel()
+    with pytest.raises(RequestCancelled):
+        chat.ask("你好", cancel=cancel)
+    assert slow_server.chat_count == 0
+
+def test_relay_close_cancels_upstream(slow_server):
+    """客户端断开时 WSGI 服务器关闭 SSERelay，上游请求随即取消"""
+    chat = AIChat(**slow_server.chat_kwargs("openai"))
+    stream = chat.ask("你好", stream=True)
+    relay = SSERelay(stream, flush_interval=0)
+    frames = iter(relay)
+    assert next(frames).startswith("data: ")
+    frames.close()
+    relay._thread.join(timeout=0.5)
+    assert not relay._thread.is_alive()
+    assert stream.cancelled
+
+def test_relay_does_not_cancel_finished_stream():
+    with MockProviderServer() as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        stream = chat.ask("你好", stream=True)
+        relay = SSERelay(stream)
+        list(relay)
+        relay.close()
+        assert not stream.cancelled
@@ -0,0 +1,62 @@
+import time
+import pytest
+from ai_palette import AIChat, Cassette, CassetteMiss
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE, DEFAULT_REASONING
+
+@pytest.fixture
+def recorded(tmp_path):
+    """用模拟服务录制 deepseek 和 ernie 的交互，返回 cassette 路径"""
+    path = str(tmp_path / "cassette.jsonl")
+    cassette = Cassette(path, mode="record")
+    with MockProviderServer(MockConfig(token_rate=100, chunk_size=4)) as server:
+        chat = AIChat(**server.chat_kwargs("deepseek"), cassette=cassette)
+        assert chat.ask("你好") == DEFAULT_RESPONSE
+        list(chat.ask("你好", stream=True))
+        ernie = AIChat(**server.chat_kwargs("ernie"), cassette=cassette)
+        assert ernie.ask("你好") == DEFAULT_RESPONSE
+        urls = {"deepseek": server.url_for("deepseek"), "ernie": server.url_for("ernie"),
+                "token_url": server.token_url()}
+    return path, urls
+
+def test_cassette_does_not_record_secrets(recorded):
+    path, _ = recorded
+    with open(path, encoding="utf-8") as f:
+        content = f.read()
+    assert "mock-secret" not in content
+    assert "mock-key" not in content
+
+def test_replay_without_network(recorded):
+    """模拟服务已关闭，回放仍能得到同样的结果，并且不需要密钥"""
+    path, urls = recorded
+    cassette = Cassette(path, mode="replay", speed=0)
+    chat = AIChat(provider="deepseek", model="mock-deepseek", api_url=urls["deepseek"], cassette=cassette)
+    assert chat.ask("你好") == DEFAULT_RESPONSE
+    assert chat.get_last_reasoning_content() == DEFAULT_REASONING
+
+    chunks = list(chat.ask("另一个问题", stream=True))
+    assert "".join(c["content"] for c in chunks if c["type"] == "content") == DEFAULT_RESPONSE
+    assert "".join(c["content"] for c in chunks if c["type"] == "reasoning") == DEFAULT_REASONING
+
+    ernie = AIChat(provider="ernie", model="mock-ernie", api_url=urls["ernie"],
+                   token_url=urls["token_url"], cassette=cassette)
+    assert ernie.ask("你好") == DEFAULT_RESPONSE
+
+def test_replay_speed(recorded):
+    """原始速度回放保留片段间隔，speed=0 时尽快输出"""
+    path, urls = recorded
+    timings = {}
+    for speed in (1.0, 0):
+        chat = AIChat(provider="deepseek", model="mock-deepseek", api_url=urls["deepseek"],
+                      cassette=Cassette(path, mode="replay", speed=speed))
+        start = time.perf_counter()
+        list(chat.ask("你好", stream=True))
+        timings[speed] = time.perf_counter() - start
+    assert timings[1.0] > 0.1
+    assert timings[0] < timings[1.0] / 2
+
+def test_replay_miss(recorded):
+    path, _ = recorded
+    chat = AIChat(provider="openai", model="gpt", api_url="http://127.0.0.1:1/v1/chat/completions",
+                  cassette=Cassette(path, mode="replay", speed=0))
+    with pytest.raises(CassetteMiss):
+        chat.ask("你好")
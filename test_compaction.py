@@ -0,0 +1,48 @@
+import time
+from ai_palette import AIChat, Conversation, ContextCompactor
+from ai_palette.compaction import estimate_tokens
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def _long_conversation(turns: int = 10) -> Conversation:
+    conversation = Conversation(system_prompt="你是助手")
+    for i in range(turns):
+        conversation.add(f"问题{i}" * 50, role="user")
+        conversation.add(f"回答{i}" * 50, role="assistant")
+    return conversation
+
+def test_estimate_tokens():
+    assert estimate_tokens("你好") == 2
+    assert estimate_tokens("hello world!") == 3
+
+def test_background_compaction_does_not_block():
+    """压缩使用慢模型在后台进行，ask 不等待它；完成后摘要替换较早的消息
+
+    模拟服务返回的 prompt_tokens 是很小的固定值，因此阈值设得很低
+    """
+    with MockProviderServer() as server, MockProviderServer(MockConfig(latency=1.0)) as slow:
+        compactor = ContextCompactor(AIChat(**slow.chat_kwargs("ollama")), max_tokens=5, keep_recent=4)
+        chat = AIChat(**server.chat_kwargs("deepseek"), compactor=compactor)
+        conversation = _long_conversation()
+
+        start = time.perf_counter()
+        assert chat.ask("继续", conversation=conversation) == DEFAULT_RESPONSE
+        assert time.perf_counter() - start < 0.8
+        assert len(conversation.messages) == 20
+
+        compactor.wait(timeout=5)
+        assert conversation.summary == DEFAULT_RESPONSE
+        assert [m.content for m in conversation.messages] == ["问题8" * 50, "回答8" * 50, "问题9" * 50, "回答9" * 50]
+
+        chat.ask("再继续", conversation=conversation)
+        sent = server.requests[-1]["body"]["messages"]
+        assert sent[0]["role"] == "system" and DEFAULT_RESPONSE in sent[0]["content"]
+        assert len(sent) == 6
+
+def test_compaction_skipped_when_conversation_changes():
+    with MockProviderServer(MockConfig(latency=0.3)) as server:
+        compactor = ContextCompactor(AIChat(**server.chat_kwargs("ollama")), max_tokens=10, keep_recent=2)
+        conversation = _long_conversation(3)
+        assert compactor.maybe_compact(conversation)
+        conversation.clear()
+        compactor.wait(timeout=5)
+        assert conversation.summary is None and conversation.messages == []
@@ -0,0 +1,43 @@
+import json
+from ai_palette import Comparison
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def test_compare_streams_tagged_events():
+    with MockProviderServer(MockConfig(token_rate=200)) as server:
+        comparison = Comparison([
+            server.chat_kwargs("openai"),
+            dict(server.chat_kwargs("ollama"), label="本地"),
+            dict(server.chat_kwargs("deepseek"), api_url=server.url_for("deepseek") + "/missing",
+                 label="坏的", retry_count=0)
+        ])
+        assert comparison.targets == ["openai:mock-openai", "本地", "坏的"]
+        events = list(comparison.stream("你好"))
+        content = {}
+        for event in events:
+            if event["type"] == "content":
+                content[event["target"]] = content.get(event["target"], "") + event["content"]
+        assert content == {"openai:mock-openai": DEFAULT_RESPONSE, "本地": DEFAULT_RESPONSE}
+        done = events[-1]
+        assert done["type"] == "done"
+        results = {item["target"]: item for item in done["results"]}
+        assert [item["target"] for item in done["results"]][-1] == "坏的"
+        assert results["坏的"]["error"]
+        for target in ("openai:mock-openai", "本地"):
+            assert 0 < results[target]["ttft"] <= results[target]["latency"]
+        # 两个请求并发进行
+        assert done["total_time"] < results["openai:mock-openai"]["latency"] + results["本地"]["latency"]
+
+def test_compare_endpoint():
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        targets = [{"modelType": "openai", "apiKey": "k", "model": "a", "api_url": server.url_for("openai")},
+                   {"modelType": "openai", "apiKey": "k", "model": "a", "api_url": server.url_for("openai")}]
+        body = {"prompt": "你好", "targets": targets, "enable_streaming": True}
+        text = client.post("/api/compare", json=body).get_data(as_text=True)
+        frames = [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")]
+        assert {frame["target"] for frame in frames if frame["type"] == "end"} == {"openai:a", "openai:a#2"}
+        assert frames[-1]["type"] == "done"
+        data = client.post("/api/compare", json=dict(body, enable_streaming=False)).get_json()
+        assert data["success"] and [item["output"] for item in data["results"]] == [DEFAULT_RESPONSE] * 2
+        assert client.post("/api/compare", json={"targets": targets}).status_code == 400
@@ -3,7 +3,7 @@ import time
 import sys
 import argparse
 from typing import Dict, Optional, Generator
-from ai_palette import AIChat, Message, set_log_level
+from ai_palette import AIChat, Message, set_log_level, load_env
 from rich.console import Console
 from rich.panel import Panel
 from rich.markdown import Markdown
@@ -12,6 +12,7 @@ from rich.layout import Layout
 from rich.text import Text
 from rich.prompt import Prompt
 
+load_env()
 console = Console()
 
 def setup_api_key() -> None:
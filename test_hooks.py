@@ -0,0 +1,48 @@
+import pytest
+from ai_palette import AIChat
+from ai_palette import hooks
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def _record(chat):
+    events = []
+    chat.add_hook(events.append)
+    return events
+
+def test_stream_hook_sequence():
+    with MockProviderServer(MockConfig(chunk_size=20)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        events = _record(chat)
+        assert "".join(chunk["content"] for chunk in chat.ask("你好", stream=True)) == DEFAULT_RESPONSE
+    assert [event.name for event in events] == [
+        hooks.REQUEST_BUILT, hooks.CONNECTION_ACQUIRED, hooks.RESPONSE_HEADERS,
+        hooks.FIRST_CHUNK, hooks.CHUNK, hooks.CHUNK, hooks.COMPLETE
+    ]
+    assert len({event.request_id for event in events}) == 1
+    assert events[0].data == {"stream": True} and events[0].size > 0
+    assert events[2].data["status_code"] == 200
+    assert [event.size for event in events if event.name == hooks.CHUNK] == [20, len(DEFAULT_RESPONSE) - 20]
+    assert events[-1].size > 0 and events[-1].data["duration"] > 0
+    timestamps = [event.timestamp_ns for event in events]
+    assert timestamps == sorted(timestamps)
+    assert {(event.provider, event.model) for event in events} == {("openai", "mock-openai")}
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_failed_request_hook_sequence(stream):
+    with MockProviderServer(MockConfig(error_rate=1)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), retry_count=0)
+        events = []
+        hooks.add_hook(events.append)
+        try:
+            with pytest.raises(Exception):
+                result = chat.ask("你好", stream=stream)
+                if stream:
+                    list(result)
+        finally:
+            hooks.remove_hook(events.append)
+    assert [event.name for event in events] == [
+        hooks.REQUEST_BUILT, hooks.CONNECTION_ACQUIRED, hooks.RESPONSE_HEADERS, hooks.ERROR
+    ]
+    assert events[2].data["status_code"] == 500
+    assert events[-1].data["error_class"] == "http_500" and events[-1].data["error"] is not None
+    # 移除后不再收到事件
+    assert events.append not in hooks.global_hooks
@@ -0,0 +1,231 @@
+import json
+import time
+import socket
+import threading
+import pytest
+import requests
+from ai_palette import AIChat, RequestCancelled
+from ai_palette import transport
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE, DEFAULT_REASONING
+
+httpx = pytest.importorskip("httpx")
+h2 = pytest.importorskip("h2")
+
+import h2.config
+import h2.connection
+import h2.events
+from ai_palette.transport import HTTP2Session, get_http2_session
+
+class H2CServer:
+    """最小的明文 HTTP/2（h2c）服务：每个请求按 interval 逐个返回 OpenAI 格式的 SSE 片段
+
+    MockProviderServer 只支持 HTTP/1.1，这里用 h2 状态机直接实现服务端，验证真正的 HTTP/2 路径。
+    """
+
+    def __init__(self, pieces, interval=0.0):
+        self.pieces = pieces
+        self.interval = interval
+        self.connections = 0
+        self.resets = []
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(16)
+        self.url = f"http://127.0.0.1:{self._sock.getsockname()[1]}/v1/chat/completions"
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._sock.close()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        lock = threading.Lock()
+
+        def send(action):
+            with lock:
+                try:
+                    action()
+                    client.sendall(conn.data_to_send())
+                except Exception:
+                    pass
+
+        def respond(stream_id):
+            send(lambda: conn.send_headers(stream_id, [(":status", "200"), ("content-type", "text/event-stream")]))
+            for piece in self.pieces:
+                time.sleep(self.interval)
+                if stream_id in self.resets:
+                    return
+                frame = {"id": "h2", "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                send(lambda: conn.send_data(stream_id, f"data: {json.dumps(frame)}\n\n".encode()))
+            send(lambda: conn.send_data(stream_id, b"data: [DONE]\n\n", end_stream=True))
+
+        send(conn.initiate_connection)
+        while True:
+            try:
+                data = client.recv(65535)
+            except OSError:
+                return
+            if not data:
+                return
+            with lock:
+                events = conn.receive_data(data)
+            for event in events:
+                if isinstance(event, h2.events.StreamEnded):
+                    threading.Thread(target=respond, args=(event.stream_id,), daemon=True).start()
+                elif isinstance(event, h2.events.StreamReset):
+                    self.resets.append(event.stream_id)
+            send(lambda: None)
+
+@pytest.fixture
+def h2c_session(monkeypatch):
+    """使 http2=True 的 AIChat 对明文地址也直接使用 HTTP/2"""
+    session = HTTP2Session(http1=False)
+    monkeypatch.setattr(transport, "_http2_session", session)
+    yield session
+    session.close()
+
+def test_requests_negotiate_http2(h2c_session):
+    with H2CServer(["你", "好", "！"]) as server:
+        chat = AIChat(provider="openai", model="h2", api_key="k", api_url=server.url, http2=True)
+        versions = []
+        chat.add_hook(lambda event: versions.append(event.data.get("http_version"))
+                      if event.name == "response_headers" else None)
+        results = []
+
+        def worker():
+            results.append("".join(chunk["content"] for chunk in chat.ask("你好", stream=True)))
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ["你好！"] * 4
+        assert versions == ["HTTP/2"] * 4
+        # 并发的流复用同一个连接
+        assert server.connections == 1
+
+def test_connection_limit_is_per_host(monkeypatch):
+    monkeypatch.setenv("AI_PALETTE_HTTP2_MAX_CONNECTIONS", "1")
+    session = HTTP2Session()
+    assert session.max_connections == 1
+    monkeypatch.setenv("AI_PALETTE_HTTP2_MAX_CONNECTIONS", "many")
+    with pytest.raises(ValueError):
+        HTTP2Session()
+    try:
+        with MockProviderServer(MockConfig(token_rate=20)) as first, MockProviderServer() as second:
+            # HTTP/1.1 下唯一的连接被第一个主机的流占用，第二个主机不受影响
+            headers = {"Authorization": "Bearer mock-key", "Content-Type": "application/json"}
+            body = json.dumps({"model": "mock", "messages": [{"role": "user", "content": "你好"}], "stream": True})
+            busy = session.post(first.url_for("openai"), headers, body.encode(), stream=True, timeout=5)
+            response = session.post(second.url_for("openai"), headers, body.encode(), timeout=1)
+            assert response.status_code == 200 and response.http_version == "HTTP/1.1"
+            with pytest.raises(requests.exceptions.Timeout):
+                session.post(first.url_for("openai"), headers, body.encode(), timeout=0.2)
+            busy.close()
+    finally:
+        session.close()
+
+def test_http2_transport_matches_requests():
+    """同一个 AIChat API 通过 httpx 传输得到相同的结果和用量（模拟服务只支持 HTTP/1.1，httpx 协商为 HTTP/1.1）"""
+    with MockProviderServer(MockConfig(chunk_size=4)) as server:
+        chat = AIChat(**server.chat_kwargs("deepseek"), http2=True)
+        assert chat._session() is get_http2_session()
+        result = chat.ask("你好")
+        assert result == DEFAULT_RESPONSE
+        assert result.usage is not None
+
+        stream = chat.ask("你好", stream=True)
+        chunks = list(stream)
+        assert "".join(c["content"] for c in chunks if c["type"] == "content") == DEFAULT_RESPONSE
+        assert "".join(c["content"] for c in chunks if c["type"] == "reasoning") == DEFAULT_REASONING
+        assert stream.result.usage is not None
+
+def test_http2_concurrent_streams():
+    with MockProviderServer(MockConfig(token_rate=200, chunk_size=4)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), http2=True)
+        results = []
+
+        def worker():
+            results.append("".join(c["content"] for c in chat.ask("你好", stream=True)))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [DEFAULT_RESPONSE] * 8
+
+def test_http2_errors_map_to_requests():
+    """httpx 的异常转换为 requests 异常，重试和错误处理不变"""
+    session = HTTP2Session()
+    try:
+        with pytest.raises(requests.ConnectionError):
+            session.post("http://127.0.0.1:1/v1/chat/completions", data=b"{}", timeout=1)
+    finally:
+        session.close()
+
+    with MockProviderServer(MockConfig(require_auth=True)) as server:
+        response = get_http2_session().post(server.url_for("openai"), data=b"{}", stream=True, timeout=5)
+        with pytest.raises(requests.HTTPError) as info:
+            response.raise_for_status()
+        assert info.value.response.status_code == 401
+        response.close()
+
+def test_http2_cancel_resets_only_its_stream(h2c_session):
+    """取消 HTTP/2 流式请求时立即返回，同一连接上的其他流继续进行，连接可以复用"""
+    with H2CServer(["字"] * 8, interval=0.1) as server:
+        chat = AIChat(provider="openai", model="h2", api_key="k", api_url=server.url, http2=True)
+        stream = chat.ask("你好", stream=True)
+        sibling = chat.ask("你好", stream=True)
+        next(stream)
+        next(sibling)
+        threading.Timer(0.15, stream.close).start()
+        start = time.perf_counter()
+        with pytest.raises(RequestCancelled):
+            for _ in stream:
+                pass
+        assert time.perf_counter() - start < 0.3
+        assert "".join(chunk["content"] for chunk in sibling) == "字" * 7
+        assert "".join(chunk["content"] for chunk in chat.ask("你好", stream=True)) == "字" * 8
+        assert server.connections == 1 and len(server.resets) == 1
+
+def test_http11_fallback_cancel_is_immediate():
+    """httpx 协商为 HTTP/1.1 时与 requests 传输一样断开 socket"""
+    with MockProviderServer(MockConfig(token_rate=5, chunk_size=1)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), http2=True)
+        stream = chat.ask("你好", stream=True)
+        next(stream)
+        threading.Timer(0.3, stream.close).start()
+        start = time.perf_counter()
+        with pytest.raises(RequestCancelled):
+            for _ in stream:
+                pass
+        assert time.perf_counter() - start < 0.45
+
+def test_http2_cancel_without_expected_internals(h2c_session, monkeypatch):
+    """httpcore 内部结构不符合预期时不重置流，退回断开整个连接，取消仍然立即返回"""
+    monkeypatch.setattr(transport, "_HTTP2_CONNECTION_INTERNALS",
+                        transport._HTTP2_CONNECTION_INTERNALS + ("_renamed_in_new_httpcore",))
+    with H2CServer(["字"] * 8, interval=0.1) as server:
+        chat = AIChat(provider="openai", model="h2", api_key="k", api_url=server.url, http2=True)
+        stream = chat.ask("你好", stream=True)
+        next(stream)
+        threading.Timer(0.15, stream.close).start()
+        start = time.perf_counter()
+        with pytest.raises(RequestCancelled):
+            for _ in stream:
+                pass
+        assert time.perf_counter() - start < 0.3
+        assert server.resets == []
@@ -0,0 +1,42 @@
+import subprocess
+import sys
+
+# import ai_palette 时不应加载的依赖（只在实际发请求、异步路径或 Web 服务中使用）
+LAZY_MODULES = ("requests", "urllib3", "aiohttp", "asyncio", "loguru", "dotenv", "flask",
+                "concurrent.futures", "httpx")
+
+def _loaded_after(code: str):
+    check = f"{code}; import sys; print(','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True).stdout
+    return [name for name in output.strip().split(",") if name]
+
+def test_import_does_not_load_heavy_dependencies():
+    assert _loaded_after("import ai_palette") == []
+
+def test_creating_chat_does_not_load_heavy_dependencies():
+    """创建 AIChat 只会加载 .env，不会导入 HTTP 客户端"""
+    loaded = _loaded_after("from ai_palette import AIChat; AIChat(provider='ollama', model='llama2')")
+    assert loaded == ["dotenv"]
+
+def test_lazy_exports():
+    """按需导入的子模块仍然可以从包中直接导入"""
+    loaded = _loaded_after("from ai_palette import Pipeline, PromptTemplate, Cassette, CassetteMiss")
+    assert "concurrent.futures" in loaded and "requests" in loaded
+
+def test_logging_keeps_host_handlers():
+    """首次记录日志和 set_log_level 只替换自己的处理器，宿主程序的处理器保留"""
+    code = """
+from loguru import logger
+received = []
+logger.add(lambda msg: received.append(msg.record["message"]), level="DEBUG")
+import ai_palette
+ai_palette.logger.warning("first")
+ai_palette.set_log_level("ERROR")
+ai_palette.set_log_level("INFO")
+ai_palette.logger.info("second")
+assert received == ["first", "second"], received
+"""
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    # loguru 自带的 stderr 处理器被替换为打印到 stdout 的处理器（只添加一个）
+    assert result.stderr == ""
+    assert result.stdout.count("first") == 1 and result.stdout.count("second") == 1
@@ -0,0 +1,51 @@
+import threading
+import pytest
+from ai_palette import AIChat, AdaptiveLimiter, APIError
+from ai_palette.mock_server import MockProviderServer, MockConfig
+
+def test_additive_increase_when_saturated():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=3)
+    for _ in range(10):
+        permits = [limiter.acquire(), limiter.acquire()]
+        for permit in permits:
+            limiter.release(permit, latency=0.1)
+    assert limiter.limit == 3
+    # 未用满上限时不增长
+    limiter = AdaptiveLimiter(initial_limit=2)
+    for _ in range(10):
+        limiter.release(limiter.acquire(), latency=0.1)
+    assert limiter.limit == 2
+
+def test_multiplicative_decrease_once_per_congestion():
+    limiter = AdaptiveLimiter(initial_limit=8)
+    permits = [limiter.acquire() for _ in range(4)]
+    for permit in permits:
+        limiter.release(permit, APIError("限流", status_code=429))
+    assert limiter.limit == 4
+    limiter.release(limiter.acquire(), APIError("参数错误", status_code=400))
+    assert limiter.limit == 4
+
+def test_latency_spike_decreases():
+    limiter = AdaptiveLimiter(initial_limit=8, min_samples=3)
+    for _ in range(3):
+        limiter.release(limiter.acquire(), latency=0.1)
+    limiter.release(limiter.acquire(), latency=1.0)
+    assert limiter.limit == 4
+
+def test_acquire_blocks_at_limit():
+    limiter = AdaptiveLimiter(initial_limit=1)
+    permit = limiter.acquire()
+    with pytest.raises(TimeoutError):
+        limiter.acquire(timeout=0.05)
+    threading.Timer(0.05, limiter.release, args=(permit,)).start()
+    limiter.release(limiter.acquire(timeout=1))
+    assert limiter.in_flight == 0
+
+def test_chat_backs_off_on_429():
+    with MockProviderServer(MockConfig(rate_limit_every=1)) as server:
+        limiter = AdaptiveLimiter(initial_limit=4)
+        chat = AIChat(**server.chat_kwargs("openai"), limiter=limiter, retry_count=0)
+        with pytest.raises(Exception):
+            list(chat.ask("你好", stream=True))
+        assert limiter.limit == 2
+        assert limiter.in_flight == 0
@@ -0,0 +1,70 @@
+import pytest
+from ai_palette import AIChat, get_metrics, reset_metrics
+from ai_palette.metrics import Histogram, MetricsRegistry
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def test_histogram_bucketing():
+    histogram = Histogram((1, 5, 0.5))
+    assert histogram.buckets == (0.5, 1, 5)
+    for value in (0.1, 0.5, 0.7, 1, 3, 100):
+        histogram.observe(value)
+    # 边界值计入上界相等的桶（le 语义），超出最大边界的计入 +Inf
+    assert histogram.counts == [2, 2, 1, 1]
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == [(0.5, 2), (1, 4), (5, 5), (float("inf"), 6)]
+    assert snapshot["count"] == 6 and snapshot["sum"] == pytest.approx(105.3)
+    assert histogram.quantile(0.5) == pytest.approx(0.75)
+    assert histogram.quantile(1.0) == 5
+    assert Histogram((1,)).quantile(0.5) is None
+
+def test_render_prometheus_format():
+    registry = MetricsRegistry()
+    registry.register_counter("demo_requests_total", "请求总数", ("provider", "status"))
+    registry.register_histogram("demo_seconds", "耗时", ("provider",), buckets=(0.5, 2))
+    registry.register_counter("demo_empty_total", "未记录", ())
+    registry.inc("demo_requests_total", ("openai", "ok"))
+    registry.inc("demo_requests_total", ("openai", "ok"), 2)
+    registry.inc("demo_requests_total", ('a"b\\c\nd', "error"))
+    registry.observe("demo_seconds", ("openai",), 0.25)
+    registry.observe("demo_seconds", ("openai",), 1.5)
+    registry.observe("demo_seconds", ("openai",), 3)
+    assert registry.render_prometheus().splitlines() == [
+        "# HELP demo_requests_total 请求总数",
+        "# TYPE demo_requests_total counter",
+        'demo_requests_total{provider="openai",status="ok"} 3',
+        'demo_requests_total{provider="a\\"b\\\\c\\nd",status="error"} 1',
+        "# HELP demo_seconds 耗时",
+        "# TYPE demo_seconds histogram",
+        'demo_seconds_bucket{provider="openai",le="0.5"} 1',
+        'demo_seconds_bucket{provider="openai",le="2"} 2',
+        'demo_seconds_bucket{provider="openai",le="+Inf"} 3',
+        'demo_seconds_sum{provider="openai"} 4.75',
+        'demo_seconds_count{provider="openai"} 3',
+        "# HELP demo_empty_total 未记录",
+        "# TYPE demo_empty_total counter",
+    ]
+    registry.enabled = False
+    registry.inc("demo_requests_total", ("openai", "ok"))
+    assert registry.snapshot()["demo_requests_total"][0]["value"] == 3
+
+def test_metrics_endpoint():
+    from ai_palette import app as server_app
+    response = server_app.app.test_client().get("/metrics")
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    text = response.get_data(as_text=True)
+    assert "# TYPE ai_palette_requests_total counter" in text
+    assert "# TYPE ai_palette_request_duration_seconds histogram" in text
+
+def test_stream_rate_uses_reported_completion_tokens():
+    reset_metrics()
+    with MockProviderServer(MockConfig(token_rate=200, chunk_size=3)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        list(chat.ask("你好", stream=True))
+    metrics = get_metrics()
+    chunks = metrics["ai_palette_stream_chunks_per_second"][0]
+    tokens = metrics["ai_palette_stream_tokens_per_second"][0]
+    assert chunks["count"] == tokens["count"] == 1
+    # 模拟服务每个片段 3 个字符，按字符数报告 completion_tokens
+    assert server.usage(DEFAULT_RESPONSE)["completion_tokens"] == len(DEFAULT_RESPONSE)
+    assert tokens["sum"] > chunks["sum"] * 2
+    reset_metrics()
@@ -0,0 +1,134 @@
+import threading
+import time
+import pytest
+import requests
+from ai_palette import AIChat, APIError, Conversation, Usage, UsageTracker, ModelPrice
+from ai_palette.mock_server import MockProviderServer, MockConfig, PROVIDERS, DEFAULT_RESPONSE, DEFAULT_REASONING
+
+@pytest.fixture(scope="module")
+def server():
+    """启动一个共享的模拟供应商服务"""
+    with MockProviderServer(MockConfig(chunk_size=3)) as mock:
+        yield mock
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_normal_request(server, provider):
+    """普通请求能正确解析每种供应商的响应"""
+    chat = AIChat(**server.chat_kwargs(provider))
+    assert chat.ask("你好") == DEFAULT_RESPONSE
+
+@pytest.mark.parametrize("provider", PROVIDERS)
+def test_streaming_request(server, provider):
+    """流式请求能正确解析每种供应商的增量格式"""
+    chat = AIChat(**server.chat_kwargs(provider))
+    chunks = list(chat.ask("你好", stream=True))
+    content = "".join(chunk["content"] for chunk in chunks if chunk["type"] == "content")
+    reasoning = "".join(chunk["content"] for chunk in chunks if chunk["type"] == "reasoning")
+    assert content == DEFAULT_RESPONSE
+    if provider in ("deepseek", "siliconflow"):
+        assert reasoning == DEFAULT_REASONING
+    else:
+        assert reasoning == ""
+
+def test_deepseek_reasoning_content(server):
+    """非流式请求保留 reasoning_content"""
+    chat = AIChat(**server.chat_kwargs("deepseek"))
+    chat.ask("为什么天空是蓝色的？")
+    assert chat.get_last_reasoning_content() == DEFAULT_REASONING
+
+def test_shared_client_across_threads(server):
+    """一个 AIChat 被多个线程共享，每个线程使用自己的对话，推理内容随结果返回"""
+    chat = AIChat(**server.chat_kwargs("deepseek"))
+    results = {}
+
+    def worker(index):
+        conversation = Conversation(system_prompt=f"对话{index}")
+        conversation.add(f"问题{index}", role="user")
+        results[index] = chat.ask(f"提问{index}", conversation=conversation)
+        assert chat.get_last_reasoning_content() == DEFAULT_REASONING
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(result.reasoning_content == DEFAULT_REASONING for result in results.values())
+
+    sent = {item["body"]["messages"][-1]["content"]: item["body"]["messages"]
+            for item in server.requests if item["provider"] == "deepseek"}
+    for i in range(8):
+        assert [m["content"] for m in sent[f"提问{i}"]] == [f"对话{i}", f"问题{i}", f"提问{i}"]
+
+def test_ernie_fetches_access_token(server):
+    """ERNIE 请求先访问鉴权接口"""
+    chat = AIChat(**server.chat_kwargs("ernie"))
+    chat.ask("你好")
+    paths = [item["path"] for item in server.requests if item["provider"] == "ernie"]
+    assert any(path.startswith("/oauth/2.0/token") for path in paths)
+
+def test_ollama_tags(server):
+    """模拟 Ollama 的模型列表接口"""
+    response = requests.get(f"{server.base_url}/ollama/api/tags")
+    assert [model["name"] for model in response.json()["models"]] == server.ollama_models
+
+def test_rate_limit_injection():
+    """注入 429 时抛出带状态码的 APIError"""
+    with MockProviderServer(MockConfig(rate_limit_every=1)) as mock:
+        chat = AIChat(**mock.chat_kwargs("openai"))
+        with pytest.raises(APIError) as excinfo:
+            chat.ask("你好")
+        assert excinfo.value.status_code == 429
+
+def test_stream_error_injection():
+    """流式请求遇到错误状态码时与普通请求一样立即抛出带状态码的 APIError，不重试"""
+    with MockProviderServer(MockConfig(error_rate=1.0)) as mock:
+        chat = AIChat(**mock.chat_kwargs("deepseek"), retry_count=3)
+        start = time.perf_counter()
+        with pytest.raises(APIError) as excinfo:
+            list(chat.ask("你好", stream=True))
+        assert excinfo.value.status_code == 500
+        assert mock.chat_count == 1 and time.perf_counter() - start < 1
+        chat = AIChat(**dict(mock.chat_kwargs("openai"), api_url=mock.url_for("openai") + "/missing"))
+        with pytest.raises(APIError, match="未知路径") as excinfo:
+            list(chat.ask("你好", stream=True))
+        assert excinfo.value.status_code == 404
+
+@pytest.mark.parametrize("provider", ["openai", "dashscope", "ollama", "deepseek"])
+def test_usage_and_metadata(server, provider):
+    """普通请求和流式请求都返回 usage、finish_reason 和请求 ID"""
+    tracker = UsageTracker()
+    chat = AIChat(**server.chat_kwargs(provider), usage_tracker=tracker)
+    result = chat.ask("你好")
+    assert result == DEFAULT_RESPONSE
+    assert result.usage.prompt_tokens > 0 and result.usage.completion_tokens > 0
+    assert result.finish_reason == "stop"
+    assert result.request_id
+
+    stream = chat.ask("你好", stream=True)
+    assert stream.result is None
+    list(stream)
+    assert stream.result == DEFAULT_RESPONSE
+    assert stream.result.usage.total_tokens == result.usage.total_tokens
+    assert stream.result.ttft is not None
+
+    totals = tracker.snapshot()[provider][f"mock-{provider}"]
+    assert totals["requests"] == 2
+    assert totals["total_tokens"] == 2 * result.usage.total_tokens
+
+def test_openai_stream_requests_usage(server):
+    chat = AIChat(**server.chat_kwargs("openai"))
+    data = chat._prepare_request_data(chat._prepare_messages("你好"), stream=True)
+    assert data["stream_options"] == {"include_usage": True}
+    chat = AIChat(**server.chat_kwargs("openai"), stream_usage=False)
+    assert "stream_options" not in chat._prepare_request_data(chat._prepare_messages("你好"), stream=True)
+
+def test_usage_cost_with_cache():
+    """缓存命中的输入 token 按缓存价格计费"""
+    tracker = UsageTracker()
+    tracker.set_price("deepseek-chat", ModelPrice(input=2, output=8, cached=0.5))
+    usage = Usage.from_dict({"prompt_tokens": 1000, "completion_tokens": 500,
+                             "prompt_cache_hit_tokens": 600, "prompt_cache_miss_tokens": 400})
+    tracker.record("deepseek", "deepseek-chat", usage)
+    totals = tracker.totals()
+    assert totals["cached_tokens"] == 600
+    assert totals["cost"] == pytest.approx((400 * 2 + 600 * 0.5 + 500 * 8) / 1_000_000)
@@ -0,0 +1,70 @@
+import time
+import pytest
+from ai_palette import AIChat
+from ai_palette import ollama
+from ai_palette.mock_server import MockProviderServer, MockConfig
+
+@pytest.fixture(autouse=True)
+def clear_tracker():
+    ollama.tracker.clear()
+    yield
+    ollama.tracker.clear()
+
+def test_parse_keep_alive():
+    assert ollama.parse_keep_alive("30m") == 1800
+    assert ollama.parse_keep_alive("1h30m") == 5400
+    assert ollama.parse_keep_alive(-1) == float("inf")
+    assert ollama.parse_keep_alive(None) == ollama.DEFAULT_KEEP_ALIVE
+    assert ollama.normalize_keep_alive("-1") == -1
+    with pytest.raises(ValueError):
+        ollama.parse_keep_alive("30 minutes")
+
+def test_keep_alive_sent_and_preload_avoids_cold_start():
+    with MockProviderServer(MockConfig(load_latency=0.3)) as server:
+        chat = AIChat(**server.chat_kwargs("ollama", model="mock-qwen"), keep_alive="30m")
+        assert chat.preload() >= 0.3
+        start = time.perf_counter()
+        chat.ask("你好", stream=False)
+        assert time.perf_counter() - start < 0.3
+        assert server.requests[-1]["body"]["keep_alive"] == "30m"
+        host = ollama.ollama_host(chat.api_url)
+        assert [item["name"] for item in ollama.running_models(host)] == ["mock-qwen:latest"]
+        assert ollama.prefer_warm(["mock-llama", "mock-qwen"], host) == "mock-qwen"
+        ollama.unload("mock-qwen", host)
+        assert ollama.prefer_warm(["mock-llama", "mock-qwen"], host) == "mock-llama"
+
+def test_models_endpoint_reports_residency(monkeypatch):
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        monkeypatch.setenv("OLLAMA_API_URL", server.url_for("ollama"))
+        ollama.preload("mock-qwen", keep_alive=-1)
+        data = client.get("/api/models?type=ollama").get_json()
+        assert data["models"] == ["mock-qwen", "mock-llama"]
+        assert data["resident"] == ["mock-qwen"]
+        body = {"model_type": "ollama", "model": "mock-llama", "candidates": ["mock-llama", "mock-qwen"],
+                "prompt": "你好"}
+        assert client.post("/api/chat", json=body).get_json()["model"] == "mock-qwen"
+
+def test_pool_balances_and_prefers_warm_host():
+    with MockProviderServer(MockConfig(token_rate=50)) as first, MockProviderServer(MockConfig(token_rate=50)) as second:
+        first.ollama_models = ["mock-llama"]
+        pool = ollama.OllamaPool([first.url_for("ollama"), second.url_for("ollama"), "http://127.0.0.1:1"])
+        assert pool.check() == {pool.hosts[0]: True, pool.hosts[1]: True, pool.hosts[2]: False}
+        assert pool.models() == {"mock-llama": pool.hosts[:2], "mock-qwen": [pool.hosts[1]]}
+        chat = AIChat(provider="ollama", model="mock-llama", pool=pool)
+        # 最少进行中请求：并发的流式请求平均分到两台可用的服务
+        streams = [chat.ask("你好", stream=True) for _ in range(4)]
+        for stream in streams:
+            next(stream)
+        assert first.chat_count == second.chat_count == 2
+        for stream in streams:
+            list(stream)
+        # 模型亲和：已加载模型的服务优先，进行中的请求多出 max_imbalance 以上时才发往其他服务
+        ollama.tracker.clear()
+        ollama.preload("mock-llama", pool.hosts[1])
+        assert [pool.acquire("mock-llama") for _ in range(4)] == [pool.hosts[1]] * 3 + [pool.hosts[0]]
+        # 无法连接的服务被标记为不可用
+        pool.release(pool.hosts[1], "mock-llama", ConnectionError("refused"))
+        assert [item["healthy"] for item in pool.status()] == [True, False, False]
+        assert pool.acquire("mock-llama") == pool.hosts[0]
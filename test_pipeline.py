@@ -0,0 +1,180 @@
+import json
+import time
+import pytest
+from ai_palette import Pipeline, Stage
+from ai_palette.mock_server import MockProviderServer, DEFAULT_RESPONSE
+
+class _Reply(str):
+    """模拟 ask() 的非流式返回值"""
+    reasoning_content = ""
+
+class _FakeChat:
+    """按阶段选项模拟的聊天实例
+
+    delay: 返回前等待的秒数；fail: 抛出异常；reasoning: 附带的思考过程。
+    回答为 "答<提示词>"，下游阶段可以据此检查上游输出是否正确填入。
+    """
+
+    def __init__(self, options, stream, prompts):
+        self.options = options
+        self.stream = stream
+        self.prompts = prompts
+        self._reasoning = ""
+
+    def _answer(self, prompt):
+        self.prompts.append(prompt)
+        time.sleep(self.options.get("delay", 0))
+        if self.options.get("fail"):
+            raise ValueError("模拟失败")
+        return f"答<{prompt}>", self.options.get("reasoning", "")
+
+    def _chunks(self, prompt):
+        content, reasoning = self._answer(prompt)
+        if reasoning:
+            yield {"type": "reasoning", "content": reasoning}
+        yield {"type": "content", "content": content[:1]}
+        yield {"type": "content", "content": content[1:]}
+
+    def ask(self, prompt, **kwargs):
+        if kwargs.get("stream", self.stream):
+            return self._chunks(prompt)
+        content, self._reasoning = self._answer(prompt)
+        reply = _Reply(content)
+        reply.reasoning_content = self._reasoning
+        return reply
+
+    def get_last_reasoning_content(self):
+        return self._reasoning
+
+@pytest.fixture
+def prompts(monkeypatch):
+    """把阶段的聊天实例替换为 _FakeChat，返回按请求顺序记录的提示词"""
+    prompts = []
+    monkeypatch.setattr(Pipeline, "_create_chat",
+                        lambda self, stage, stream, *args: _FakeChat(stage.options, stream, prompts))
+    return prompts
+
+def _stage(name, template, depends_on=(), **options):
+    return Stage(name=name, provider="openai", model="fake", template=template,
+                 depends_on=list(depends_on), api_key="fake-key", options=options)
+
+def test_stages_run_in_dependency_order(prompts):
+    pipeline = Pipeline([
+        _stage("answer", "根据 [$outline$] 和 [$facts$] 回答 [$query$]"),
+        _stage("outline", "列提纲：[$query$]"),
+        _stage("facts", "查资料：[$query$]", depends_on=["outline"])
+    ])
+    assert pipeline.order == ["outline", "facts", "answer"]
+    assert sorted(pipeline.dependencies["answer"]) == ["facts", "outline"]
+    assert pipeline.outputs == ["answer"]
+    events = list(pipeline.stream({"query": "问题"}, stream=False))
+    assert [event["stage"] for event in events if event["type"] == "stage_end"] == ["outline", "facts", "answer"]
+    # 下游阶段的提示词中填入了上游的完整输出
+    assert prompts == ["列提纲：问题", "查资料：问题", "根据 答<列提纲：问题> 和 答<查资料：问题> 回答 问题"]
+
+def test_invalid_graphs_are_rejected():
+    # 不替换聊天实例：创建流水线时会用真实配置校验每个阶段
+    assert Pipeline([_stage("a", "[$query$]"), _stage("b", "[$a$]")]).order == ["a", "b"]
+    with pytest.raises(ValueError, match="循环依赖"):
+        Pipeline([_stage("a", "[$b$]"), _stage("b", "[$a$]")])
+    with pytest.raises(ValueError, match="不存在"):
+        Pipeline([_stage("a", "[$query$]", depends_on=["missing"])])
+    with pytest.raises(ValueError, match="重复"):
+        Pipeline([_stage("a", ""), _stage("a", "")])
+    with pytest.raises(ValueError):
+        Pipeline([])
+
+def test_independent_stages_run_in_parallel(prompts):
+    pipeline = Pipeline([
+        _stage("left", "左：[$query$]", delay=0.2),
+        _stage("right", "右：[$query$]", delay=0.2),
+        _stage("merge", "[$left$] [$right$]", delay=0.05)
+    ])
+    result = pipeline.run({"query": "问题"}, stream=True)
+    left, right, merge = (result.timings[name] for name in ("left", "right", "merge"))
+    # 两个独立阶段同时启动，合并阶段在两者都完成后才启动
+    assert left.started < 0.05 and right.started < 0.05
+    assert merge.started >= max(left.finished, right.finished)
+    assert result.total_time < 0.4
+    assert result.outputs["merge"] == "答<答<左：问题> 答<右：问题>>"
+
+def test_stream_events_and_reasoning(prompts):
+    pipeline = Pipeline([_stage("thought", "[$query$]", reasoning="想一想"), _stage("result", "[$thought$]")])
+    events = list(pipeline.stream({"query": "问题"}))
+    assert [(event["type"], event["stage"]) for event in events] == [
+        ("stage_start", "thought"), ("reasoning", "thought"), ("content", "thought"), ("content", "thought"),
+        ("stage_end", "thought"), ("stage_start", "result"), ("content", "result"), ("content", "result"),
+        ("stage_end", "result")
+    ]
+    end = events[4]
+    assert end["output"] == "答<问题>" and end["reasoning"] == "想一想"
+    assert end["timing"]["first_token"] is not None
+    result = pipeline.run({"query": "问题"})
+    assert result.reasoning == {"thought": "想一想", "result": ""}
+    assert result.outputs["result"] == "答<答<问题>>"
+
+def test_failed_stage_skips_downstream(prompts):
+    pipeline = Pipeline([
+        _stage("broken", "[$query$]", fail=True),
+        _stage("healthy", "[$query$]"),
+        _stage("after_broken", "[$broken$]"),
+        _stage("last", "[$after_broken$] [$healthy$]")
+    ])
+    events = list(pipeline.stream({"query": "问题"}, stream=False))
+    errors = {event["stage"]: event["error"] for event in events if event["type"] == "stage_error"}
+    assert set(errors) == {"broken", "after_broken", "last"}
+    assert errors["broken"] == "模拟失败"
+    assert "broken" in errors["after_broken"] and "broken" in errors["last"]
+    assert [event["stage"] for event in events if event["type"] == "stage_end"] == ["healthy"]
+    # 被跳过的阶段不会发出请求
+    assert sorted(prompts) == ["问题", "问题"]
+    with pytest.raises(ValueError, match="模拟失败"):
+        pipeline.run({"query": "问题"})
+
+def test_chain_chat_endpoint(prompts):
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    config = {"modelType": "openai", "apiKey": "fake-key", "model": "fake"}
+    body = {"query": "问题", "thinkingConfig": config, "resultConfig": config,
+            "thinkingPrompt": "思考：[$query$]", "resultPrompt": "[$thought$]\n回答：[$query$]"}
+    data = client.post("/api/chain_chat", json=body).get_json()
+    assert data["success"]
+    assert data["reasoning_content"] == "答<思考：问题>"
+    assert data["response"] == "答<答<思考：问题>\n回答：问题>"
+    assert set(data["timings"]) == {"thought", "result"}
+    # 不使用 reasoning_content 字段时思考过程包在 <think> 标签中
+    data = client.post("/api/chain_chat", json=dict(body, use_reasoning_field=False)).get_json()
+    assert data["response"] == "<think>答<思考：问题></think>答<答<思考：问题>\n回答：问题>"
+
+def test_chain_chat_with_real_clients(monkeypatch):
+    # 不替换聊天实例，覆盖 Pipeline 创建真实 AIChat 的路径
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        monkeypatch.setenv("OPENAI_API_URL", server.url_for("openai"))
+        config = {"modelType": "openai", "apiKey": "mock-key", "model": "mock-openai"}
+        body = {"query": "问题", "thinkingConfig": config, "resultConfig": config,
+                "thinkingPrompt": "思考：[$query$]", "resultPrompt": "[$thought$]\n回答：[$query$]"}
+        data = client.post("/api/chain_chat", json=body).get_json()
+        assert data["success"]
+        assert data["reasoning_content"] == DEFAULT_RESPONSE and data["response"] == DEFAULT_RESPONSE
+        sent = [request["body"]["messages"][-1]["content"] for request in server.requests]
+        assert sent == ["思考：问题", f"{DEFAULT_RESPONSE}\n回答：问题"]
+
+        text = client.post("/api/chain_chat", json=dict(body, enable_streaming=True)).get_data(as_text=True)
+        frames = [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")]
+        assert "".join(frame["content"] for frame in frames if frame["type"] == "reasoning") == DEFAULT_RESPONSE
+        assert "".join(frame["content"] for frame in frames if frame["type"] == "content") == DEFAULT_RESPONSE
+
+def test_chain_chat_stream_reports_stage_error(monkeypatch):
+    """流式推理链的阶段失败时发出 error 事件并结束"""
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    config = {"modelType": "openai", "apiKey": "fake-key", "model": "fake"}
+    body = {"query": "问题", "thinkingConfig": config, "resultConfig": config, "enable_streaming": True,
+            "thinkingPrompt": "思考：[$query$]", "resultPrompt": "[$thought$]\n回答：[$query$]"}
+    monkeypatch.setattr(Pipeline, "_create_chat", lambda self, stage, stream, *args: _FakeChat(
+        {"fail": stage.name == "thought"}, stream, []))
+    text = client.post("/api/chain_chat", json=body).get_data(as_text=True)
+    frames = [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")]
+    assert frames == [{"type": "error", "content": "模拟失败"}]
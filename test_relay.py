@@ -0,0 +1,83 @@
+import json
+import threading
+import time
+from ai_palette.cancel import CancelToken
+from ai_palette.relay import SSERelay, DEFAULT_FLUSH_INTERVAL, DEFAULT_MAX_BYTES
+
+def _source(pieces, delay=0.0, kind="content"):
+    """模拟上游：每隔 delay 秒产出一个片段"""
+    for piece in pieces:
+        if delay:
+            time.sleep(delay)
+        yield piece if isinstance(piece, dict) else {"type": kind, "content": piece}
+
+def _frames(relay):
+    frames = list(relay)
+    for frame in frames:
+        assert frame.endswith("\n\n") and frame.count("\n\n") == 1
+    return frames
+
+def _events(frames):
+    return [json.loads(frame[6:]) for frame in frames if frame.startswith("data: ")]
+
+def test_fast_chunks_coalesce_within_time_budget():
+    assert (DEFAULT_FLUSH_INTERVAL, DEFAULT_MAX_BYTES) == (0.03, 512)
+    frames = _frames(SSERelay(_source(["a"] * 50), heartbeat_interval=None))
+    assert _events(frames) == [{"type": "content", "content": "a" * 50}]
+    # 上游较慢时按 30 毫秒窗口分帧，每帧合并窗口内到达的多个片段
+    frames = _frames(SSERelay(_source(["b"] * 20, delay=0.005), heartbeat_interval=None))
+    events = _events(frames)
+    assert "".join(event["content"] for event in events) == "b" * 20
+    assert 1 < len(events) < 20
+
+def test_max_bytes_flushes_immediately():
+    # 每个汉字 3 字节，512 字节的预算在第 171 个字时触发
+    frames = _frames(SSERelay(_source(["字"] * 200), flush_interval=10, heartbeat_interval=None))
+    assert [len(event["content"]) for event in _events(frames)] == [171, 29]
+
+def test_different_types_and_standalone_markers_are_separate_frames():
+    pieces = [{"type": "content", "content": "<think>"}, {"type": "reasoning", "content": "想"},
+              {"type": "reasoning", "content": "一想"}, {"type": "content", "content": "</think>"},
+              {"type": "content", "content": "答"}, {"type": "content", "content": "案"}]
+    events = _events(_frames(SSERelay(_source(pieces), heartbeat_interval=None)))
+    assert events == [{"type": "content", "content": "<think>"}, {"type": "reasoning", "content": "想一想"},
+                      {"type": "content", "content": "</think>"}, {"type": "content", "content": "答案"}]
+    # 非字符串内容的事件原样转发
+    events = _events(_frames(SSERelay(_source([{"type": "done", "results": [1]}]), heartbeat_interval=None)))
+    assert events == [{"type": "done", "results": [1]}]
+
+def test_keep_alive_while_upstream_is_silent():
+    def slow():
+        time.sleep(0.35)
+        yield {"type": "content", "content": "到了"}
+    frames = _frames(SSERelay(slow(), heartbeat_interval=0.1))
+    assert frames[:2] == [": keep-alive\n\n"] * 2
+    assert _events(frames) == [{"type": "content", "content": "到了"}]
+
+def test_close_stops_reading_upstream():
+    closed = threading.Event()
+
+    def source():
+        try:
+            for _ in range(100):
+                time.sleep(0.01)
+                yield {"type": "content", "content": "x"}
+        finally:
+            closed.set()
+    frames = iter(SSERelay(source(), heartbeat_interval=None))
+    next(frames)
+    frames.close()
+    # 后台线程读到下一个事件后退出并关闭上游
+    assert closed.wait(1)
+
+def test_close_cancels_unfinished_upstream():
+    cancel = CancelToken()
+    relay = SSERelay(_source(["x"] * 100, delay=0.01), cancel=cancel, heartbeat_interval=None)
+    frames = iter(relay)
+    next(frames)
+    frames.close()
+    assert cancel.cancelled
+    # 上游正常结束后关闭不会取消
+    cancel = CancelToken()
+    list(SSERelay(_source(["x"]), cancel=cancel))
+    assert not cancel.cancelled
@@ -0,0 +1,157 @@
+import threading
+import time
+import pytest
+from ai_palette import AIChat, RequestScheduler, RequestShed, Lane
+from ai_palette.mock_server import MockProviderServer, MockConfig
+
+def run_queued(scheduler, requests):
+    """占满唯一的名额后让 requests 排队，逐个放行并返回获得名额的顺序"""
+    holder = scheduler.acquire("batch")
+    order = []
+    lock = threading.Lock()
+
+    def worker(lane, tenant, name):
+        ticket = scheduler.acquire(lane, tenant)
+        with lock:
+            order.append(name)
+        scheduler.release(ticket)
+
+    threads = []
+    for lane, tenant, name in requests:
+        thread = threading.Thread(target=worker, args=(lane, tenant, name))
+        thread.start()
+        threads.append(thread)
+        # 保证按顺序入队
+        while scheduler.queued() < len(threads):
+            time.sleep(0.001)
+    scheduler.release(holder)
+    for thread in threads:
+        thread.join()
+    return order
+
+def test_weighted_lanes():
+    scheduler = RequestScheduler(max_concurrency=1, lanes={"interactive": Lane(weight=3), "batch": Lane(weight=1)})
+    requests = [("batch", None, f"b{i}") for i in range(4)] + [("interactive", None, f"i{i}") for i in range(4)]
+    order = run_queued(scheduler, requests)
+    # 交互请求后入队，但按 3:1 的权重插队
+    assert order == ["b0", "i0", "i1", "i2", "b1", "i3", "b2", "b3"]
+
+def test_tenant_fairness():
+    scheduler = RequestScheduler(max_concurrency=1)
+    requests = [("batch", "a", f"a{i}") for i in range(3)] + [("batch", "b", "b0")]
+    order = run_queued(scheduler, requests)
+    assert order == ["a0", "b0", "a1", "a2"]
+
+def test_deadline_shedding():
+    scheduler = RequestScheduler(max_concurrency=1)
+    holder = scheduler.acquire()
+    start = time.perf_counter()
+    with pytest.raises(RequestShed):
+        scheduler.acquire("interactive", max_wait=0.05)
+    assert time.perf_counter() - start < 0.5
+    assert scheduler.shed_count == 1 and scheduler.queued() == 0
+    scheduler.release(holder)
+    scheduler.release(scheduler.acquire())
+    with pytest.raises(ValueError):
+        scheduler.acquire("unknown")
+
+def test_chat_uses_scheduler():
+    with MockProviderServer(MockConfig(latency=0.2)) as server:
+        scheduler = RequestScheduler(max_concurrency=1, lanes={"interactive": Lane(max_wait=0.05)})
+        chat = AIChat(**server.chat_kwargs("openai"), scheduler=scheduler)
+        blocker = threading.Thread(target=chat.ask, args=("你好",))
+        blocker.start()
+        while scheduler.in_flight == 0:
+            time.sleep(0.005)
+        with pytest.raises(RequestShed):
+            chat.ask("你好")
+        blocker.join()
+        assert scheduler.in_flight == 0
+        assert server.chat_count == 1
+
+def test_interrupted_wait_leaves_queue():
+    scheduler = RequestScheduler(max_concurrency=1)
+    holder = scheduler.acquire()
+
+    def interrupt(timeout=None):
+        raise KeyboardInterrupt
+    scheduler._cond.wait = interrupt
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.acquire()
+    assert scheduler.queued() == 0 and scheduler.shed_count == 0
+
+    # 等待期间已经分到名额后被中断，名额随即归还
+    def release_then_interrupt(timeout=None):
+        scheduler.release(holder)
+        raise KeyboardInterrupt
+    scheduler._cond.wait = release_then_interrupt
+    with pytest.raises(KeyboardInterrupt):
+        scheduler.acquire()
+    assert scheduler.in_flight == 0 and scheduler.queued() == 0
+    del scheduler._cond.wait
+    scheduler.release(scheduler.acquire())
+
+def test_shed_stream_returns_503(monkeypatch):
+    from ai_palette import app as server_app
+    with MockProviderServer() as server:
+        scheduler = RequestScheduler(max_concurrency=1, lanes={"interactive": Lane(max_wait=0.05)})
+        chat = AIChat(**server.chat_kwargs("openai"), scheduler=scheduler)
+        monkeypatch.setattr(server_app, "_get_client", lambda **params: chat)
+        client = server_app.app.test_client()
+        body = {"model_type": "openai", "api_key": "mock-key", "model": "mock-openai",
+                "prompt": "你好", "enable_streaming": True}
+        holder = scheduler.acquire()
+        for shared in (False, True):
+            response = client.post("/api/chat", json=dict(body, share_stream=shared))
+            assert response.status_code == 503 and not response.get_json()["success"]
+        scheduler.release(holder)
+        response = client.post("/api/chat", json=body)
+        assert response.status_code == 200 and "data: " in response.get_data(as_text=True)
+        assert scheduler.in_flight == 0 and server.chat_count == 1
+        # 响应没有被读取就关闭时归还提前取得的名额
+        with server_app.app.test_request_context("/api/chat", method="POST", json=body):
+            response = server_app.chat()
+        assert scheduler.in_flight == 1
+        response.close()
+        assert scheduler.in_flight == 0 and server.chat_count == 1
+
+def test_stream_headers_sent_before_first_chunk(monkeypatch):
+    from ai_palette import app as server_app
+    with MockProviderServer(MockConfig(latency=0.5)) as server:
+        monkeypatch.setenv("OPENAI_API_URL", server.url_for("openai"))
+        body = {"model_type": "openai", "api_key": "mock-key", "model": "mock-openai",
+                "prompt": "你好", "enable_streaming": True}
+        start = time.perf_counter()
+        with server_app.app.test_request_context("/api/chat", method="POST", json=body):
+            response = server_app.chat()
+        # 视图不等待第一个片段，SSE 响应头和保活注释可以立即发出
+        assert response.status_code == 200 and time.perf_counter() - start < 0.3
+        assert "data: " in "".join(response.response)
+        response.close()
+
+def test_shed_pipeline_endpoints_return_503(monkeypatch):
+    """推理链、流水线和对比接口的请求被调度器丢弃时同样返回 503"""
+    import ai_palette
+    from ai_palette import app as server_app
+    with MockProviderServer() as server:
+        scheduler = RequestScheduler(max_concurrency=1, lanes={"interactive": Lane(max_wait=0.05)})
+        monkeypatch.setenv("AI_PALETTE_SCHEDULER", "1")
+        monkeypatch.setattr(ai_palette, "get_scheduler", lambda: scheduler)
+        monkeypatch.setenv("OPENAI_API_URL", server.url_for("openai"))
+        config = {"modelType": "openai", "apiKey": "mock-key", "model": "mock-openai"}
+        client = server_app.app.test_client()
+        requests = [
+            ("/api/chain_chat", {"query": "问题", "thinkingConfig": config, "resultConfig": config,
+                                 "thinkingPrompt": "[$query$]", "resultPrompt": "[$thought$]"}),
+            ("/api/pipeline", {"stages": [dict(config, name="answer", template="[$query$]")],
+                               "inputs": {"query": "问题"}}),
+            ("/api/compare", {"prompt": "问题", "targets": [config, config]}),
+        ]
+        holder = scheduler.acquire()
+        for path, body in requests:
+            response = client.post(path, json=body)
+            assert response.status_code == 503 and not response.get_json()["success"], path
+        scheduler.release(holder)
+        for path, body in requests:
+            assert client.post(path, json=body).status_code == 200, path
+        assert scheduler.in_flight == 0 and server.chat_count == 5
@@ -0,0 +1,65 @@
+import pytest
+from ai_palette import Message, SessionStore
+from ai_palette.mock_server import MockProviderServer, DEFAULT_RESPONSE
+
+def test_session_store_lru_and_persistence(tmp_path):
+    store = SessionStore(max_sessions=2, persist_dir=str(tmp_path))
+    store.append("a", Message(role="user", content="问题"), Message(role="assistant", content="回答"))
+    store.replace("b", [Message(role="user", content="b")])
+    store.append("c", Message(role="user", content="c"))
+    assert len(store) == 2
+    # 被淘汰的会话从磁盘恢复
+    assert [m.content for m in store.get("a")] == ["问题", "回答"]
+    assert [m.content for m in SessionStore(persist_dir=str(tmp_path)).get("b")] == ["b"]
+    store.delete("a")
+    assert store.get("a") is None
+    with pytest.raises(ValueError):
+        store.get("../etc/passwd")
+
+def test_session_store_memory_only():
+    store = SessionStore()
+    assert store.get("missing") is None
+    store.append("s", Message(role="user", content="x"))
+    assert "s" in store
+
+def test_chat_with_session(monkeypatch):
+    """第二轮只上传新消息，服务端使用保存的历史"""
+    from ai_palette import app as server_app
+    monkeypatch.setattr(server_app, "sessions", SessionStore())
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        monkeypatch.setenv("DEEPSEEK_API_URL", server.url_for("deepseek"))
+        body = {"model_type": "deepseek", "api_key": "k", "model": "m", "session_id": "s1"}
+        first = client.post("/api/chat", json=dict(body, prompt="第一问", history_length=0))
+        assert first.json["response"] == DEFAULT_RESPONSE
+
+        second = client.post("/api/chat", json=dict(body, prompt="第二问", history_length=2))
+        assert second.status_code == 200
+        sent = server.requests[-1]["body"]["messages"]
+        assert [m["content"] for m in sent] == ["第一问", DEFAULT_RESPONSE, "第二问"]
+
+        # 历史条数不一致时要求客户端重新上传 context
+        stale = client.post("/api/chat", json=dict(body, prompt="第三问", history_length=1))
+        assert stale.status_code == 409 and stale.json["resend_context"]
+        resync = client.post("/api/chat", json=dict(body, prompt="第三问", context=[{"role": "user", "content": "新"}]))
+        assert resync.status_code == 200
+        assert [m["content"] for m in server.requests[-1]["body"]["messages"]] == ["新", "第三问"]
+
+        assert client.delete("/api/sessions/s1").json["success"]
+        assert server_app.sessions.get("s1") is None
+
+@pytest.mark.parametrize("fields", [
+    {"session_id": 42}, {"session_id": "../etc/passwd"}, {"session_id": "s1", "history_length": "two"},
+    {"session_id": "s1", "history_length": -1}, {"session_id": "s1", "history_length": 1.5},
+    {"session_id": "s1", "history_length": True}, {"session_id": "s1", "history_length": [0]}
+])
+def test_malformed_session_fields_return_400(monkeypatch, fields):
+    from ai_palette import app as server_app
+    monkeypatch.setattr(server_app, "sessions", SessionStore())
+    client = server_app.app.test_client()
+    body = dict({"model_type": "deepseek", "api_key": "k", "model": "m", "prompt": "你好"}, **fields)
+    for endpoint in ("/api/chat", "/api/chain_chat"):
+        response = client.post(endpoint, json=body)
+        assert response.status_code == 400 and not response.json["success"]
+    # GET 请求的参数是字符串
+    assert client.get("/api/chat", query_string={"session_id": "s1", "history_length": "x"}).status_code == 400
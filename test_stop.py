@@ -0,0 +1,55 @@
+import time
+import pytest
+from ai_palette import AIChat, StopCondition
+from ai_palette.mock_server import MockProviderServer, MockConfig, DEFAULT_RESPONSE
+
+def _run(condition, pieces):
+    meta = {}
+    chunks = [{"type": "content", "content": piece} for piece in pieces]
+    output = [chunk["content"] for chunk in condition.apply(iter(chunks), meta)]
+    return output, meta.get("finish_reason")
+
+def test_stop_string_split_across_chunks_is_held_back():
+    output, reason = _run(StopCondition(stop="<END>"), ["ab", "c<", "EN", "D>rest"])
+    assert output == ["ab", "c"] and reason == "stop"
+    # 不是停止字符串时暂缓的内容随后输出，上游结束时输出剩余内容
+    output, reason = _run(StopCondition(stop=["<END>", "##"]), ["a<", "b#", "c", "x<E"])
+    assert "".join(output) == "a<b#cx<E" and reason is None
+    # 推理内容不受停止条件影响
+    chunks = [{"type": "reasoning", "content": "<END>"}, {"type": "content", "content": "ok<END>"}]
+    assert list(StopCondition(stop="<END>").apply(iter(chunks))) == [chunks[0], {"type": "content", "content": "ok"}]
+
+def test_pattern_max_chars_and_predicate():
+    assert _run(StopCondition(pattern=r"答案：\d+。"), ["答案：4", "2。解释", "……"]) == (["答案：4", "2。"], "stop")
+    assert _run(StopCondition(max_chars=5), ["abc", "defg"]) == (["abc", "de"], "length")
+    assert _run(StopCondition(predicate=lambda text: text.count("。") >= 2), ["一。", "二。三", "。"]) == (["一。", "二。三"], "stop")
+    with pytest.raises(ValueError):
+        StopCondition(stop=["ok", ""])
+
+def test_stop_closes_upstream_early():
+    with MockProviderServer(MockConfig(token_rate=20, chunk_size=1)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"))
+        start = time.perf_counter()
+        stream = chat.ask("你好", stream=True, stop="的回答")
+        assert "".join(chunk["content"] for chunk in stream) == "这是来自模拟服务"
+        assert time.perf_counter() - start < len(DEFAULT_RESPONSE) / 20 / 2
+        assert stream.result == "这是来自模拟服务" and stream.result.finish_reason == "stop"
+        result = chat.ask("你好", stop=StopCondition(max_chars=4))
+        assert result == "这是来自" and result.finish_reason == "length"
+
+def test_chat_endpoint_validates_stop(monkeypatch):
+    """stop 和 max_chars 格式错误时返回 400"""
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        monkeypatch.setattr(server_app, "_get_client", lambda **params: AIChat(**server.chat_kwargs("openai")))
+        body = {"model_type": "openai", "api_key": "mock-key", "model": "mock-openai", "prompt": "你好"}
+        for bad in ({"max_chars": "abc"}, {"max_chars": 0}, {"max_chars": -3}, {"max_chars": 1.5},
+                    {"max_chars": True}, {"stop": [""]}, {"stop": [1]}, {"stop": {"a": 1}}):
+            response = client.post("/api/chat", json=dict(body, **bad))
+            assert response.status_code == 400 and not response.get_json()["success"], bad
+        assert server.chat_count == 0
+        data = client.post("/api/chat", json=dict(body, max_chars="4")).get_json()
+        assert data["response"] == "这是来自"
+        response = client.get("/api/chat", query_string=dict(body, stop="的回答"))
+        assert response.get_json()["response"] == "这是来自模拟服务"
@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from ai_palette import AIChat, Timeouts, ChatTimeout, FirstTokenTimeout, IdleTimeout, TotalTimeout
+from ai_palette.mock_server import MockProviderServer, MockConfig
+
+def test_integer_timeout_compatible():
+    timeouts = Timeouts.from_value(30)
+    assert (timeouts.connect, timeouts.read) == (30, 30)
+    assert not timeouts.watched
+    with pytest.raises(ValueError):
+        Timeouts(idle=0)
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_timeouts_before_first_chunk_are_retried(stream):
+    """流式和普通请求在收到内容之前超时都按 retry_count 重试"""
+    with MockProviderServer(MockConfig(latency=1.0)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), timeout=Timeouts(first_token=0.2), retry_count=1)
+        retries = []
+        chat.add_hook(lambda event: retries.append(event.data["attempt"]) if event.name == "retry" else None)
+        with pytest.raises(FirstTokenTimeout):
+            result = chat.ask("你好", stream=stream)
+            if stream:
+                list(result)
+        assert server.chat_count == 2
+        assert retries == [1]
+
+def test_stream_not_retried_after_first_chunk():
+    """已经输出内容的流式请求失败时不重试，避免调用方收到重复内容"""
+    with MockProviderServer(MockConfig(token_rate=2, chunk_size=1)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), timeout=Timeouts(idle=0.2), retry_count=3)
+        with pytest.raises(IdleTimeout):
+            list(chat.ask("你好", stream=True))
+        assert server.chat_count == 1
+        # 总耗时超时不重试
+        chat = AIChat(**server.chat_kwargs("openai"), timeout=Timeouts(total=0.2), retry_count=3)
+        with pytest.raises(TotalTimeout):
+            list(chat.ask("你好", stream=True))
+        assert server.chat_count == 2
+
+def test_first_token_timeout():
+    with MockProviderServer(MockConfig(latency=1.0)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), timeout=Timeouts(first_token=0.3), retry_count=0)
+        start = time.perf_counter()
+        with pytest.raises(FirstTokenTimeout):
+            list(chat.ask("你好", stream=True))
+        assert time.perf_counter() - start < 0.8
+
+def test_idle_timeout_aborts_stalled_stream():
+    with MockProviderServer(MockConfig(token_rate=2, chunk_size=1)) as server:
+        chat = AIChat(**server.chat_kwargs("openai"), timeout=Timeouts(idle=0.2))
+        stream = chat.ask("你好", stream=True)
+        start = time.perf_counter()
+        with pytest.raises(IdleTimeout) as info:
+            for _ in stream:
+                pass
+        assert info.value.phase == "idle"
+        assert time.perf_counter() - start < 0.8
+
+def test_slow_consumer_is_not_idle():
+    """调用方处理片段的时间不计入片段间隔"""
+    with MockProviderServer() as server:
+        chat = AIChat(**server.chat_kwargs("openai"), timeout=Timeouts(idle=0.2))
+        stream = chat.ask("你好", stream=True)
+        for _ in range(2):
+            next(stream)
+            time.sleep(0.3)
+        list(stream)
+        assert stream.result
+
+def test_total_timeout():
+    with MockProviderServer(MockConfig(token_rate=10, chunk_size=1)) as server:
+        chat = AIChat(**server.chat_kwargs("deepseek"), timeout=Timeouts(idle=5, total=0.5))
+        start = time.perf_counter()
+        with pytest.raises(TotalTimeout) as info:
+            list(chat.ask("你好", stream=True))
+        assert isinstance(info.value, ChatTimeout)
+        assert time.perf_counter() - start < 1.0
+
+class _TricklingHandler(BaseHTTPRequestHandler):
+    """先返回响应头，再每 0.1 秒写出一个字节的响应体"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"choices": [{"message": {"content": "你好"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for i in range(len(body)):
+            self.wfile.write(body[i:i + 1])
+            self.wfile.flush()
+            time.sleep(0.1)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.mark.parametrize("timeouts,error", [
+    (Timeouts(read=1, total=0.5), TotalTimeout),
+    (Timeouts(read=1, first_token=0.5), FirstTokenTimeout),
+])
+def test_trickling_body_bounded(monkeypatch, timeouts, error):
+    """普通请求的响应体持续缓慢到达时，单次读取不会超时，但整体耗时受 total 和 first_token 限制"""
+    server = HTTPServer(("127.0.0.1", 0), _TricklingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setenv("OPENAI_API_URL", "http://127.0.0.1:%d/v1/chat/completions" % server.server_port)
+        chat = AIChat(provider="openai", model="gpt-4o", api_key="test", timeout=timeouts, retry_count=0)
+        start = time.perf_counter()
+        with pytest.raises(error):
+            chat.ask("你好")
+        assert time.perf_counter() - start < 1.5
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_chat_endpoint_parses_timeout(monkeypatch):
+    from ai_palette import app as server_app
+    client = server_app.app.test_client()
+    with MockProviderServer() as server:
+        monkeypatch.setenv("OPENAI_API_URL", server.url_for("openai"))
+        query = {"model_type": "openai", "api_key": "k", "model": "m", "prompt": "你好"}
+        # GET 参数是字符串
+        assert client.get("/api/chat", query_string=dict(query, timeout="5")).json["success"]
+        for bad in ("abc", "0", "-1", "inf"):
+            response = client.get("/api/chat", query_string=dict(query, timeout=bad))
+            assert response.status_code == 400 and "timeout" in response.json["error"]
+        assert client.post("/api/chat", json=dict(query, timeout=2.5)).json["success"]
+        for bad in ("abc", -1, True, [5]):
+            assert client.post("/api/chat", json=dict(query, timeout=bad)).status_code == 400
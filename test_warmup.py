@@ -0,0 +1,49 @@
+import socket
+import pytest
+from ai_palette import AIChat, warmup, enable_dns_cache, disable_dns_cache
+from ai_palette.mock_server import MockProviderServer, DEFAULT_RESPONSE
+
+def test_ernie_token_is_cached():
+    with MockProviderServer() as server:
+        chat = AIChat(**server.chat_kwargs("ernie"))
+        chat.warmup()
+        assert chat.ask("你好") == DEFAULT_RESPONSE
+        assert AIChat(**server.chat_kwargs("ernie")).ask("你好") == DEFAULT_RESPONSE
+        token_requests = [r for r in server.requests if r["path"].startswith("/oauth/2.0/token")]
+        assert len(token_requests) == 1
+
+def test_first_request_reuses_warm_connection():
+    with MockProviderServer() as server:
+        chat = AIChat(**server.chat_kwargs("deepseek"))
+        events = []
+        chat.add_hook(lambda event: events.append(event) if event.name == "connection_acquired" else None)
+        assert warmup(chat, server.url_for("openai")) == {"deepseek:mock-deepseek": True,
+                                                          server.url_for("openai"): True}
+        chat.ask("你好")
+        assert events[0].data["reused"] is True
+
+def test_warmup_failure_is_reported():
+    assert warmup("http://127.0.0.1:1/v1/chat/completions", timeout=1) == {
+        "http://127.0.0.1:1/v1/chat/completions": False}
+
+def test_dns_cache():
+    calls = []
+    original = socket.getaddrinfo
+
+    def counting(*args):
+        calls.append(args)
+        return original(*args)
+
+    socket.getaddrinfo = counting
+    try:
+        enable_dns_cache(ttl=60)
+        socket.getaddrinfo("localhost", 80)
+        socket.getaddrinfo("localhost", 80)
+        assert len(calls) == 1
+        disable_dns_cache()
+        assert socket.getaddrinfo is counting
+        with pytest.raises(ValueError):
+            enable_dns_cache(ttl=0)
+    finally:
+        disable_dns_cache()
+        socket.getaddrinfo = original